@@ -0,0 +1,45 @@
+from .planner import field_value
+
+
+# Compteurs additionnés par les agrégations
+SUM_FIELDS = ("effectif_cumu_1_inj", "effectif_cumu_termine", "population_carto")
+
+
+def aggregate(records, group_by, metrics=SUM_FIELDS):
+    """ Additionne les compteurs des entrées par groupe de valeurs des champs `group_by`
+
+        Retourne une ligne par groupe avec le nombre d'entrées et les sommes; les
+        taux sont recalculés à partir des sommes.
+    """
+    groups = {}
+    for record in records:
+        key = tuple(record["fields"].get(field) for field in group_by)
+        totals = groups.get(key)
+        if totals is None:
+            totals = groups[key] = dict.fromkeys(metrics, 0.0)
+            totals["nombre_entrees"] = 0
+        totals["nombre_entrees"] += 1
+        for metric in metrics:
+            value = field_value(record, metric)
+            if value is not None:
+                totals[metric] += value
+    rows = []
+    for key, totals in groups.items():
+        row = dict(zip(group_by, key))
+        row.update(totals)
+        row.update(rates(totals))
+        rows.append(row)
+    return rows
+
+
+def rates(totals):
+    """ Taux de couverture recalculés à partir des sommes d'un groupe """
+    population = totals.get("population_carto")
+    if not population:
+        return {}
+    computed = {}
+    if "effectif_cumu_1_inj" in totals:
+        computed["taux_cumu_1_inj"] = totals["effectif_cumu_1_inj"] / population
+    if "effectif_cumu_termine" in totals:
+        computed["taux_cumu_termine"] = totals["effectif_cumu_termine"] / population
+    return computed
@@ -0,0 +1,122 @@
+import datetime
+import threading
+import time
+from bisect import bisect_right
+
+
+def parse_timestamp(value):
+    """ Convertit une date ISO 8601 (ou un nombre de secondes epoch) en secondes epoch, None si invalide """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def format_timestamp(seconds):
+    return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc).isoformat()
+
+
+class ChangeLog:
+    """ Journal des modifications du dataset, trié par date de modification
+
+        Chaque écriture ajoute une entrée (recordid, opération); une suppression
+        laisse une pierre tombale. Seule la dernière entrée d'un recordid est
+        renvoyée, les précédentes sont ignorées puis compactées.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.times = []         # dates de modification (secondes epoch), croissantes
+        self.seqs = []          # numéros de séquence, croissants
+        self.entries = []       # (recordid, "upsert" ou "delete")
+        self.latest = {}        # recordid -> numéro de séquence de sa dernière entrée
+        self.seq = 0
+        self.store = None
+        self.started = time.time()  # début du journal: pierres tombales connues depuis cette date
+
+    def attach(self, store):
+        self.store = store
+        store.subscribe(self.on_change)
+
+    def on_change(self, event, record, old_fields):
+        if event == "load":
+            self.seed(self.store.iter_values(), reset=True)
+            return
+        if event == "add_many":
+            self.append_many([added["recordid"] for added in record], "upsert")
+            return
+        self.append(record["recordid"], "delete" if event == "delete" else "upsert")
+
+    def seed(self, records, reset=False):
+        """ Indexe les entrées chargées au démarrage suivant leur record_timestamp
+
+            Avec `reset`, le journal est remplacé d'un bloc par ces seules entrées.
+        """
+        started = time.time() if reset else self.started
+        dated = []
+        for record in records:
+            modified = parse_timestamp(record.get("record_timestamp"))
+            dated.append((modified if modified is not None else started, record["recordid"]))
+        dated.sort(key=lambda item: item[0])
+        with self.lock:
+            if reset:
+                self.times, self.seqs, self.entries = [], [], []
+                self.latest = {}
+                self.started = started
+            for modified, recordid in dated:
+                self._append(recordid, "upsert", min(modified, self.started))
+
+    def append(self, recordid, op):
+        self.append_many([recordid], op)
+
+    def append_many(self, recordids, op):
+        """ Ajoute une entrée par recordid, toutes à la même date de modification """
+        with self.lock:
+            now = time.time()
+            if self.times and now < self.times[-1]:
+                now = self.times[-1]    # l'horloge peut reculer, le journal reste trié
+            for recordid in recordids:
+                self._append(recordid, op, now)
+
+    def since(self, since, after=None, limit=1000):
+        """ Dernières modifications postérieures à `since` (secondes epoch)
+
+            `after` est le numéro de séquence de la dernière entrée de la page
+            précédente. Retourne (entrées, curseur de la page suivante ou None).
+        """
+        with self.lock:
+            start = bisect_right(self.times, since)
+            if after is not None:
+                start = max(start, bisect_right(self.seqs, after))
+            page = []
+            position = start
+            while position < len(self.seqs) and len(page) < limit:
+                seq = self.seqs[position]
+                recordid, op = self.entries[position]
+                if self.latest.get(recordid) == seq:
+                    page.append((seq, self.times[position], recordid, op))
+                position += 1
+            more = page and position < len(self.seqs)
+            return page, (page[-1][0] if more else None)
+
+    def _append(self, recordid, op, modified):
+        self.seq += 1
+        self.times.append(modified)
+        self.seqs.append(self.seq)
+        self.entries.append((recordid, op))
+        self.latest[recordid] = self.seq
+        if len(self.seqs) > 1024 and len(self.seqs) > 2 * len(self.latest):
+            self._compact()
+
+    def _compact(self):
+        kept = [i for i, seq in enumerate(self.seqs) if self.latest.get(self.entries[i][0]) == seq]
+        self.times = [self.times[i] for i in kept]
+        self.seqs = [self.seqs[i] for i in kept]
+        self.entries = [self.entries[i] for i in kept]
+
+
+change_log = ChangeLog()
@@ -0,0 +1,46 @@
+from itertools import islice
+from .store import FIELDS, NUMERIC_FIELDS
+
+
+# Colonnes de la représentation en colonnes d'une entrée
+COLUMNS = ("recordid", "record_timestamp") + FIELDS
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_columns(records):
+    """ Transforme une liste d'entrées en colonnes (nom -> liste de valeurs)
+
+        Les champs numériques sont convertis en float (None si absents ou invalides).
+    """
+    columns = {
+        "recordid": [record.get("recordid") for record in records],
+        "record_timestamp": [record.get("record_timestamp") for record in records],
+    }
+    for field in FIELDS:
+        values = [record["fields"].get(field) for record in records]
+        if field in NUMERIC_FIELDS:
+            values = [_number(value) for value in values]
+        columns[field] = values
+    return columns
+
+
+def iter_batches(records, batch_size=65536):
+    """ Parcourt les entrées (liste ou itérateur) par listes d'au plus `batch_size` entrées """
+    records = iter(records)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_column_batches(records, batch_size=65536):
+    """ Parcourt les entrées (liste ou itérateur) par lots, chaque lot étant converti en colonnes """
+    for batch in iter_batches(records, batch_size):
+        yield to_columns(batch)
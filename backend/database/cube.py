@@ -0,0 +1,144 @@
+import threading
+from .store import week_key, departement_of
+from .planner import field_value
+from .aggregate import SUM_FIELDS, rates
+from .geo import REGIONS, region_by_departement
+
+
+# Niveaux géographiques du cube
+LEVELS = ("commune", "departement", "region", "national")
+# Classe d'age des cumuls toutes classes confondues
+ALL_AGES = "*"
+# Classe d'age déjà agrégée dans le dataset, exclue du cumul toutes classes pour ne pas la compter deux fois
+TOUT_AGE = "TOUT_AGE"
+
+
+class Cube:
+    """ Agrégats commune × semaine × classe d'age, maintenus à chaque écriture
+
+        Chaque cellule contient le nombre d'entrées et les sommes des compteurs;
+        les cumuls par département, région, national et toutes classes d'age sont
+        matérialisés de la même façon, si bien qu'une requête de cumul ne lit
+        jamais les entrées.
+    """
+
+    def __init__(self, metrics=SUM_FIELDS):
+        self.lock = threading.Lock()
+        self.metrics = metrics
+        self.cells = {}     # (niveau, code) -> semaine -> classe d'age -> [nombre d'entrées, sommes...]
+        self.regions = region_by_departement(REGIONS)
+        self.store = None
+
+    def configure(self, config):
+        """ Table région -> départements de la configuration; à appliquer avant le chargement """
+        self.regions = region_by_departement(config.get("REGIONS", REGIONS))
+
+    def attach(self, store):
+        self.store = store
+        store.subscribe(self.on_change)
+
+    def on_change(self, event, record, old_fields):
+        if event == "load":
+            self.rebuild(self.store.iter_values())
+        elif event == "add":
+            self._apply(record["fields"], 1)
+        elif event == "add_many":
+            # une semaine ingérée: ses cellules sont calculées à côté puis ajoutées sous un seul verrou
+            delta = {}
+            for added in record:
+                self._accumulate(delta, added["fields"], 1)
+            with self.lock:
+                self._merge(delta)
+        elif event == "delete":
+            self._apply(record["fields"], -1)
+        else:
+            self._apply(old_fields, -1)
+            self._apply(record["fields"], 1)
+
+    def rebuild(self, records):
+        """ Recalcule toutes les cellules à côté, puis les remplace d'un bloc """
+        cells = {}
+        for record in records:
+            self._accumulate(cells, record["fields"], 1)
+        with self.lock:
+            self.cells = cells
+
+    def slice(self, level, code=None, start=None, end=None, classe_age=None):
+        """ Cellules d'un niveau géographique entre deux semaines AAAASS (incluses)
+
+            Retourne des lignes triées par semaine, avec les sommes et les taux
+            recalculés; `classe_age` vaut une classe, ALL_AGES, ou None pour toutes.
+        """
+        rows = []
+        with self.lock:
+            weeks = self.cells.get((level, code if level != "national" else None), {})
+            for semaine in sorted(weeks, key=week_key):
+                key = week_key(semaine)
+                if (start is not None and key < start) or (end is not None and key > end):
+                    continue
+                for age, cell in weeks[semaine].items():
+                    if classe_age is not None and age != classe_age:
+                        continue
+                    rows.append(self._row(semaine, age, cell))
+        return rows
+
+    def cell(self, level, code, semaine, classe_age=ALL_AGES):
+        """ Ligne d'une seule cellule, None si elle est vide """
+        with self.lock:
+            cell = self.cells.get((level, code), {}).get(semaine, {}).get(classe_age)
+            return None if cell is None else self._row(semaine, classe_age, cell)
+
+    def _row(self, semaine, classe_age, cell):
+        row = {"semaine_injection": semaine, "classe_age": classe_age, "nombre_entrees": cell[0]}
+        row.update(zip(self.metrics, cell[1:]))
+        row.update(rates(row))
+        return row
+
+    def _apply(self, fields, sign):
+        with self.lock:
+            self._accumulate(self.cells, fields, sign)
+
+    def _merge(self, delta):
+        """ Ajoute des cellules calculées à côté (nombres d'entrées positifs) aux cellules du cube """
+        for place, weeks in delta.items():
+            target = self.cells.setdefault(place, {})
+            for semaine, ages in weeks.items():
+                cells = target.setdefault(semaine, {})
+                for age, cell in ages.items():
+                    current = cells.get(age)
+                    if current is None:
+                        cells[age] = cell
+                    else:
+                        for position, value in enumerate(cell):
+                            current[position] += value
+
+    def _accumulate(self, cells, fields, sign):
+        commune = fields.get("commune_residence")
+        semaine = fields.get("semaine_injection")
+        if commune is None or week_key(semaine) is None:
+            return
+        record = {"fields": fields}
+        values = [field_value(record, metric) or 0.0 for metric in self.metrics]
+        ages = [fields.get("classe_age")]
+        if ages[0] != TOUT_AGE:
+            ages.append(ALL_AGES)
+        departement = departement_of(commune)
+        places = [("commune", commune), ("departement", departement), ("national", None)]
+        if departement in self.regions:
+            places.append(("region", self.regions[departement]))
+        for place in places:
+            weeks = cells.setdefault(place, {})
+            for age in ages:
+                cell = weeks.setdefault(semaine, {}).setdefault(age, [0] + [0.0] * len(values))
+                cell[0] += sign
+                for position, value in enumerate(values, start=1):
+                    cell[position] += sign * value
+                if not cell[0]:
+                    del weeks[semaine][age]
+            if not weeks[semaine]:
+                del weeks[semaine]
+            if not weeks:
+                del cells[place]
+
+
+cube = Cube()
@@ -0,0 +1,62 @@
+import threading
+from collections import OrderedDict
+from .planner import field_value
+
+
+# Compteurs cumulés dont on calcule les variations hebdomadaires
+CUMULATIVE_FIELDS = ("effectif_cumu_1_inj", "effectif_cumu_termine")
+
+
+def deltas(records, metrics=CUMULATIVE_FIELDS):
+    """ Séries hebdomadaires des entrées d'une commune, par classe d'age
+
+        `records` doit être trié par semaine d'injection. Pour chaque compteur
+        cumulé, delta_<compteur> est l'augmentation depuis la semaine précédente
+        disponible et croissance_<compteur> cette augmentation rapportée au
+        cumul précédent.
+    """
+    by_age = {}
+    for record in records:
+        by_age.setdefault(record["fields"].get("classe_age"), []).append(record)
+    series = {}
+    for classe_age, rows in by_age.items():
+        points = [{"semaine_injection": row["fields"].get("semaine_injection")} for row in rows]
+        for metric in metrics:
+            values = [field_value(row, metric) for row in rows]
+            previous = [None] + values[:-1]
+            for point, value, before in zip(points, values, previous):
+                point[metric] = value
+                delta = value - before if value is not None and before is not None else None
+                point["delta_" + metric] = delta
+                point["croissance_" + metric] = delta / before if delta is not None and before else None
+        series[classe_age] = points
+    return series
+
+
+class DeltaCache:
+    """ Séries de variations par commune, recalculées quand la génération de la commune change
+
+        Un ajout de semaine ou une modification d'entrée n'invalide que la
+        commune concernée; les `size` communes les plus récentes sont conservées.
+    """
+
+    def __init__(self, store, size=4096):
+        self.lock = threading.Lock()
+        self.store = store
+        self.size = size
+        self.series = OrderedDict()     # commune -> (génération, séries par classe d'age)
+
+    def get(self, commune):
+        generation = self.store.generation("commune_residence", commune)
+        with self.lock:
+            cached = self.series.get(commune)
+            if cached is not None and cached[0] == generation:
+                self.series.move_to_end(commune)
+                return cached[1]
+        series = deltas(self.store.week_range(commune))
+        with self.lock:
+            self.series[commune] = (generation, series)
+            self.series.move_to_end(commune)
+            while len(self.series) > self.size:
+                self.series.popitem(last=False)
+        return series
@@ -0,0 +1,94 @@
+import json
+import multiprocessing
+import os
+import threading
+import requests
+from .schema import record_schema
+from .store import store, week_key
+
+
+SEARCH_URL = ("https://datavaccin-covid.ameli.fr/api/records/1.0/search/"
+              "?dataset=donnees-de-vaccination-par-commune&q=&rows={rows}&refine.semaine_injection={semaine}")
+
+# Un seul écrivain de la base json à la fois (ingestion, sauvegarde, compaction): chacun
+# écrit une version postérieure à celle du précédent, le dernier remplacement est le plus récent
+writer = threading.RLock()
+
+
+def fetch_week(semaine):
+    """ Entrées publiées par l'API amont pour une semaine d'injection "AAAA-SS" """
+    # nombre d'entrées de la semaine, puis l'ensemble des entrées
+    n = requests.get(SEARCH_URL.format(rows=10, semaine=semaine)).json().get("nhits")
+    return requests.get(SEARCH_URL.format(rows=n, semaine=semaine)).json().get("records") or []
+
+
+def write_dataset(path, records):
+    """ Réécrit la base de donnée json entrée par entrée; le fichier est remplacé une fois complet """
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        f.write("[")
+        for position, record in enumerate(records):
+            f.write(", " if position else "")
+            f.write(json.dumps(record, ensure_ascii=False))
+        f.write("]")
+    os.replace(temporary, path)
+
+
+def save_dataset(path):
+    write_dataset(path, store.iter_values())
+
+
+def save(path):
+    """ Réécrit la base json dans un processus séparé, une fois les autres écrivains terminés """
+    with writer:
+        in_worker(save_dataset, path)
+
+
+def fetch_records(semaine):
+    """ Télécharge une semaine, convertit ses entrées et écarte celles déjà présentes
+
+        Exécuté dans le processus d'ingestion: la lecture de la réponse, la
+        conversion et la recherche des recordid connus (dans la copie du
+        stockage héritée du fork) ne prennent pas le GIL du serveur. Retourne
+        (nouvelles entrées converties, nombre d'entrées rejetées).
+    """
+    rejected = []
+    records = [record for record in record_schema.coerce_all(fetch_week(semaine), rejected)
+               if store.get(record["recordid"], week=week_key(record["fields"].get("semaine_injection"))) is None]
+    return records, len(rejected)
+
+
+def in_worker(function, *args):
+    """ Exécute `function` dans un processus fils et retourne son résultat
+
+        Le fils est un fork du serveur: il partage sa mémoire en copie sur
+        écriture, sans verrou ni GIL communs. Le fork a lieu sous les verrous du
+        stockage: le fils hérite d'une version cohérente, et d'aucun verrou pris
+        par un autre thread. Sans fork (Windows), la fonction est exécutée sur place.
+    """
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return function(*args)
+    with store.lock, store.records.lock:
+        pool = multiprocessing.get_context("fork").Pool(1)
+    with pool:
+        return pool.apply(function, args)
+
+
+def refresh(path, semaine):
+    """ Ingère une semaine: téléchargée dans un processus séparé, ajoutée d'un bloc
+
+        Les nouvelles entrées passent par store.add_many (un recordid déjà
+        présent est ignoré): index, agrégats, journal des modifications et
+        événements sont mis à jour en une seule écriture, sans reconstruction,
+        et une lecture ne voit jamais la semaine à moitié ajoutée. Les semaines
+        sorties des plus récentes, ou réchauffées depuis par une écriture, sont
+        rangées à nouveau sur disque; la base json est ensuite réécrite dans un
+        processus séparé. Retourne (ajoutées, rejetées).
+    """
+    with writer:
+        records, rejected = in_worker(fetch_records, semaine)
+        added = len(store.add_many(records))
+        store.demote()
+        if added:
+            save(path)
+    return added, rejected
@@ -0,0 +1,122 @@
+import threading
+from bisect import bisect_left, bisect_right
+from .store import week_key
+
+
+class LatestIndex:
+    """ Historique trié par semaine de chaque couple (commune, classe d'age)
+
+        Les compteurs étant cumulés, l'entrée la plus récente d'un couple résume
+        toutes les précédentes: c'est le dernier élément de son historique, et
+        une lecture "à une date donnée" est une recherche dichotomique.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.history = {}   # (commune, classe d'age) -> (semaines AAAASS triées, recordid correspondants)
+        self.store = None
+
+    def attach(self, store):
+        self.store = store
+        store.subscribe(self.on_change)
+
+    def on_change(self, event, record, old_fields):
+        if event == "load":
+            self.rebuild(self.store.iter_values())
+        elif event == "add":
+            self._insert(record["fields"], record["recordid"])
+        elif event == "add_many":
+            self._insert_many(record)
+        elif event == "delete":
+            self._remove(record["fields"], record["recordid"])
+        elif any(old_fields.get(field) != record["fields"].get(field)
+                 for field in ("commune_residence", "classe_age", "semaine_injection")):
+            self._remove(old_fields, record["recordid"])
+            self._insert(record["fields"], record["recordid"])
+
+    def rebuild(self, records):
+        entries = {}
+        for record in records:
+            key, week = self._key(record["fields"])
+            if key is not None:
+                entries.setdefault(key, []).append((week, record["recordid"]))
+        history = {}
+        for key, items in entries.items():
+            items.sort(key=lambda item: item[0])
+            history[key] = ([week for week, _ in items], [recordid for _, recordid in items])
+        with self.lock:
+            self.history = history
+
+    def latest(self, commune, classe_age, as_of=None, date_reference=None):
+        """ Entrée la plus récente d'un couple, à la semaine AAAASS `as_of` incluse si donnée
+
+            Avec `date_reference`, ignore les entrées publiées après cette date.
+        """
+        with self.lock:
+            weeks, recordids = self.history.get((commune, classe_age), ([], []))
+            return self._pick(weeks, recordids, as_of, date_reference)
+
+    def snapshot(self, as_of=None, date_reference=None, classe_age=None, prefix=""):
+        """ Entrée la plus récente de chaque couple, triée par commune et classe d'age
+
+            `prefix` restreint aux communes dont le code commence par lui (un département).
+        """
+        records = []
+        with self.lock:
+            for (commune, age) in sorted(self.history, key=lambda key: (str(key[0]), str(key[1]))):
+                if (classe_age is not None and age != classe_age) or not str(commune).startswith(prefix):
+                    continue
+                weeks, recordids = self.history[(commune, age)]
+                record = self._pick(weeks, recordids, as_of, date_reference)
+                if record is not None:
+                    records.append(record)
+        return records
+
+    def _pick(self, weeks, recordids, as_of, date_reference):
+        position = len(weeks) if as_of is None else bisect_right(weeks, as_of)
+        while position > 0:
+            position -= 1
+            record = self.store.get(recordids[position], week=weeks[position])
+            if record is None:
+                continue
+            if date_reference is None or str(record["fields"].get("date_reference", "")) <= date_reference:
+                return record
+        return None
+
+    @staticmethod
+    def _key(fields):
+        week = week_key(fields.get("semaine_injection"))
+        if fields.get("commune_residence") is None or week is None:
+            return None, None
+        return (fields["commune_residence"], fields.get("classe_age")), week
+
+    def _insert(self, fields, recordid):
+        self._insert_many([{"recordid": recordid, "fields": fields}])
+
+    def _insert_many(self, records):
+        keys = [(self._key(record["fields"]), record["recordid"]) for record in records]
+        with self.lock:
+            for (key, week), recordid in keys:
+                if key is None:
+                    continue
+                weeks, recordids = self.history.setdefault(key, ([], []))
+                position = bisect_right(weeks, week)
+                weeks.insert(position, week)
+                recordids.insert(position, recordid)
+
+    def _remove(self, fields, recordid):
+        key, week = self._key(fields)
+        if key is None:
+            return
+        with self.lock:
+            weeks, recordids = self.history.get(key, ([], []))
+            lo, hi = bisect_left(weeks, week), bisect_right(weeks, week)
+            if recordid in recordids[lo:hi]:
+                position = lo + recordids[lo:hi].index(recordid)
+                del weeks[position]
+                del recordids[position]
+            if not weeks:
+                self.history.pop(key, None)
+
+
+latest_index = LatestIndex()
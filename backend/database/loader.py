@@ -0,0 +1,194 @@
+import codecs
+import json
+import math
+import os
+import threading
+import time
+from .schema import record_schema
+
+
+WHITESPACE = " \t\r\n"
+
+
+def iter_json_array(f, chunk_size=1024 * 1024, progress=None):
+    """ Éléments d'un tableau json lus dans un fichier binaire, morceau par morceau
+
+        Seul le morceau en cours de lecture est gardé en texte: le fichier
+        entier n'est jamais en mémoire. `progress` reçoit le nombre d'octets
+        lus après chaque morceau.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    state = {"eof": False}
+
+    def read():
+        chunk = f.read(chunk_size)
+        if progress is not None and chunk:
+            progress(len(chunk))
+        state["eof"] = not chunk
+        return utf8.decode(chunk, final=state["eof"])
+
+    def fill(buffer, position):
+        """ Saute les espaces et les virgules, relit un morceau si le tampon est épuisé """
+        while True:
+            while position < len(buffer) and (buffer[position] in WHITESPACE or buffer[position] == ","):
+                position += 1
+            if position < len(buffer):
+                return buffer, position
+            if state["eof"]:
+                raise ValueError("unexpected end of json array")
+            buffer, position = read(), 0
+
+    buffer, position = fill(read(), 0)
+    if buffer[position] != "[":
+        raise ValueError("expected a json array")
+    position += 1
+    while True:
+        buffer, position = fill(buffer, position)
+        if buffer[position] == "]":
+            return
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            end = None
+        # un élément coupé par la fin du morceau: on complète le tampon et on recommence
+        if end is None or (end == len(buffer) and not state["eof"]):
+            if state["eof"]:
+                raise ValueError("invalid json array")
+            buffer, position = buffer[position:] + read(), 0
+            continue
+        yield value
+        position = end
+
+
+def read_records(path, rejected=None, chunk_size=1024 * 1024, progress=None):
+    """ Entrées de la base json `path`, converties par le schéma; les invalides sont ajoutées à `rejected` """
+    with open(path, "rb") as f:
+        yield from record_schema.coerce_all(iter_json_array(f, chunk_size, progress), rejected)
+
+
+class DatasetLoader:
+    """ Chargement en flux de la base json dans le stockage
+
+        Les entrées sont lues une à une, converties par le schéma puis indexées:
+        ni le texte du fichier ni la liste des entrées ne sont gardés en mémoire.
+        L'avancement est affiché tous les 10 % et consultable par stats(); le
+        chargement passe par les phases "pending", "reading" (lecture et
+        indexation des entrées), "indexing" (index des abonnés du stockage),
+        puis "ready" ou "failed".
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.path = None
+        self.total_bytes = 0
+        self.bytes_read = 0
+        self.records = 0
+        self.rejected = 0
+        self.started = None
+        self.read = None        # fin de la lecture du fichier
+        self.finished = None
+        self.error = None
+        self.rejected_path = None   # fichier des entrées écartées
+        self.partial = False    # entrées servies pendant le chargement
+        self.reported = 0       # dernier palier de 10 % affiché
+
+    def stream(self, path, chunk_size=1024 * 1024):
+        """ Entrées converties du fichier, l'avancement étant tenu à jour """
+        with self.lock:
+            self.path = path
+            self.total_bytes = os.path.getsize(path)
+            self.bytes_read = self.records = self.rejected = self.reported = 0
+            self.started, self.read, self.finished, self.error = time.time(), None, None, None
+            self.rejected_path = None
+        rejected = []
+        for record in read_records(path, rejected, chunk_size, self._advance):
+            self.records += 1
+            self.rejected = len(rejected)
+            yield record
+        self.rejected = len(rejected)
+        self.read = time.time()
+        if rejected:
+            self._keep_rejected(path, rejected)
+
+    def load(self, store, path, batch_size=None):
+        """ Remplace le contenu du stockage par la base json `path`
+
+            Avec `batch_size`, les entrées déjà chargées sont servies pendant le
+            chargement (voir store.load).
+        """
+        self.partial = bool(batch_size)
+        try:
+            store.load(self.stream(path), batch_size)
+        except Exception as error:
+            self.error = repr(error)
+            raise
+        finally:
+            self.finished = time.time()
+        print(f'Loading: {self.records} records loaded in {self.finished - self.started:.1f}s')
+
+    @property
+    def phase(self):
+        if self.error is not None:
+            return "failed"
+        if self.finished is not None:
+            return "ready"
+        if self.read is not None:
+            return "indexing"
+        return "reading" if self.started is not None else "pending"
+
+    def serving(self):
+        """ Vrai si les routes de données peuvent répondre: chargement terminé, ou en cours et partiel """
+        return self.phase == "ready" or (self.partial and self.phase in ("reading", "indexing"))
+
+    def retry_after(self):
+        """ Délai estimé (en secondes) avant la fin du chargement, d'après l'avancement de la lecture """
+        with self.lock:
+            if self.started is None or not self.bytes_read or not self.total_bytes:
+                return 5
+            elapsed = time.time() - self.started
+            return max(1, math.ceil(elapsed * (self.total_bytes - self.bytes_read) / self.bytes_read))
+
+    def stats(self):
+        with self.lock:
+            end = self.finished if self.finished is not None else time.time()
+            return {
+                "phase": self.phase,
+                "path": self.path,
+                "bytes_read": self.bytes_read,
+                "total_bytes": self.total_bytes,
+                "progress": self.bytes_read / self.total_bytes if self.total_bytes else None,
+                "records": self.records,
+                "rejected": self.rejected,
+                "rejected_path": self.rejected_path,
+                "read_duration": self.read - self.started if self.read is not None else None,
+                "duration": end - self.started if self.started is not None else None,
+                "partial": self.partial,
+                "error": self.error,
+            }
+
+    def _keep_rejected(self, path, rejected):
+        """ Écrit les entrées écartées à côté de la base json: la prochaine réécriture ne les perd pas """
+        record, error = rejected[0]
+        self.rejected_path = f"{path}.rejected.json"
+        kept = []
+        if os.path.exists(self.rejected_path):
+            # entrées écartées par un chargement précédent, absentes depuis de la base json
+            with open(self.rejected_path) as f:
+                kept = json.load(f)
+        kept.extend(record for record, _ in rejected if record not in kept)
+        with open(self.rejected_path, "w") as f:
+            json.dump(kept, f, ensure_ascii=False)
+        print(f'Loading: {len(rejected)} invalid records skipped, kept in {self.rejected_path} '
+              f'(first: {record.get("recordid") if isinstance(record, dict) else record!r}: {error})')
+
+    def _advance(self, size):
+        with self.lock:
+            self.bytes_read += size
+            step = self.bytes_read * 10 // self.total_bytes if self.total_bytes else 10
+        if step > self.reported:
+            self.reported = step
+            print(f'Loading: {step * 10}% read, {self.records} records loaded')
+
+
+dataset_loader = DatasetLoader()
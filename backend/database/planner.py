@@ -0,0 +1,293 @@
+from .store import FIELDS, NUMERIC_FIELDS, INDEXED_FIELDS, week_key
+from .columnar import iter_batches
+from .schema import week
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Opérateurs acceptés dans les paramètres de requête (champ__operateur=valeur)
+OPERATORS = {
+    "eq": "=",
+    "in": "IN",
+    "gt": ">",
+    "gte": ">=",
+    "lt": "<",
+    "lte": "<=",
+}
+
+RANGE_OPERATORS = ("gt", "gte", "lt", "lte")
+
+# Paramètres de requête qui ne sont pas des prédicats
+RESERVED_PARAMS = ("explain",)
+
+# Entrées candidates évaluées ensemble par les prédicats résiduels
+RESIDUAL_BATCH_ROWS = 4096
+
+
+class Predicate:
+    """ Condition portant sur un champ d'une entrée """
+
+    def __init__(self, field, op, value):
+        self.field = field
+        self.op = op
+        self.value = value
+
+    def __str__(self):
+        if self.op == "in":
+            return f"{self.field} IN ({', '.join(str(v) for v in sorted(self.value))})"
+        return f"{self.field} {OPERATORS[self.op]} {self.value}"
+
+    def matcher(self):
+        """ Retourne une fonction testant la condition sur une entrée """
+        field, value = self.field, self.value
+        get = field_value
+        if field == "semaine_injection" and self.op in RANGE_OPERATORS:
+            # les semaines sont comparées sur leur clef entière AAAASS
+            value = week_key(value)
+            get = lambda record, field: week_key(record["fields"].get(field))
+        if self.op == "eq":
+            return lambda record: field_value(record, field) == value
+        if self.op == "in":
+            return lambda record: field_value(record, field) in value
+        compare = {
+            "gt": lambda a, b: a > b,
+            "gte": lambda a, b: a >= b,
+            "lt": lambda a, b: a < b,
+            "lte": lambda a, b: a <= b,
+        }[self.op]
+
+        def match(record):
+            current = get(record, field)
+            return current is not None and compare(current, value)
+        return match
+
+    def mask(self, records):
+        """ Évalue la condition sur un lot d'entrées d'un coup, retourne un tableau numpy de booléens
+
+            La colonne du champ est extraite une fois pour le lot; les nombres
+            et les semaines (clef AAAASS) sont des float, une valeur manquante
+            valant NaN, qui ne vérifie aucune condition.
+        """
+        field, op, value = self.field, self.op, self.value
+        if field == "semaine_injection" and op in RANGE_OPERATORS:
+            column = numpy.array([week_key(record["fields"].get(field)) for record in records], dtype=float)
+            value = week_key(value)
+        elif field in NUMERIC_FIELDS:
+            column = _numbers([record["fields"].get(field) for record in records])
+        else:
+            column = numpy.empty(len(records), dtype=object)
+            column[:] = [field_value(record, field) for record in records]
+        if op == "eq":
+            return column == value
+        if op == "in":
+            if column.dtype == object:
+                return numpy.frompyfunc(value.__contains__, 1, 1)(column).astype(bool)
+            return numpy.isin(column, list(value))
+        compare = {"gt": numpy.greater, "gte": numpy.greater_equal, "lt": numpy.less, "lte": numpy.less_equal}[op]
+        if column.dtype != object:
+            return compare(column, value)
+        result = numpy.zeros(len(records), dtype=bool)
+        present = numpy.flatnonzero(numpy.not_equal(column, None))
+        result[present] = compare(column[present], value).astype(bool)
+        return result
+
+
+class Plan:
+    """ Plan d'exécution: chemin d'accès choisi et prédicats restant à évaluer """
+
+    def __init__(self, access, index, predicates, estimated_rows, fetch, residual):
+        self.access = access                    # "index", "recordid", "week_range" ou "scan"
+        self.index = index                      # nom de l'index utilisé
+        self.predicates = predicates            # prédicats servis par l'index
+        self.estimated_rows = estimated_rows    # nombre d'entrées à parcourir
+        self.fetch = fetch                      # fonction retournant les entrées candidates
+        self.residual = residual                # prédicats évalués sur les candidates
+
+    def explain(self):
+        return {
+            "access": self.access,
+            "index": self.index,
+            "index_predicates": [str(predicate) for predicate in self.predicates],
+            "estimated_rows": self.estimated_rows,
+            "residual": [str(predicate) for predicate in self.residual],
+        }
+
+
+def field_value(record, field):
+    """ Valeur d'un champ d'une entrée, convertie en nombre pour les champs numériques """
+    if field == "recordid":
+        return record.get("recordid")
+    value = record["fields"].get(field)
+    if value is not None and field in NUMERIC_FIELDS:
+        return _number(value)
+    return value
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _numbers(values):
+    """ Colonne numpy de float d'un champ numérique, NaN pour les valeurs manquantes ou invalides """
+    try:
+        return numpy.array(values, dtype=float)
+    except (TypeError, ValueError):
+        return numpy.array([_number(value) for value in values], dtype=float)
+
+
+def _coerce(field, op, value):
+    if field == "semaine_injection" and op in RANGE_OPERATORS and week_key(value) is None:
+        raise ValueError(f"'{value}' is not a week (YYYY-WW) for field '{field}'")
+    if field == "semaine_injection" and op in ("eq", "in"):
+        # comparée telle qu'écrite dans le dataset: "2021-5" vaut "2021-05"
+        try:
+            return week(value)
+        except ValueError:
+            raise ValueError(f"'{value}' is not a week (YYYY-WW) for field '{field}'")
+    if field in NUMERIC_FIELDS:
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError(f"'{value}' is not a number for field '{field}'")
+    return value
+
+
+def parse_predicates(args, reserved=RESERVED_PARAMS):
+    """ Transforme les paramètres de requête (MultiDict) en liste de prédicats
+
+        `champ=valeur` est une égalité (plusieurs valeurs valent un IN),
+        `champ__in=a,b` une appartenance et `champ__gte=valeur` (gt, lt, lte)
+        une borne.
+    """
+    predicates = []
+    for key, values in args.lists():
+        if key in reserved:
+            continue
+        field, _, op = key.partition("__")
+        op = op or "eq"
+        if field != "recordid" and field not in FIELDS:
+            raise ValueError(f"unknown field '{field}'")
+        if op not in OPERATORS:
+            raise ValueError(f"unknown operator '{op}'")
+        if op == "in" or (op == "eq" and len(values) > 1):
+            items = [item for value in values for item in value.split(",")]
+            predicates.append(Predicate(field, "in", {_coerce(field, op, item) for item in items}))
+        else:
+            for value in values:
+                predicates.append(Predicate(field, op, _coerce(field, op, value)))
+    return predicates
+
+
+def _index_path(store, predicate):
+    """ Chemin d'accès par index d'égalité pour ce prédicat, None si pas d'index """
+    if predicate.op not in ("eq", "in"):
+        return None
+    values = [predicate.value] if predicate.op == "eq" else list(predicate.value)
+    if predicate.field == "recordid":
+        found = [value for value in values if value in store]
+        fetch = lambda: [record for record in map(store.get, found) if record is not None]
+        return Plan("recordid", "recordid", [predicate], len(found), fetch, [])
+    if predicate.field in INDEXED_FIELDS:
+        rows = sum(store.count(predicate.field, value) for value in values)
+        fetch = lambda: [record for value in values for record in store.lookup(predicate.field, value)]
+        return Plan("index", predicate.field, [predicate], rows, fetch, [])
+    return None
+
+
+def _week_range_path(store, predicates):
+    """ Chemin d'accès par l'index trié des semaines pour les bornes sur semaine_injection
+
+        Avec une égalité sur la commune, utilise les semaines triées de la commune.
+    """
+    bounds = [p for p in predicates if p.field == "semaine_injection" and p.op in RANGE_OPERATORS]
+    if not bounds:
+        return None
+    start = end = None
+    for predicate in bounds:
+        key = week_key(predicate.value)
+        if predicate.op in ("gt", "gte"):
+            key = key + 1 if predicate.op == "gt" else key
+            start = key if start is None else max(start, key)
+        else:
+            key = key - 1 if predicate.op == "lt" else key
+            end = key if end is None else min(end, key)
+    communes = [p for p in predicates if p.field == "commune_residence" and p.op == "eq"]
+    commune = communes[0].value if communes else None
+    used = bounds + communes[:1]
+    rows = store.count_week_range(commune, start, end)
+    fetch = lambda: store.week_range(commune, start, end)
+    index = "commune_semaine" if commune is not None else "semaine"
+    return Plan("week_range", index, used, rows, fetch, [])
+
+
+def plan_query(store, predicates):
+    """ Choisit le chemin d'accès le plus sélectif, les autres prédicats sont résiduels """
+    paths = [_index_path(store, predicate) for predicate in predicates]
+    paths.append(_week_range_path(store, predicates))
+    best = None
+    for path in paths:
+        if path is not None and (best is None or path.estimated_rows < best.estimated_rows):
+            best = path
+    if best is None:
+        best = Plan("scan", None, [], len(store), store.iter_values, [])
+    best.residual = [predicate for predicate in predicates if predicate not in best.predicates]
+    return best
+
+
+def select(records, predicates):
+    """ Entrées d'un lot vérifiant tous les prédicats
+
+        Avec numpy, chaque prédicat est évalué sur tout le lot (Predicate.mask)
+        et les suivants seulement s'il reste des entrées; sans numpy, entrée par entrée.
+    """
+    if numpy is None:
+        matchers = [predicate.matcher() for predicate in predicates]
+        return [record for record in records if all(match(record) for match in matchers)]
+    mask = None
+    for predicate in predicates:
+        selected = predicate.mask(records)
+        mask = selected if mask is None else mask & selected
+        if not mask.any():
+            return []
+    return [records[position] for position in numpy.flatnonzero(mask)]
+
+
+def execute(store, plan):
+    """ Exécute le plan, retourne les entrées trouvées et le nombre d'entrées parcourues
+
+        Les candidates (liste ou itérateur, pour un parcours complet) sont
+        filtrées par lots de RESIDUAL_BATCH_ROWS: seules les entrées retenues
+        sont gardées.
+    """
+    candidates = plan.fetch()
+    if not plan.residual:
+        candidates = list(candidates)
+        return candidates, len(candidates)
+    records, scanned = [], 0
+    for batch in iter_batches(candidates, RESIDUAL_BATCH_ROWS):
+        scanned += len(batch)
+        records.extend(select(batch, plan.residual))
+    return records, scanned
+
+
+def run_query(store, predicates):
+    """ Planifie puis exécute une requête, retourne (entrées, plan, entrées parcourues) """
+    plan = plan_query(store, predicates)
+    records, scanned = execute(store, plan)
+    return records, plan, scanned
+
+
+def iter_query(store, predicates):
+    """ Planifie une requête et parcourt les entrées trouvées sans en construire la liste (exports) """
+    plan = plan_query(store, predicates)
+    records = plan.fetch()
+    if not plan.residual:
+        return iter(records)
+    return (record for batch in iter_batches(records, RESIDUAL_BATCH_ROWS)
+            for record in select(batch, plan.residual))
@@ -0,0 +1,79 @@
+import threading
+from collections import OrderedDict
+from .store import NUMERIC_FIELDS
+from .cube import TOUT_AGE
+from .planner import Predicate, field_value, run_query
+
+
+class Ordering:
+    """ Entrées d'une semaine et d'une classe d'age triées par valeur croissante d'un indicateur """
+
+    def __init__(self, records, metric):
+        ranked = []
+        for record in records:
+            value = field_value(record, metric)
+            if value is not None:
+                ranked.append((value, record["recordid"], field_value(record, "population_carto") or 0.0))
+        ranked.sort(key=lambda item: item[0])
+        self.values = [item[0] for item in ranked]
+        self.recordids = [item[1] for item in ranked]
+        self.populations = [item[2] for item in ranked]
+
+    def __len__(self):
+        return len(self.recordids)
+
+    def page(self, descending=False, offset=0, limit=100, min_population=0.0):
+        """ Positions (dans l'ordre demandé) des entrées du rang `offset` au rang `offset + limit`
+
+            Retourne (positions, rang suivant ou None).
+        """
+        order = range(len(self) - 1, -1, -1) if descending else range(len(self))
+        if not min_population:
+            positions = list(order[offset:offset + limit])
+            return positions, (offset + limit if offset + limit < len(self) else None)
+        positions = []
+        rank = 0
+        for position in order:
+            if self.populations[position] < min_population:
+                continue
+            if rank >= offset + limit:
+                return positions, rank
+            if rank >= offset:
+                positions.append(position)
+            rank += 1
+        return positions, None
+
+
+class RankingIndex:
+    """ Classements précalculés par (semaine, classe d'age, indicateur)
+
+        Un classement est trié une fois puis réutilisé tant que la génération
+        de sa semaine ne change pas; les `size` plus récents sont conservés.
+    """
+
+    def __init__(self, store, size=64):
+        self.lock = threading.Lock()
+        self.store = store
+        self.size = size
+        self.orderings = OrderedDict()  # (semaine, classe d'age, indicateur) -> (génération, classement)
+
+    def ordering(self, semaine, classe_age=TOUT_AGE, metric="taux_cumu_termine"):
+        # une commune a une entrée par classe d'age: le classement porte toujours sur une seule classe
+        if metric not in NUMERIC_FIELDS:
+            raise ValueError(f"metric must be one of {', '.join(NUMERIC_FIELDS)}")
+        key = (semaine, classe_age, metric)
+        generation = self.store.generation("semaine_injection", semaine)
+        with self.lock:
+            cached = self.orderings.get(key)
+            if cached is not None and cached[0] == generation:
+                self.orderings.move_to_end(key)
+                return cached[1]
+        predicates = [Predicate("semaine_injection", "eq", semaine), Predicate("classe_age", "eq", classe_age)]
+        records, _, _ = run_query(self.store, predicates)
+        ordering = Ordering(records, metric)
+        with self.lock:
+            self.orderings[key] = (generation, ordering)
+            self.orderings.move_to_end(key)
+            while len(self.orderings) > self.size:
+                self.orderings.popitem(last=False)
+        return ordering
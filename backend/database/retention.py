@@ -0,0 +1,67 @@
+import datetime
+import hashlib
+from .store import week_key, week_label, week_label_of
+
+
+def week_start(key):
+    """ Lundi de la semaine AAAASS """
+    return datetime.datetime.strptime(f"{week_label(key)}-1", "%G-%V-%u")
+
+
+def month_of(key):
+    """ Mois "AAAA-MM" d'une semaine AAAASS: celui de son jeudi, comme pour l'année ISO """
+    return (week_start(key) + datetime.timedelta(days=3)).strftime("%Y-%m")
+
+
+def monthly_recordid(commune, classe_age, month):
+    return hashlib.sha1(f"mois|{commune}|{classe_age}|{month}".encode("utf-8")).hexdigest()
+
+
+def compact(store, horizon_weeks, timestamp=None):
+    """ Remplace les entrées hebdomadaires antérieures à l'horizon par une ligne par mois
+
+        Les compteurs étant cumulés, la ligne d'un mois (commune, classe d'age)
+        reprend la dernière semaine du mois: elle garde sa semaine d'injection et
+        reste donc lisible par les routes existantes, avec granularite "mois".
+        Seuls les mois entièrement antérieurs à l'horizon sont compactés, un mois
+        à la fois pour que les semaines sur disque ne reviennent pas toutes en
+        mémoire. Retourne le nombre d'entrées supprimées et de lignes créées.
+    """
+    timestamp = timestamp or datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
+    with store.lock:
+        if not store.week_keys:
+            return 0, 0
+        horizon = week_start(store.week_keys[-1]) - datetime.timedelta(weeks=horizon_weeks)
+        # premier mois dont une semaine est dans l'horizon: il reste en détail
+        first_kept = month_of(week_key(week_label_of(horizon + datetime.timedelta(weeks=1))))
+        months = {}
+        for key in store.week_keys:
+            month = month_of(key)
+            if month >= first_kept:
+                break
+            months.setdefault(month, []).append(key)
+    removed = added = 0
+    for month, keys in months.items():
+        with store.lock:
+            groups = {}
+            for key in keys:
+                for record in store.week_range(start=key, end=key):
+                    fields = record["fields"]
+                    groups.setdefault((fields.get("commune_residence"), fields.get("classe_age")), []).append(record)
+            for (commune, classe_age), records in groups.items():
+                if all(record["fields"].get("granularite") == "mois" for record in records):
+                    continue
+                # une ligne mensuelle déjà présente est fusionnée avec les nouvelles semaines
+                last = records[-1]     # week_range parcourt les semaines dans l'ordre
+                row = {
+                    "datasetid": last.get("datasetid"),
+                    "recordid": monthly_recordid(commune, classe_age, month),
+                    "fields": dict(last["fields"], granularite="mois", mois=month,
+                                   nombre_semaines=sum(record["fields"].get("nombre_semaines", 1) for record in records)),
+                    "record_timestamp": timestamp,
+                }
+                for record in records:
+                    removed += store.delete(record["recordid"])
+                added += store.add(row)
+            store.demote()
+    return removed, added
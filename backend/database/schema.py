@@ -0,0 +1,144 @@
+import datetime
+import math
+from .store import DATASET_ID, week_key, week_label
+
+
+# Clefs admises dans un corps de requête en dehors des champs de l'entrée
+ENVELOPE = ("recordid", "datasetid")
+
+
+def text(value):
+    if not isinstance(value, str):
+        raise TypeError("expected a string")
+    return value
+
+
+def integer(value):
+    """ Effectif: entier, accepte 380, 380.0 ou "380" """
+    if isinstance(value, bool):
+        raise TypeError("expected a number")
+    if isinstance(value, int):
+        return value
+    number = float(value)
+    if not number.is_integer():
+        raise ValueError("expected an integer")
+    return int(number)
+
+
+def decimal(value):
+    """ Taux: float fini, accepte 0.963 ou "0.963" """
+    if isinstance(value, bool):
+        raise TypeError("expected a number")
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError("expected a finite number")
+    return number
+
+
+def day(value):
+    """ Date "AAAA-MM-JJ" """
+    return datetime.date.fromisoformat(text(value)).isoformat()
+
+
+def week(value):
+    """ Semaine d'injection "AAAA-SS", normalisée ("2021-5" -> "2021-05") """
+    key = week_key(text(value))
+    if key is None or not 1 <= key % 100 <= 53:
+        raise ValueError("expected a week 'YYYY-WW'")
+    return week_label(key)
+
+
+def month(value):
+    """ Mois "AAAA-MM" des lignes mensuelles """
+    return datetime.datetime.strptime(text(value), "%Y-%m").strftime("%Y-%m")
+
+
+# Type de chaque champ d'une entrée (voir store.FIELDS)
+FIELD_TYPES = {
+    "classe_age": text,
+    "commune_residence": text,
+    "date": day,
+    "date_reference": day,
+    "effectif_cumu_1_inj": integer,
+    "effectif_cumu_termine": integer,
+    "libelle_classe_age": text,
+    "libelle_commune": text,
+    "population_carto": integer,
+    "semaine_injection": week,
+    "taux_cumu_1_inj": decimal,
+    "taux_cumu_termine": decimal,
+    "granularite": text,
+    "mois": month,
+    "nombre_semaines": integer,
+}
+
+
+class RecordSchema:
+    """ Conversion et validation des champs d'une entrée, une fois à l'ingestion
+
+        Chaque champ est associé à sa fonction de conversion une fois pour toutes:
+        valider une entrée revient à une recherche dans un dictionnaire et un
+        appel par champ. Une valeur invalide lève ValueError, de même qu'un champ
+        inconnu dans un corps de requête; une valeur null est gardée telle quelle
+        (valeur manquante).
+    """
+
+    def __init__(self, types):
+        self.types = dict(types)
+
+    def fields(self, datas, **defaults):
+        """ Champs typés d'un corps de requête; `defaults` complète les champs absents """
+        fields = {}
+        for name, value in datas.items():
+            if name not in ENVELOPE:
+                fields[name] = self.convert(name, value)
+        for name, value in defaults.items():
+            if name not in fields:
+                fields[name] = self.convert(name, value)
+        return fields
+
+    def convert(self, name, value):
+        convert = self.types.get(name)
+        if convert is None:
+            raise ValueError(f"unknown field '{name}'")
+        if value is None:
+            return None
+        try:
+            return convert(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid value for field '{name}': {value!r}")
+
+    def record(self, datas, timestamp, **defaults):
+        """ Nouvelle entrée construite depuis un corps de requête POST """
+        if not isinstance(datas.get("recordid"), str):
+            raise ValueError("recordid must be a string")
+        return {
+            "datasetid": DATASET_ID,
+            "recordid": datas["recordid"],
+            "fields": self.fields(datas, **defaults),
+            "record_timestamp": timestamp,
+        }
+
+    def coerce(self, record):
+        """ Entrée complète (fichier json, API amont) dont les champs connus sont convertis
+
+            Un champ inconnu du schéma (ajouté par l'amont) est gardé tel quel:
+            l'entrée n'est ni écartée ni appauvrie à la prochaine réécriture.
+        """
+        if not isinstance(record.get("recordid"), str) or not isinstance(record.get("fields"), dict):
+            raise ValueError("record needs a recordid and fields")
+        fields = {name: self.convert(name, value) if name in self.types else value
+                  for name, value in record["fields"].items()}
+        return dict(record, fields=fields)
+
+    def coerce_all(self, records, rejected=None):
+        """ Parcourt les entrées converties; les invalides sont écartées et ajoutées à `rejected` (entrée, erreur) """
+        for record in records:
+            try:
+                yield self.coerce(record)
+            except (ValueError, AttributeError) as error:
+                if rejected is not None:
+                    rejected.append((record, str(error)))
+
+
+record_schema = RecordSchema(FIELD_TYPES)
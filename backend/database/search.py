@@ -0,0 +1,171 @@
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+
+
+# Suffixes examinés au plus pour une saisie très courte ("s" correspond à des milliers de communes)
+MAX_PREFIX_MATCHES = 1000
+
+def normalize(text):
+    """ Minuscules sans accents, mots séparés par une espace: "L'Abergement-Clémenciat" -> "l abergement clemenciat" """
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(character for character in text if not unicodedata.combining(character))
+    return " ".join(re.split(r"[^a-z0-9]+", text.lower())).strip()
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[position:position + 3] for position in range(len(padded) - 2)}
+
+
+class CommuneSearch:
+    """ Recherche des communes par libellé, au fil de la frappe
+
+        Les libellés normalisés sont rangés dans une liste triée de suffixes de
+        mots (un trie aplati): une recherche par préfixe, depuis le début du
+        libellé ou d'un de ses mots, est une recherche dichotomique. Un index de
+        trigrammes complète les suggestions quand la saisie contient une faute.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.labels = {}        # code -> libellé -> nombre d'entrées
+        self.indexed = {}       # code -> (libellé, libellé normalisé, nombre de trigrammes) indexés
+        self.suffixes = []      # (suffixe de mots du libellé normalisé, code), trié
+        self.grams = {}         # trigramme -> codes
+        self.store = None
+
+    def attach(self, store):
+        self.store = store
+        store.subscribe(self.on_change)
+
+    def on_change(self, event, record, old_fields):
+        if event == "load":
+            self.rebuild(self.store.iter_values())
+            return
+        if event == "add_many":
+            self._count([added["fields"] for added in record], 1)
+            return
+        fields = record["fields"]
+        if event == "update":
+            if (old_fields.get("commune_residence"), old_fields.get("libelle_commune")) == \
+                    (fields.get("commune_residence"), fields.get("libelle_commune")):
+                return
+            self._count([old_fields], -1)
+        self._count([fields], -1 if event == "delete" else 1)
+
+    def rebuild(self, records):
+        labels = {}
+        for record in records:
+            code = record["fields"].get("commune_residence")
+            label = record["fields"].get("libelle_commune")
+            if code is not None and label:
+                counts = labels.setdefault(code, {})
+                counts[label] = counts.get(label, 0) + 1
+        with self.lock:
+            self.labels, self.indexed, self.suffixes, self.grams = labels, {}, [], {}
+            for code, counts in labels.items():
+                self._index(code, max(counts, key=counts.get), sort=False)
+            self.suffixes.sort()
+
+    def search(self, query, limit=10):
+        """ Codes des communes dont le libellé correspond le mieux à la saisie, du meilleur au moins bon
+
+            D'abord les libellés commençant par la saisie, puis ceux dont un mot
+            commence par elle, puis les plus proches en trigrammes.
+        """
+        text = normalize(query)
+        if not text:
+            return []
+        with self.lock:
+            found = {}
+            position = bisect_left(self.suffixes, (text,))
+            end = min(len(self.suffixes), position + MAX_PREFIX_MATCHES)
+            while position < end and self.suffixes[position][0].startswith(text):
+                suffix, code = self.suffixes[position]
+                name = self.indexed[code][1]
+                score = (0 if suffix == name else 1, len(name))
+                found[code] = min(found.get(code, score), score)
+                position += 1
+            ranked = sorted(found, key=lambda code: (found[code], code))
+            if len(ranked) < limit and len(text) >= 3:
+                ranked += self._fuzzy(text, limit - len(ranked), exclude=found)
+            return [(code, self.indexed[code][0]) for code in ranked[:limit]]
+
+    def _fuzzy(self, text, limit, exclude):
+        query = trigrams(text)
+        shared = {}
+        for gram in query:
+            for code in self.grams.get(gram, ()):
+                if code not in exclude:
+                    shared[code] = shared.get(code, 0) + 1
+        scored = []
+        for code, count in shared.items():
+            # coefficient de Dice entre les trigrammes de la saisie et ceux du libellé
+            similarity = 2 * count / (len(query) + self.indexed[code][2])
+            if similarity >= 0.4:
+                scored.append((-similarity, code))
+        scored.sort()
+        return [code for _, code in scored[:limit]]
+
+    def _count(self, changed, sign):
+        """ Compte (sign 1) ou décompte (sign -1) les libellés des champs donnés, puis réindexe leurs communes """
+        counts = {}
+        for fields in changed:
+            code = fields.get("commune_residence")
+            label = fields.get("libelle_commune")
+            if code is not None and label:
+                counts[(code, label)] = counts.get((code, label), 0) + sign
+        if not counts:
+            return
+        with self.lock:
+            for (code, label), count in counts.items():
+                labels = self.labels.setdefault(code, {})
+                labels[label] = labels.get(label, 0) + count
+                if labels[label] <= 0:
+                    del labels[label]
+                if not labels:
+                    del self.labels[code]
+            for code in {code for code, _ in counts}:
+                labels = self.labels.get(code, {})
+                # libellé le plus fréquent de la commune
+                best = max(labels, key=labels.get) if labels else None
+                current = self.indexed.get(code)
+                if (current[0] if current else None) != best:
+                    if current is not None:
+                        self._unindex(code, current[1])
+                    if best is not None:
+                        self._index(code, best)
+
+    def _index(self, code, label, sort=True):
+        name = normalize(label)
+        self.indexed[code] = (label, name, len(trigrams(name)))
+        for suffix in self._word_suffixes(name):
+            if sort:
+                insort(self.suffixes, (suffix, code))
+            else:
+                self.suffixes.append((suffix, code))
+        for gram in trigrams(name):
+            self.grams.setdefault(gram, set()).add(code)
+
+    def _unindex(self, code, name):
+        del self.indexed[code]
+        for suffix in self._word_suffixes(name):
+            position = bisect_left(self.suffixes, (suffix, code))
+            if position < len(self.suffixes) and self.suffixes[position] == (suffix, code):
+                del self.suffixes[position]
+        for gram in trigrams(name):
+            codes = self.grams.get(gram)
+            if codes is not None:
+                codes.discard(code)
+                if not codes:
+                    del self.grams[gram]
+
+    @staticmethod
+    def _word_suffixes(name):
+        words = name.split(" ")
+        return {" ".join(words[position:]) for position in range(len(words))}
+
+
+commune_search = CommuneSearch()
@@ -0,0 +1,399 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from .tiered import TieredRecords
+
+
+DATASET_ID = "donnees-de-vaccination-par-commune"
+
+# Champs d'une entrée (contenus dans la clef "fields")
+FIELDS = (
+    "classe_age",
+    "commune_residence",
+    "date",
+    "date_reference",
+    "effectif_cumu_1_inj",
+    "effectif_cumu_termine",
+    "libelle_classe_age",
+    "libelle_commune",
+    "population_carto",
+    "semaine_injection",
+    "taux_cumu_1_inj",
+    "taux_cumu_termine",
+    # lignes mensuelles créées par la rétention (voir retention.compact), absents des lignes hebdomadaires
+    "granularite",
+    "mois",
+    "nombre_semaines",
+)
+
+# Champs dont les valeurs sont comparées comme des nombres
+NUMERIC_FIELDS = (
+    "effectif_cumu_1_inj",
+    "effectif_cumu_termine",
+    "population_carto",
+    "taux_cumu_1_inj",
+    "taux_cumu_termine",
+    "nombre_semaines",
+)
+
+# Champs possédant un index (valeur -> identifiants des entrées et leur semaine AAAASS)
+INDEXED_FIELDS = ("commune_residence", "semaine_injection", "classe_age")
+
+
+def week_key(semaine):
+    """ Convertit une semaine d'injection "AAAA-SS" en entier AAAASS, None si invalide """
+    try:
+        year, week = str(semaine).split("-")
+        return int(year) * 100 + int(week)
+    except ValueError:
+        return None
+
+
+def week_label(key):
+    """ Convertit un entier AAAASS en semaine d'injection "AAAA-SS" """
+    return f"{key // 100}-{key % 100:02d}"
+
+
+def week_label_of(date):
+    """ Semaine d'injection (semaine ISO) contenant la date donnée """
+    year, week, _ = date.isocalendar()
+    return f"{year}-{week:02d}"
+
+
+def departement_of(code_commune):
+    """ Code du département d'une commune: 2 caractères, 3 pour l'outre-mer (97x) """
+    code = str(code_commune)
+    return code[:3] if code.startswith("97") else code[:2]
+
+
+class VaccinationStore:
+    """ Stockage en mémoire des entrées du dataset et de leurs index
+
+        Toutes les écritures passent par add/update/delete afin que les index
+        restent synchronisés avec les entrées.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.records = TieredRecords()  # recordid -> entrée, anciennes semaines sur disque
+        self.indexes = {field: {} for field in INDEXED_FIELDS}
+        self.weeks = {}         # commune -> (semaines triées AAAASS, recordid correspondants)
+        self.week_keys = []     # semaines AAAASS distinctes, triées
+        self.week_index = {}    # semaine AAAASS -> identifiants des entrées
+        self.commune_codes = [] # codes des communes, triés: index de préfixes (département)
+        self.version = 0        # incrémentée à chaque modification du dataset
+        self.generations = {}   # (champ, valeur) -> version de la dernière modification
+        self.base_generation = 0
+        self.listeners = []     # fonctions appelées après chaque écriture
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, recordid):
+        return recordid in self.records
+
+    def load(self, records, batch_size=None):
+        """ Remplace le contenu du stockage par les entrées données (liste ou itérateur)
+
+            Avec `batch_size`, le verrou est relâché et la version incrémentée
+            toutes les `batch_size` entrées: les entrées déjà chargées sont
+            servies pendant le chargement. Les abonnés sont notifiés à la fin.
+            Un recordid déjà présent (écrit pendant le chargement) est ignoré.
+            Les semaines sortant des `hot_weeks` plus récentes sont rangées sur
+            disque au fil de la lecture: le dataset n'est jamais entier en mémoire.
+        """
+        self.lock.acquire()
+        try:
+            self.records.clear()
+            self.indexes = {field: {} for field in INDEXED_FIELDS}
+            self.weeks = {}
+            self.week_keys = []
+            self.week_index = {}
+            self.commune_codes = []
+            hot_weeks = self.records.hot_weeks
+            strays = {}         # semaine déjà sur disque -> recordid arrivés ensuite
+            pending = 0
+            for record in records:
+                key = week_key(record["fields"].get("semaine_injection"))
+                if self.records.get(record["recordid"], week=key) is not None:
+                    continue
+                self.records[record["recordid"]] = record
+                self._index(record)
+                if key in self.records.segments:
+                    strays.setdefault(key, []).append(record["recordid"])
+                elif hot_weeks and len(self.week_keys) > hot_weeks \
+                        and self.week_keys[-hot_weeks - 1] not in self.records.segments:
+                    # une semaine sort des plus récentes: rangée sur disque sans attendre la fin du chargement
+                    self.demote()
+                pending += 1
+                if batch_size and pending >= batch_size:
+                    pending = 0
+                    self._reset_generations()
+                    # laisse passer les lectures et écritures en attente du verrou
+                    self.lock.release()
+                    self.lock.acquire()
+            for key, recordids in strays.items():
+                # entrées arrivées après la mise sur disque de leur semaine: ajoutées à son segment
+                recordids = [recordid for recordid in recordids if recordid in self.records.hot]
+                if recordids and key in self.records.segments:
+                    self.records.freeze(key, recordids)
+            self._notify("load", None)
+            # après les abonnés: une réponse calculée pendant leur reconstruction reste sous l'ancienne génération
+            self._reset_generations()
+            self.demote()
+        finally:
+            self.lock.release()
+
+    def get(self, recordid, week=None):
+        """ Entrée d'un recordid; sa semaine AAAASS, si connue, évite de chercher dans les autres segments """
+        return self.records.get(recordid, week=week)
+
+    def values(self):
+        """ Retourne la liste de toutes les entrées: en mémoire puis sur disque, semaine par semaine """
+        return self.records.values()
+
+    def iter_values(self):
+        """ Parcourt toutes les entrées comme values(), sans les garder toutes en mémoire """
+        return self.records.iter_values()
+
+    def lookup(self, field, value):
+        """ Retourne les entrées dont le champ indexé `field` vaut `value` """
+        with self.lock:
+            found = list(self.indexes[field].get(value, {}).items())
+        # une entrée supprimée depuis la copie de l'index est ignorée
+        records = (self.records.get(recordid, week=key) for recordid, key in found)
+        return [record for record in records if record is not None]
+
+    def count(self, field, value):
+        """ Nombre d'entrées dont le champ indexé `field` vaut `value` """
+        return len(self.indexes[field].get(value, ()))
+
+    def distinct(self, field):
+        """ Valeurs distinctes d'un champ indexé, dans l'ordre d'apparition """
+        return list(self.indexes[field])
+
+    def communes(self, prefix=""):
+        """ Codes des communes commençant par `prefix` (un code de département), triés """
+        lo = bisect_left(self.commune_codes, prefix)
+        hi = bisect_left(self.commune_codes, prefix + "\uffff")
+        return self.commune_codes[lo:hi]
+
+    def subscribe(self, listener):
+        """ Enregistre une fonction appelée après chaque écriture, sous le verrou du stockage
+
+            Elle reçoit l'événement ("add", "add_many", "update", "delete" ou "load"),
+            l'entrée concernée (la liste des entrées ajoutées pour "add_many", None
+            pour "load") et, pour "update", une copie des champs avant modification.
+        """
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def _notify(self, event, record, old_fields=None):
+        for listener in self.listeners:
+            listener(event, record, old_fields)
+
+    def generation(self, field=None, value=None):
+        """ Génération d'une valeur de commune_residence, de semaine_injection ou d'un département
+
+            Elle change à chaque écriture touchant une entrée portant cette valeur;
+            sans champ, c'est la version de l'ensemble du dataset.
+        """
+        if field is None:
+            return self.version
+        return self.generations.get((field, value), self.base_generation)
+
+    def week_range(self, commune=None, start=None, end=None):
+        """ Entrées dont la semaine AAAASS est comprise entre start et end (inclus)
+
+            Avec une commune, recherche dichotomique dans ses semaines triées:
+            O(log n + k). Sans commune, parcourt les semaines distinctes de la plage.
+        """
+        with self.lock:
+            # semaines et recordid copiés ensemble: une écriture concurrente ne les désaligne pas
+            if commune is None:
+                keys = self.week_keys[self._week_slice(self.week_keys, start, end)]
+                found = [(key, recordid) for key in keys for recordid in self.week_index.get(key, ())]
+            else:
+                keys, recordids = self.weeks.get(commune, ([], []))
+                positions = self._week_slice(keys, start, end)
+                found = list(zip(keys[positions], recordids[positions]))
+        # une entrée supprimée depuis la copie est ignorée
+        records = (self.records.get(recordid, week=key) for key, recordid in found)
+        return [record for record in records if record is not None]
+
+    def count_week_range(self, commune=None, start=None, end=None):
+        """ Nombre d'entrées que retournerait week_range """
+        if commune is None:
+            keys = self.week_keys[self._week_slice(self.week_keys, start, end)]
+            return sum(len(self.week_index[key]) for key in keys)
+        keys, _ = self.weeks.get(commune, ([], []))
+        positions = self._week_slice(keys, start, end)
+        return max(positions.stop - positions.start, 0)
+
+    @staticmethod
+    def _week_slice(keys, start, end):
+        lo = 0 if start is None else bisect_left(keys, start)
+        hi = len(keys) if end is None else bisect_right(keys, end)
+        return slice(lo, hi)
+
+    def demote(self):
+        """ Range sur disque les semaines plus anciennes que les `hot_weeks` semaines les plus récentes """
+        hot_weeks = self.records.hot_weeks
+        if not hot_weeks:
+            return
+        with self.lock:
+            for key in self.week_keys[:-hot_weeks]:
+                if key not in self.records.segments:
+                    self.records.freeze(key, list(self.week_index[key]))
+
+    def add(self, record):
+        """ Ajoute une entrée, retourne False si son recordid est déjà utilisé """
+        with self.lock:
+            if record["recordid"] in self.records:
+                return False
+            self._warm(record["fields"])
+            self.records[record["recordid"]] = record
+            self._index(record)
+            self.version += 1
+            self._touch(record)
+            self._notify("add", record)
+            return True
+
+    def add_many(self, records):
+        """ Ajoute des entrées en une seule écriture, retourne la liste de celles ajoutées
+
+            Un recordid déjà utilisé est ignoré. Les index sont mis à jour sous un
+            seul verrou et les abonnés notifiés une fois ("add_many"): une lecture
+            voit toutes les nouvelles entrées ou aucune.
+        """
+        with self.lock:
+            added = {}
+            for record in records:
+                key = week_key(record["fields"].get("semaine_injection"))
+                if record["recordid"] not in added and self.records.get(record["recordid"], week=key) is None:
+                    added[record["recordid"]] = record
+            added = list(added.values())
+            for key in {week_key(record["fields"].get("semaine_injection")) for record in added}:
+                if key in self.records.segments:
+                    self.records.thaw(key)
+            for record in added:
+                self.records[record["recordid"]] = record
+                self._index(record)
+            if added:
+                self.version += 1
+                for record in added:
+                    self._touch(record)
+                self._notify("add_many", added)
+            return added
+
+    def update(self, recordid, fields, timestamp):
+        """ Modifie les champs d'une entrée, retourne l'entrée modifiée ou None """
+        with self.lock:
+            record = self.records.get(recordid)
+            if record is None:
+                return None
+            # une entrée sur disque est en lecture seule: sa semaine et la semaine visée reviennent en mémoire
+            self._warm(record["fields"])
+            self._warm(fields)
+            record = self.records[recordid]
+            # seul un changement de valeur d'un champ indexé déplace l'entrée dans les index
+            reindex = any(field in fields and fields[field] != record["fields"].get(field)
+                          for field in INDEXED_FIELDS)
+            if reindex:
+                self._unindex(record)
+            self.version += 1
+            self._touch(record)
+            old_fields = dict(record["fields"])
+            record["fields"].update(fields)
+            record["record_timestamp"] = timestamp
+            if reindex:
+                self._index(record)
+            self._touch(record)
+            self._notify("update", record, old_fields)
+            return record
+
+    def delete(self, recordid):
+        """ Supprime une entrée, retourne False si elle n'existe pas """
+        with self.lock:
+            record = self.records.get(recordid)
+            if record is None:
+                return False
+            self._warm(record["fields"])
+            record = self.records.pop(recordid)
+            self._unindex(record)
+            self.version += 1
+            self._touch(record)
+            self._notify("delete", record)
+            return True
+
+    def _warm(self, fields):
+        key = week_key(fields.get("semaine_injection"))
+        if key in self.records.segments:
+            self.records.thaw(key)
+
+    def _reset_generations(self):
+        """ Nouvelle version de l'ensemble du dataset: toutes les réponses en cache sont invalidées """
+        self.version += 1
+        self.generations = {}
+        self.base_generation = self.version
+
+    def _touch(self, record):
+        fields = record["fields"]
+        for field in ("commune_residence", "semaine_injection"):
+            if field in fields:
+                self.generations[(field, fields[field])] = self.version
+        if "commune_residence" in fields:
+            self.generations[("departement", departement_of(fields["commune_residence"]))] = self.version
+
+    def _index(self, record):
+        fields = record["fields"]
+        recordid = record["recordid"]
+        key = week_key(fields.get("semaine_injection"))
+        for field in INDEXED_FIELDS:
+            if field in fields:
+                if field == "commune_residence" and fields[field] not in self.indexes[field]:
+                    insort(self.commune_codes, str(fields[field]))
+                self.indexes[field].setdefault(fields[field], {})[recordid] = key
+        if key is None:
+            return
+        if key not in self.week_index:
+            self.week_keys.insert(bisect_left(self.week_keys, key), key)
+            self.week_index[key] = {}
+        self.week_index[key][recordid] = None
+        if "commune_residence" in fields:
+            keys, recordids = self.weeks.setdefault(fields["commune_residence"], ([], []))
+            position = bisect_right(keys, key)
+            keys.insert(position, key)
+            recordids.insert(position, recordid)
+
+    def _unindex(self, record):
+        fields = record["fields"]
+        for field in INDEXED_FIELDS:
+            bucket = self.indexes[field].get(fields.get(field))
+            if bucket is not None:
+                bucket.pop(record["recordid"], None)
+                if not bucket:
+                    del self.indexes[field][fields[field]]
+                    if field == "commune_residence":
+                        del self.commune_codes[bisect_left(self.commune_codes, str(fields[field]))]
+        key = week_key(fields.get("semaine_injection"))
+        if key is None or key not in self.week_index:
+            return
+        self.week_index[key].pop(record["recordid"], None)
+        if not self.week_index[key]:
+            del self.week_index[key]
+            del self.week_keys[bisect_left(self.week_keys, key)]
+        if fields.get("commune_residence") in self.weeks:
+            keys, recordids = self.weeks[fields["commune_residence"]]
+            lo, hi = bisect_left(keys, key), bisect_right(keys, key)
+            position = lo + recordids[lo:hi].index(record["recordid"])
+            del keys[position]
+            del recordids[position]
+            if not keys:
+                del self.weeks[fields["commune_residence"]]
+
+
+store = VaccinationStore()
@@ -0,0 +1,305 @@
+import glob
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from collections import OrderedDict
+
+
+SEGMENT_SUFFIX = ".seg"
+FOOTER = struct.Struct("<Q")     # position de l'en-tête, en fin de segment
+
+
+def bloom_hashes(key):
+    """ Empreinte d'un recordid, calculée une fois pour interroger tous les filtres de Bloom """
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+
+class BloomFilter:
+    """ Ensemble probabiliste de recordid: pas de faux négatif, environ 1 % de faux positifs """
+
+    def __init__(self, capacity, bits_per_item=10, hashes=7):
+        self.size = max(64, capacity * bits_per_item)
+        self.hashes = hashes
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, hashes):
+        first, second = hashes
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(bloom_hashes(key)):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def might_contain(self, hashes):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(hashes))
+
+
+class Segment:
+    """ Entrées d'une semaine rangées sur disque, lues par projection en mémoire (mmap)
+
+        Le fichier contient les entrées JSON les unes à la suite des autres puis
+        un en-tête (recordid et position de chaque entrée); seul le filtre de
+        Bloom reste en mémoire tant que le segment n'est pas chargé. Chargé, il
+        garde en plus la table des positions; les pages projetées relèvent du
+        cache du système.
+    """
+
+    def __init__(self, path, week, count, size, bloom):
+        self.path = path
+        self.week = week
+        self.count = count
+        self.size = size
+        self.bloom = bloom
+        self.file = None
+        self.mmap = None
+        self.offsets = None     # recordid -> (début, fin), une fois le segment chargé
+        self.resident = 0       # octets gardés en mémoire par le chargement: en-tête et table des positions
+
+    @classmethod
+    def write(cls, path, week, records):
+        bloom = BloomFilter(len(records))
+        recordids, offsets = [], [0]
+        with open(path + ".tmp", "wb") as f:
+            for record in records:
+                data = json.dumps(record, ensure_ascii=False).encode("utf-8")
+                f.write(data)
+                recordids.append(record["recordid"])
+                offsets.append(offsets[-1] + len(data))
+                bloom.add(record["recordid"])
+            header = json.dumps({"week": week, "recordids": recordids, "offsets": offsets}).encode("utf-8")
+            f.write(header)
+            f.write(FOOTER.pack(offsets[-1]))
+        os.replace(path + ".tmp", path)
+        return cls(path, week, len(records), os.path.getsize(path), bloom)
+
+    @property
+    def loaded(self):
+        return self.mmap is not None
+
+    def load(self):
+        self.file = open(self.path, "rb")
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        start = FOOTER.unpack(self.mmap[-FOOTER.size:])[0]
+        header = json.loads(self.mmap[start:-FOOTER.size])
+        bounds = header["offsets"]
+        self.offsets = {recordid: (bounds[i], bounds[i + 1]) for i, recordid in enumerate(header["recordids"])}
+        self.resident = len(self.mmap) - start + sys.getsizeof(self.offsets)
+
+    def unload(self):
+        self.offsets = None
+        self.mmap.close()
+        self.file.close()
+        self.mmap = self.file = None
+
+    def read(self, recordid):
+        """ Entrée du segment chargé, None si elle n'y est pas (faux positif du filtre de Bloom) """
+        bounds = self.offsets.get(recordid)
+        return None if bounds is None else json.loads(self.mmap[bounds[0]:bounds[1]])
+
+    def records(self):
+        """ Toutes les entrées, lues séquentiellement sans charger le segment """
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = FOOTER.unpack(data[-FOOTER.size:])[0]
+            bounds = json.loads(data[start:-FOOTER.size])["offsets"]
+            return [json.loads(data[bounds[i]:bounds[i + 1]]) for i in range(len(bounds) - 1)]
+
+    def remove(self):
+        if self.loaded:
+            self.unload()
+        os.remove(self.path)
+
+
+class TieredRecords:
+    """ Entrées du stockage: semaines récentes en mémoire, anciennes semaines sur disque
+
+        S'utilise comme un dictionnaire recordid -> entrée. Une entrée froide est
+        cherchée dans les segments dont le filtre de Bloom la contient peut-être;
+        les segments chargés sont gardés dans un LRU borné à `cache_bytes` de
+        tables des positions (les pages projetées, que le système libère de
+        lui-même, ne comptent pas). Les entrées froides sont en lecture seule:
+        le stockage réchauffe (thaw) une semaine avant d'y écrire.
+    """
+
+    def __init__(self, directory="segments", hot_weeks=None, cache_bytes=256 * 1024 * 1024):
+        self.lock = threading.RLock()
+        self.directory = directory
+        self.hot_weeks = hot_weeks      # semaines gardées en mémoire, None: toutes
+        self.cache_bytes = cache_bytes
+        self.hot = {}                   # recordid -> entrée
+        self.segments = {}              # semaine AAAASS -> segment
+        self.cold_count = 0
+        self.loaded = OrderedDict()     # semaines des segments chargés, LRU
+        self.loaded_bytes = 0
+        self.written = 0                # segments écrits: numéro du prochain fichier
+        self.readers = 0                # parcours (iter_values) en cours
+        self.removed = []               # segments retirés pendant un parcours, supprimés à la fin du dernier
+        self.cold_reads = 0
+        self.page_ins = 0
+        self.evictions = 0
+        self.false_positives = 0
+
+    def configure(self, config):
+        self.directory = config.get("STORE_SEGMENTS_DIRECTORY", self.directory)
+        self.hot_weeks = config.get("STORE_HOT_WEEKS", self.hot_weeks)
+        self.cache_bytes = config.get("STORE_COLD_CACHE_BYTES", self.cache_bytes)
+
+    def __len__(self):
+        return len(self.hot) + self.cold_count
+
+    def __contains__(self, recordid):
+        return recordid in self.hot or self._cold(recordid) is not None
+
+    def __getitem__(self, recordid):
+        record = self.get(recordid)
+        if record is None:
+            raise KeyError(recordid)
+        return record
+
+    def __setitem__(self, recordid, record):
+        self.hot[recordid] = record
+
+    def get(self, recordid, default=None, week=None):
+        """ Entrée d'un recordid; `week`, si connue, évite d'interroger les autres segments """
+        record = self.hot.get(recordid)
+        if record is None:
+            record = self._cold(recordid, week)
+            if record is None:
+                # la semaine a pu revenir en mémoire pendant la recherche
+                record = self.hot.get(recordid)
+        return default if record is None else record
+
+    def pop(self, recordid, default=None):
+        return self.hot.pop(recordid, default)
+
+    def values(self):
+        return list(self.iter_values())
+
+    def iter_values(self):
+        """ Entrées chaudes puis entrées de chaque segment, de la plus ancienne semaine à la plus récente
+
+            Les entrées chaudes et la liste des segments sont relevées ensemble
+            sous le verrou; un segment réchauffé ou remplacé pendant le parcours
+            n'est supprimé du disque qu'à la fin du dernier parcours. Un seul
+            segment est lu en mémoire à la fois.
+        """
+        with self.lock:
+            hot = list(self.hot.values())
+            segments = [self.segments[week] for week in sorted(self.segments)]
+            self.readers += 1
+        try:
+            yield from hot
+            for segment in segments:
+                yield from segment.records()
+        finally:
+            with self.lock:
+                self.readers -= 1
+                if not self.readers:
+                    for segment in self.removed:
+                        segment.remove()
+                    self.removed = []
+
+    def clear(self):
+        with self.lock:
+            for segment in self.segments.values():
+                self._remove(segment)
+            self.hot, self.segments, self.loaded = {}, {}, OrderedDict()
+            self.cold_count = self.loaded_bytes = 0
+            # segments laissés par une exécution précédente
+            pending = {segment.path for segment in self.removed}
+            for path in glob.glob(os.path.join(self.directory, "*" + SEGMENT_SUFFIX)):
+                if path not in pending:
+                    os.remove(path)
+
+    def freeze(self, week, recordids):
+        """ Range sur disque les entrées chaudes d'une semaine
+
+            Si la semaine a déjà un segment, ses entrées sont réécrites avec les
+            nouvelles dans un seul segment.
+        """
+        with self.lock:
+            if week in self.segments:
+                recordids = list(recordids) + self.thaw(week)
+            os.makedirs(self.directory, exist_ok=True)
+            # un nom par écriture: un parcours en cours peut encore lire le segment précédent de la semaine
+            self.written += 1
+            path = os.path.join(self.directory, f"{week}-{self.written}{SEGMENT_SUFFIX}")
+            self.segments[week] = Segment.write(path, week, [self.hot[recordid] for recordid in recordids])
+            for recordid in recordids:
+                del self.hot[recordid]
+            self.cold_count += len(recordids)
+
+    def thaw(self, week):
+        """ Ramène en mémoire les entrées d'une semaine rangée sur disque, retourne leurs recordid """
+        with self.lock:
+            segment = self.segments.pop(week, None)
+            if segment is None:
+                return []
+            recordids = []
+            for record in segment.records():
+                self.hot[record["recordid"]] = record
+                recordids.append(record["recordid"])
+            self.cold_count -= segment.count
+            if week in self.loaded:
+                del self.loaded[week]
+                self.loaded_bytes -= segment.resident
+            self._remove(segment)
+            return recordids
+
+    def _remove(self, segment):
+        if not self.readers:
+            segment.remove()
+            return
+        if segment.loaded:
+            segment.unload()
+        self.removed.append(segment)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hot_records": len(self.hot),
+                "cold_records": self.cold_count,
+                "cold_segments": len(self.segments),
+                "loaded_segments": len(self.loaded),
+                "loaded_bytes": self.loaded_bytes,
+                "cache_bytes": self.cache_bytes,
+                "cold_reads": self.cold_reads,
+                "page_ins": self.page_ins,
+                "evictions": self.evictions,
+                "bloom_false_positives": self.false_positives,
+            }
+
+    def _cold(self, recordid, week=None):
+        if not self.segments:
+            return None
+        hashes = bloom_hashes(recordid)
+        with self.lock:
+            segments = self.segments.values() if week is None else [self.segments[week]] if week in self.segments else []
+            for segment in segments:
+                if segment.bloom.might_contain(hashes):
+                    record = self._read(segment, recordid)
+                    if record is not None:
+                        self.cold_reads += 1
+                        return record
+                    self.false_positives += 1
+        return None
+
+    def _read(self, segment, recordid):
+        if segment.loaded:
+            self.loaded.move_to_end(segment.week)
+        else:
+            segment.load()
+            self.page_ins += 1
+            self.loaded[segment.week] = None
+            self.loaded_bytes += segment.resident
+            # le segment qui vient d'être chargé n'est jamais évincé
+            while self.loaded_bytes > self.cache_bytes and len(self.loaded) > 1:
+                week, _ = self.loaded.popitem(last=False)
+                self.segments[week].unload()
+                self.loaded_bytes -= self.segments[week].resident
+                self.evictions += 1
+        return segment.read(recordid)
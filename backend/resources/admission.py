@@ -0,0 +1,165 @@
+import math
+import threading
+import time
+from functools import wraps
+from flask import request, Response
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from database.loader import dataset_loader
+from resources.serializers import respond
+
+
+# Classes de routes, de la plus prioritaire à la moins prioritaire:
+# les consultations ciblées passent avant les exports de tout le dataset
+PRIORITIES = ("lookup", "bulk")
+
+
+class Overloaded(Exception):
+    """ Requête rejetée pour protéger la latence, avec le délai conseillé avant de réessayer """
+
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """ Limite le nombre de requêtes simultanées par classe de route
+
+        Une requête attend une place dans sa classe tant que la file d'attente
+        n'est pas pleine; au-delà, ou après `queue_timeout` secondes, elle est
+        rejetée. Une classe moins prioritaire n'est admise que si aucune requête
+        plus prioritaire n'attend.
+    """
+
+    def __init__(self, concurrency=None, queue=None, queue_timeout=5.0):
+        self.condition = threading.Condition()
+        self.concurrency = dict(concurrency or {"lookup": 16, "bulk": 2})
+        self.queue = dict(queue or {"lookup": 64, "bulk": 4})
+        self.queue_timeout = queue_timeout
+        self.active = {kind: 0 for kind in PRIORITIES}
+        self.waiting = {kind: 0 for kind in PRIORITIES}
+        self.service_time = {kind: 0.1 for kind in PRIORITIES}    # moyenne glissante en secondes
+        self.rejected = {kind: 0 for kind in PRIORITIES}
+
+    def retry_after(self, kind):
+        """ Délai estimé (en secondes) pour écouler la file d'attente de la classe """
+        backlog = self.waiting[kind] + self.active[kind]
+        return max(1, math.ceil(backlog / self.concurrency[kind] * self.service_time[kind]))
+
+    def _admissible(self, kind):
+        if self.active[kind] >= self.concurrency[kind]:
+            return False
+        higher = PRIORITIES[:PRIORITIES.index(kind)]
+        return not any(self.waiting[other] for other in higher)
+
+    def acquire(self, kind):
+        with self.condition:
+            if self._admissible(kind):
+                self.active[kind] += 1
+                return
+            if self.waiting[kind] >= self.queue[kind]:
+                self.rejected[kind] += 1
+                raise Overloaded(self.retry_after(kind))
+            self.waiting[kind] += 1
+            try:
+                admitted = self.condition.wait_for(lambda: self._admissible(kind), self.queue_timeout)
+            finally:
+                self.waiting[kind] -= 1
+            if not admitted:
+                self.rejected[kind] += 1
+                self.condition.notify_all()
+                raise Overloaded(self.retry_after(kind))
+            self.active[kind] += 1
+
+    def release(self, kind, elapsed):
+        with self.condition:
+            self.active[kind] -= 1
+            self.service_time[kind] = 0.8 * self.service_time[kind] + 0.2 * elapsed
+            self.condition.notify_all()
+
+
+class RateLimiter:
+    """ Seau à jetons par identité: `rate` requêtes par seconde, jusqu'à `burst` d'affilée """
+
+    def __init__(self, rate=20.0, burst=40):
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}       # identité -> (jetons, instant de la dernière requête)
+
+    def check(self, identity):
+        """ Consomme un jeton, retourne 0 ou le délai (en secondes) avant le prochain jeton """
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.buckets.get(identity, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self.buckets[identity] = (tokens, now)
+                return max(1, math.ceil((1 - tokens) / self.rate))
+            self.buckets[identity] = (tokens - 1, now)
+            if len(self.buckets) > 10000:
+                self._purge(now)
+            return 0
+
+    def _purge(self, now):
+        # un seau resté inutilisé assez longtemps pour être plein peut être oublié
+        full = self.burst / self.rate
+        for identity, (_, last) in list(self.buckets.items()):
+            if now - last > full:
+                del self.buckets[identity]
+
+
+controller = AdmissionController()
+rate_limiter = RateLimiter()
+
+
+def configure(config):
+    """ Applique la configuration de l'application aux limites d'admission """
+    controller.concurrency.update(config.get("ADMISSION_CONCURRENCY", {}))
+    controller.queue.update(config.get("ADMISSION_QUEUE", {}))
+    controller.queue_timeout = config.get("ADMISSION_QUEUE_TIMEOUT", controller.queue_timeout)
+    rate_limiter.rate = config.get("RATE_LIMIT_PER_SECOND", rate_limiter.rate)
+    rate_limiter.burst = config.get("RATE_LIMIT_BURST", rate_limiter.burst)
+
+
+def _identity():
+    """ Identité JWT de l'appelant, ou son adresse IP s'il n'est pas authentifié """
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        identity = None
+    return f"jwt:{identity}" if identity is not None else f"ip:{request.remote_addr}"
+
+
+def admission(kind):
+    """ Décorateur de méthode de Resource: dataset chargé, limite de débit par identité puis limite de concurrence
+
+        Une réponse en flux garde sa place jusqu'à la fin de l'envoi de son corps.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            if not dataset_loader.serving():
+                return respond({"message": "dataset loading"}, 503,
+                               headers={"Retry-After": str(dataset_loader.retry_after())})
+            retry_after = rate_limiter.check(_identity())
+            if retry_after:
+                return respond({"message": "too many requests"}, 429, headers={"Retry-After": str(retry_after)})
+            try:
+                controller.acquire(kind)
+            except Overloaded as e:
+                return respond({"message": "server overloaded"}, 503, headers={"Retry-After": str(e.retry_after)})
+            start = time.monotonic()
+            try:
+                response = method(*args, **kwargs)
+            except BaseException:
+                controller.release(kind, time.monotonic() - start)
+                raise
+            if isinstance(response, Response) and response.is_streamed:
+                # le corps est produit après le retour de la vue: la place est rendue à la fermeture
+                response.call_on_close(lambda: controller.release(kind, time.monotonic() - start))
+            else:
+                controller.release(kind, time.monotonic() - start)
+            return response
+        return wrapper
+    return decorator
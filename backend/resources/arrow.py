@@ -0,0 +1,52 @@
+from flask import request, Response
+from database.columnar import COLUMNS, iter_column_batches
+from database.store import NUMERIC_FIELDS
+from resources.serializers import SERIALIZERS
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+# Marque de fin d'un flux Arrow IPC
+_END_OF_STREAM = b"\xff\xff\xff\xff\x00\x00\x00\x00"
+
+
+def arrow_schema():
+    """ Schéma Arrow d'une entrée: champs numériques en float64, les autres en texte """
+    return pyarrow.schema([
+        (column, pyarrow.float64() if column in NUMERIC_FIELDS else pyarrow.string())
+        for column in COLUMNS
+    ])
+
+
+def wants_arrow():
+    """ Vrai si l'en-tête Accept préfère un flux Arrow IPC aux autres formats """
+    if pyarrow is None:
+        return False
+    return request.accept_mimetypes.best_match(list(SERIALIZERS) + [ARROW_STREAM]) == ARROW_STREAM
+
+
+def iter_record_batches(records, batch_size=65536):
+    """ Lots Arrow construits directement depuis la représentation en colonnes des entrées """
+    schema = arrow_schema()
+    for columns in iter_column_batches(records, batch_size):
+        yield pyarrow.record_batch(
+            [pyarrow.array(columns[column], type=schema.field(column).type) for column in COLUMNS],
+            schema=schema,
+        )
+
+
+def arrow_response(records, batch_size=65536):
+    """ Réponse en flux Arrow IPC, envoyée lot par lot sans construire de JSON """
+    def stream():
+        yield arrow_schema().serialize().to_pybytes()
+        for batch in iter_record_batches(records, batch_size):
+            yield batch.serialize().to_pybytes()
+        yield _END_OF_STREAM
+    response = Response(stream(), mimetype=ARROW_STREAM)
+    response.headers["Vary"] = "Accept"
+    return response
@@ -0,0 +1,112 @@
+from flask import request, Response
+from flask_restful import Resource
+from database.store import store, INDEXED_FIELDS
+from database.planner import Predicate, run_query
+from resources.serializers import respond, dumps
+from resources.admission import admission
+from resources.params import semaine_normalisee
+
+
+MAX_LOOKUPS = 1000
+NDJSON = "application/x-ndjson"
+
+
+def _lookup_key(lookup):
+    """ Clé normalisée d'une recherche (ValueError si invalide) """
+    if not isinstance(lookup, dict) or not lookup:
+        raise ValueError("each lookup must be a non-empty object")
+    if "recordid" in lookup:
+        if len(lookup) != 1:
+            raise ValueError("a recordid lookup cannot have other fields")
+        return (("recordid", str(lookup["recordid"])),)
+    unknown = [field for field in lookup if field not in INDEXED_FIELDS]
+    if unknown:
+        raise ValueError(f"unknown lookup field '{unknown[0]}'")
+    key = {field: str(value) for field, value in lookup.items()}
+    if "semaine_injection" in key:
+        key["semaine_injection"] = semaine_normalisee(key["semaine_injection"])
+    return tuple(sorted(key.items()))
+
+
+def _resolve(key):
+    """ Identifiants des entrées correspondant à une recherche """
+    if key[0][0] == "recordid":
+        return [key[0][1]] if key[0][1] in store else []
+    records, _, _ = run_query(store, [Predicate(field, "eq", value) for field, value in key])
+    return [record["recordid"] for record in records]
+
+
+def _iter_ndjson(keys):
+    """ Une ligne par recherche, chaque entrée n'étant envoyée qu'une fois """
+    sent = set()
+    resolved = {}
+    for position, key in enumerate(keys):
+        if key not in resolved:
+            resolved[key] = _resolve(key)
+        recordids = resolved[key]
+        records = []
+        for recordid in recordids:
+            record = store.get(recordid)
+            if recordid not in sent and record is not None:
+                sent.add(recordid)
+                records.append(record)
+        yield dumps({"lookup": position, "recordids": recordids, "records": records}) + b"\n"
+
+
+class BatchApi(Resource):
+    """ Classe permettant de faire plusieurs recherches en une seule requête """
+
+    method_decorators = [admission("lookup")]
+
+    def post(self):
+        """
+        Répond à une liste de recherches par recordid ou par commune, semaine et classe d'age
+        ---
+        tags:
+          - restful
+        parameters:
+          - in: body
+            name: body
+            schema:
+              id: Batch
+              properties:
+                lookups:
+                  type: array
+                  items:
+                    type: object
+                  description: Recherches, par exemple {"recordid": "..."} ou {"commune_residence": "01001", "semaine_injection": "2021-30", "classe_age": "65-74"}
+                stream:
+                  type: boolean
+                  default: false
+                  description: Envoie une ligne JSON par recherche (application/x-ndjson) au fil de l'eau
+        responses:
+          200:
+            description: Pour chaque recherche, la liste des recordid trouvés; chaque entrée n'est renvoyée qu'une fois
+          400:
+            description: Recherche invalide ou trop de recherches
+        """
+        body = request.get_json(silent=True)
+        lookups = body.get("lookups") if isinstance(body, dict) else None
+        if not isinstance(lookups, list):
+            return respond({"message": "lookups must be a list"}, 400)
+        if len(lookups) > MAX_LOOKUPS:
+            return respond({"message": f"at most {MAX_LOOKUPS} lookups per batch"}, 400)
+        try:
+            keys = [_lookup_key(lookup) for lookup in lookups]
+        except ValueError as e:
+            return respond({"message": str(e)}, 400)
+        if body.get("stream"):
+            return Response(_iter_ndjson(keys), mimetype=NDJSON)
+        # les recherches identiques ne sont résolues qu'une fois
+        resolved = {key: _resolve(key) for key in dict.fromkeys(keys)}
+        records = {}
+        for recordids in resolved.values():
+            for recordid in recordids:
+                if recordid not in records:
+                    record = store.get(recordid)
+                    if record is not None:
+                        records[recordid] = record
+        return respond({
+            "results": [{"lookup": position, "recordids": resolved[key]} for position, key in enumerate(keys)],
+            "records": records,
+        }, 200)
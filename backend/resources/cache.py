@@ -0,0 +1,149 @@
+import threading
+from collections import OrderedDict
+from flask import Response
+from flask_restful import Resource
+from database.store import store
+from resources.compression import ENCODERS, negotiate_encoding
+from resources.serializers import negotiate_mimetype, dumps, respond
+from resources.coalesce import flights
+
+
+# Dépendance d'une réponse à l'ensemble du dataset
+DATASET = ()
+
+
+def commune_tag(code_commune):
+    """ Dépendance d'une réponse aux entrées d'une commune """
+    return ("commune_residence", code_commune)
+
+
+def departement_tag(code_departement):
+    """ Dépendance d'une réponse aux entrées des communes d'un département """
+    return ("departement", code_departement)
+
+
+def semaine_tag(semaine):
+    """ Dépendance d'une réponse aux entrées d'une semaine d'injection """
+    return ("semaine_injection", semaine)
+
+
+class ResponseCache:
+    """ Cache LRU des corps de réponses sérialisés, borné en octets
+
+        Chaque entrée retient la génération des communes, semaines (ou du dataset)
+        dont elle dépend: une écriture sur une commune n'invalide que les entrées
+        qui en dépendent, vérifiées à la lecture.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.lock = threading.Lock()
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()    # clef -> (dépendances, corps)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, count=True):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and any(store.generation(*tag) != generation for tag, generation in entry[0]):
+                self._remove(key)
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += count
+                return None
+            self.entries.move_to_end(key)
+            self.hits += count
+            return entry[1]
+
+    def put(self, key, dependencies, body):
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (dependencies, body)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, key):
+        _, body = self.entries.pop(key)
+        self.size -= len(body)
+
+
+response_cache = ResponseCache()
+
+
+def cached_response(key, build, tags=(DATASET,), status=200):
+    """ Réponse mise en cache, sérialisée suivant Accept et compressée suivant Accept-Encoding
+
+        `key` identifie la route et ses paramètres, `tags` les communes, semaines
+        ou le dataset dont dépend la réponse. `build` calcule les données à
+        renvoyer; il n'est appelé que si le corps en cache n'est plus valide, et
+        une seule fois pour toutes les requêtes identiques arrivant pendant le calcul.
+    """
+    mimetype = negotiate_mimetype()
+    encoding = negotiate_encoding()
+    body = response_cache.get((key, mimetype, encoding))
+    if body is None:
+        # générations lues avant le calcul: une écriture concurrente invalide l'entrée
+        dependencies = tuple((tag, store.generation(*tag)) for tag in tags)
+
+        def compute():
+            raw = response_cache.get((key, mimetype, None), count=False)
+            if raw is None:
+                raw = dumps(build(), mimetype)
+                response_cache.put((key, mimetype, None), dependencies, raw)
+            if encoding is None:
+                return raw
+            encoded = ENCODERS[encoding](raw)
+            response_cache.put((key, mimetype, encoding), dependencies, encoded)
+            return encoded
+        body = flights.do((key, mimetype, encoding, dependencies), compute)
+    response = Response(body, status=status, mimetype=mimetype)
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept, Accept-Encoding"
+    return response
+
+
+class CacheApi(Resource):
+    """ Classe permettant de consulter les statistiques du cache des réponses """
+
+    def get(self):
+        """Retourne les statistiques du cache des réponses
+        ---
+        tags:
+          - restful
+        responses:
+          200:
+            description: Nombre d'entrées, taille en octets, succès, échecs, évictions et invalidations du cache, calculs partagés entre requêtes identiques, entrées en mémoire et sur disque du stockage
+        """
+        stats = response_cache.stats()
+        stats["single_flight"] = flights.stats()
+        stats["store_tiers"] = store.records.stats()
+        return respond(stats, 200)
@@ -0,0 +1,66 @@
+from flask import request
+from flask_restful import Resource
+from database.store import store
+from database.changes import change_log, parse_timestamp, format_timestamp
+from resources.serializers import respond
+from resources.admission import admission
+
+
+MAX_LIMIT = 10000
+
+
+class ChangesApi(Resource):
+    """ Classe permettant de récupérer les entrées modifiées depuis une date """
+
+    method_decorators = [admission("lookup")]
+
+    def get(self):
+        """Retourne les entrées ajoutées, modifiées ou supprimées depuis une date
+        ---
+        tags:
+          - restful
+        parameters:
+          - in: query
+            name: since
+            required: true
+            type: string
+            description: Date ISO 8601 (ou secondes epoch) de la dernière synchronisation
+          - in: query
+            name: cursor
+            type: integer
+            description: Curseur renvoyé par la page précédente
+          - in: query
+            name: limit
+            type: integer
+            default: 1000
+            description: Nombre maximal de modifications par page
+        responses:
+          200:
+            description: Les modifications, une par recordid (la dernière), et le curseur de la page suivante
+          400:
+            description: Date, curseur ou limite invalide
+        """
+        since = parse_timestamp(request.args.get("since"))
+        if since is None:
+            return respond({"message": "since must be an ISO 8601 date or epoch seconds"}, 400)
+        try:
+            cursor = int(request.args["cursor"]) if "cursor" in request.args else None
+            limit = min(max(int(request.args.get("limit", 1000)), 1), MAX_LIMIT)
+        except ValueError:
+            return respond({"message": "cursor and limit must be integers"}, 400)
+        page, next_cursor = change_log.since(since, cursor, limit)
+        changes = []
+        for _, modified, recordid, op in page:
+            change = {"recordid": recordid, "op": op, "modified": format_timestamp(modified)}
+            if op == "upsert":
+                record = store.get(recordid)
+                if record is None:
+                    continue
+                change["record"] = record
+            changes.append(change)
+        return respond({
+            "changes": changes,
+            "cursor": next_cursor,
+            # avant le début du journal, les suppressions ne sont pas connues: resynchronisation complète
+            "complete": since >= change_log.started,
+        }, 200)
@@ -0,0 +1,61 @@
+import threading
+
+
+class _Call:
+    """ Calcul en cours, partagé par toutes les requêtes identiques """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """ Regroupe les calculs identiques lancés en même temps
+
+        Le premier appelant d'une clef effectue le calcul, les appelants suivants
+        attendent sa fin et reçoivent le même résultat (ou la même exception).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}         # clef -> calcul en cours
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key, compute):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.executed += 1
+            else:
+                call.waiters += 1
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = compute()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        return {
+            "in_flight": len(self.calls),
+            "executed": self.executed,
+            "shared": self.shared,
+        }
+
+
+flights = SingleFlight()
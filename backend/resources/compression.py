@@ -0,0 +1,32 @@
+import gzip
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _zstd(body):
+    # un compresseur par appel: ZstdCompressor n'est pas partageable entre threads
+    return zstandard.ZstdCompressor(level=3).compress(body)
+
+
+# Encodages supportés, du plus efficace au moins efficace
+ENCODERS = {}
+if zstandard is not None:
+    ENCODERS["zstd"] = _zstd
+if brotli is not None:
+    ENCODERS["br"] = lambda body: brotli.compress(body, quality=5)
+ENCODERS["gzip"] = lambda body: gzip.compress(body, compresslevel=6)
+
+
+def negotiate_encoding():
+    """ Choisit l'encodage de la réponse suivant l'en-tête Accept-Encoding, None si aucun """
+    encoding = request.accept_encodings.best_match(list(ENCODERS) + ["identity"])
+    return encoding if encoding in ENCODERS else None
@@ -0,0 +1,62 @@
+from flask import request
+from flask_restful import Resource
+from database.cube import cube, LEVELS
+from resources.serializers import respond
+from resources.params import bornes
+from resources.cache import cached_response, commune_tag, departement_tag, DATASET
+from resources.admission import admission
+
+
+class CubeApi(Resource):
+    """ Classe permettant de lire les agrégats par commune, département, région ou national """
+
+    method_decorators = [admission("lookup")]
+
+    def get(self):
+        """Retourne les sommes et taux par semaine et classe d'age d'une commune, d'un département, d'une région ou de la France
+        ---
+        tags:
+          - restful
+        parameters:
+          - in: query
+            name: niveau
+            type: string
+            enum: [commune, departement, region, national]
+            default: national
+          - in: query
+            name: code
+            type: string
+            description: le code de la commune, du département ou de la région (sauf niveau national)
+          - in: query
+            name: classe_age
+            type: string
+            description: la classe d'age, * pour toutes classes confondues (chaque classe si absente)
+          - in: query
+            name: debut
+            type: string
+            description: première semaine d'injection incluse (AAAA-SS)
+          - in: query
+            name: fin
+            type: string
+            description: dernière semaine d'injection incluse (AAAA-SS)
+        responses:
+          200:
+            description: Une ligne par semaine et classe d'age, avec le nombre d'entrées, les sommes des compteurs et les taux
+          400:
+            description: Niveau, code ou semaine invalide
+        """
+        niveau = request.args.get("niveau", "national")
+        if niveau not in LEVELS:
+            return respond({"message": f"niveau must be one of {', '.join(LEVELS)}"}, 400)
+        code = request.args.get("code")
+        if niveau != "national" and not code:
+            return respond({"message": f"code is required for niveau '{niveau}'"}, 400)
+        try:
+            debut, fin = bornes()
+        except ValueError as e:
+            return respond({"message": str(e)}, 400)
+        classe_age = request.args.get("classe_age")
+        key = ("cube", niveau, code, classe_age, debut, fin)
+        tag = {"commune": commune_tag, "departement": departement_tag}.get(niveau)
+        return cached_response(key, lambda: cube.slice(niveau, code, debut, fin, classe_age),
+                               tags=[tag(code) if tag is not None else DATASET])
@@ -0,0 +1,184 @@
+import queue
+import threading
+from collections import deque
+from flask import request, Response
+from flask_restful import Resource
+from database.store import week_key
+from resources.serializers import dumps, respond
+
+
+class EventBroadcaster:
+    """ Diffuse les modifications du dataset aux clients Server-Sent Events
+
+        Les écritures sont regroupées pendant `delay` secondes puis publiées en
+        quelques événements (nouvelle semaine, communes modifiées, version),
+        encodés une seule fois et déposés par publish() dans la file de chaque
+        client inscrit. Un client n'interroge rien: sa réponse reste bloquée sur
+        sa file jusqu'au prochain événement ou au prochain keepalive.
+    """
+
+    def __init__(self, delay=0.5, history=256, keepalive=15.0, max_clients=32):
+        self.lock = threading.Lock()
+        self.delay = delay
+        self.keepalive = keepalive
+        self.max_clients = max_clients
+        self.events = deque(maxlen=history)     # (identifiant, événement SSE encodé)
+        self.last_id = 0
+        self.subscribers = set()                # files des clients connectés
+        self.store = None
+        self.pending_lock = threading.Lock()
+        self.pending_communes = set()
+        self.pending_weeks = set()
+        self.pending_reload = False
+        self.flush_scheduled = False
+
+    def attach(self, store):
+        self.store = store
+        store.subscribe(self.on_change)
+
+    def configure(self, config):
+        self.delay = config.get("EVENTS_DELAY", self.delay)
+        self.keepalive = config.get("EVENTS_KEEPALIVE", self.keepalive)
+        self.max_clients = config.get("EVENTS_MAX_CLIENTS", self.max_clients)
+
+    def on_change(self, event, record, old_fields):
+        # appelée sous le verrou du stockage: on ne fait que noter la modification
+        with self.pending_lock:
+            if event == "load":
+                self.pending_reload = True
+            elif event == "add_many":
+                counts = {}
+                for added in record:
+                    fields = added["fields"]
+                    if "commune_residence" in fields:
+                        self.pending_communes.add(fields["commune_residence"])
+                    key = week_key(fields.get("semaine_injection"))
+                    if key is not None:
+                        counts.setdefault(key, [fields["semaine_injection"], 0])[1] += 1
+                # semaine nouvelle: toutes ses entrées viennent de cet ajout
+                for key, (semaine, count) in counts.items():
+                    if len(self.store.week_index.get(key, ())) == count:
+                        self.pending_weeks.add(semaine)
+            else:
+                fields = record["fields"]
+                for values in (fields, old_fields or {}):
+                    if "commune_residence" in values:
+                        self.pending_communes.add(values["commune_residence"])
+                key = week_key(fields.get("semaine_injection"))
+                if event == "add" and key is not None and len(self.store.week_index.get(key, ())) == 1:
+                    self.pending_weeks.add(fields["semaine_injection"])
+            if not self.flush_scheduled:
+                self.flush_scheduled = True
+                timer = threading.Timer(self.delay, self.flush)
+                timer.daemon = True
+                timer.start()
+
+    def flush(self):
+        """ Publie les modifications accumulées depuis la dernière publication """
+        with self.pending_lock:
+            communes, self.pending_communes = self.pending_communes, set()
+            weeks, self.pending_weeks = self.pending_weeks, set()
+            reload, self.pending_reload = self.pending_reload, False
+            self.flush_scheduled = False
+        version = self.store.version
+        if reload:
+            self.publish("reload", {"version": version})
+        for semaine in sorted(weeks):
+            self.publish("semaine", {"semaine_injection": semaine, "version": version})
+        if communes and not reload:
+            self.publish("communes", {"communes": sorted(communes), "version": version})
+        self.publish("version", {"version": version})
+
+    def publish(self, event, data):
+        with self.lock:
+            self.last_id += 1
+            message = f"id: {self.last_id}\nevent: {event}\ndata: ".encode("utf-8") + dumps(data) + b"\n\n"
+            self.events.append((self.last_id, message))
+            for client in self.subscribers:
+                client.put(message)
+
+    @property
+    def clients(self):
+        return len(self.subscribers)
+
+    def connect(self, last_id=None):
+        """ Inscrit un nouveau client et retourne sa file, None si le nombre maximal est atteint
+
+            Avec `last_id` (en-tête Last-Event-ID), la file reçoit d'abord les
+            événements manqués; si ceux-ci ne sont plus dans l'historique, ou si
+            l'identifiant est postérieur au dernier publié (serveur redémarré),
+            elle reçoit un événement reload.
+        """
+        with self.lock:
+            if len(self.subscribers) >= self.max_clients:
+                return None
+            client = queue.SimpleQueue()
+            if last_id is not None and last_id != self.last_id:
+                oldest = self.events[0][0] if self.events else self.last_id + 1
+                if last_id > self.last_id or last_id + 1 < oldest:
+                    # l'identifiant du reload remet à jour le Last-Event-ID du client
+                    client.put(f"id: {self.last_id}\nevent: reload\ndata: ".encode("utf-8")
+                               + dumps({"version": self.store.version}) + b"\n\n")
+                else:
+                    for event_id, message in self.events:
+                        if event_id > last_id:
+                            client.put(message)
+            self.subscribers.add(client)
+            return client
+
+    def disconnect(self, client):
+        with self.lock:
+            self.subscribers.discard(client)
+
+    def stream(self, client):
+        """ Générateur des événements déposés dans la file `client` """
+        yield b"retry: 5000\n\n"
+        while True:
+            try:
+                messages = [client.get(timeout=self.keepalive)]
+            except queue.Empty:
+                yield b": keepalive\n\n"
+                continue
+            # les événements publiés entre-temps partent dans le même envoi
+            while True:
+                try:
+                    messages.append(client.get_nowait())
+                except queue.Empty:
+                    break
+            yield b"".join(messages)
+
+
+broadcaster = EventBroadcaster()
+
+
+class EventsApi(Resource):
+    """ Classe permettant de suivre les modifications du dataset en Server-Sent Events """
+
+    def get(self):
+        """Flux Server-Sent Events des modifications du dataset
+        ---
+        tags:
+          - restful
+        parameters:
+          - in: header
+            name: Last-Event-ID
+            type: integer
+            description: Identifiant du dernier événement reçu, pour reprendre après une déconnexion
+        responses:
+          200:
+            description: Flux text/event-stream des événements semaine (nouvelle semaine disponible), communes (communes modifiées), version et reload (dataset rechargé)
+          503:
+            description: Trop de clients connectés
+        """
+        try:
+            last_id = int(request.headers["Last-Event-ID"]) if "Last-Event-ID" in request.headers else None
+        except ValueError:
+            last_id = None
+        client = broadcaster.connect(last_id)
+        if client is None:
+            return respond({"message": "too many event stream clients"}, 503, headers={"Retry-After": "30"})
+        response = Response(broadcaster.stream(client), mimetype="text/event-stream")
+        response.call_on_close(lambda: broadcaster.disconnect(client))
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
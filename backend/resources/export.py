@@ -0,0 +1,131 @@
+import csv
+import io
+from itertools import islice
+from flask import request, Response
+from flask_restful import Resource
+from database.store import store, FIELDS
+from database.planner import parse_predicates, iter_query
+from database.columnar import COLUMNS
+from resources.serializers import respond
+from resources.admission import admission
+from resources import arrow
+
+try:
+    import pyarrow.parquet as parquet
+except ImportError:
+    parquet = None
+
+
+CSV_CHUNK_ROWS = 10000
+PARQUET_ROW_GROUP_ROWS = 65536
+
+
+def iter_csv(records, chunk_rows=CSV_CHUNK_ROWS):
+    """ Produit le CSV des entrées (liste ou itérateur) morceau par morceau, en-tête compris """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, chunk_rows))
+        if not chunk:
+            break
+        writer.writerows(
+            [record.get("recordid"), record.get("record_timestamp")] + [record["fields"].get(field) for field in FIELDS]
+            for record in chunk
+        )
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """ Fichier en écriture seule dont le contenu est vidé après chaque groupe de lignes """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_parquet(records, row_group_rows=PARQUET_ROW_GROUP_ROWS):
+    """ Produit le fichier Parquet des entrées groupe de lignes par groupe de lignes """
+    sink = _ChunkSink()
+    writer = parquet.ParquetWriter(sink, arrow.arrow_schema())
+    for batch in arrow.iter_record_batches(records, row_group_rows):
+        writer.write_batch(batch, row_group_size=row_group_rows)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+class ExportApi(Resource):
+    """ Classe permettant d'exporter les entrées filtrées dans un fichier """
+
+    method_decorators = [admission("bulk")]
+
+    def get(self):
+        """Exporte les entrées vérifiant les filtres en CSV ou en Parquet
+        ---
+        tags:
+          - restful
+        parameters:
+          - in: query
+            name: format
+            type: string
+            enum: [csv, parquet]
+            default: csv
+            description: Format du fichier exporté
+          - in: query
+            name: commune_residence
+            type: string
+            description: le code de la commune
+          - in: query
+            name: semaine_injection
+            type: string
+            description: la semaine d'injection
+          - in: query
+            name: classe_age
+            type: string
+            description: la classe d'age (les autres filtres de /api/vaccination/query sont aussi acceptés)
+        responses:
+          200:
+            description: Fichier envoyé par morceaux (CSV) ou par groupes de lignes (Parquet)
+          400:
+            description: Format ou filtre invalide
+        """
+        file_format = request.args.get("format", "csv")
+        if file_format not in ("csv", "parquet"):
+            return respond({"message": f"unknown format '{file_format}'"}, 400)
+        if file_format == "parquet" and parquet is None:
+            return respond({"message": "parquet export is not available"}, 400)
+        try:
+            predicates = parse_predicates(request.args, reserved=("format",))
+        except ValueError as e:
+            return respond({"message": str(e)}, 400)
+        records = iter_query(store, predicates)
+        if file_format == "csv":
+            response = Response(iter_csv(records), mimetype="text/csv")
+        else:
+            response = Response(iter_parquet(records), mimetype="application/vnd.apache.parquet")
+        filename = f"donnees-de-vaccination-par-commune.{file_format}"
+        response.headers["Content-Disposition"] = f"attachment; filename={filename}"
+        return response
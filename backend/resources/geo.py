@@ -0,0 +1,165 @@
+from flask import request
+from flask_restful import Resource
+from database.store import store, departement_of
+from database.cube import cube, ALL_AGES
+from resources.serializers import respond
+from resources.params import bornes, semaine_normalisee
+from resources.cache import cached_response, departement_tag
+from resources.admission import admission
+
+
+def _region_departements(code_region):
+    return sorted(departement for departement, region in cube.regions.items() if region == code_region)
+
+
+class DepartementListe(Resource):
+
+    method_decorators = [admission("lookup")]
+
+    def get(self):
+        """Retourne la liste des codes des départements
+        ---
+        tags:
+          - restful
+        responses:
+          200:
+            description: Liste des codes des départements présents dans le dataset
+        """
+        return cached_response(("departements",), lambda: {
+            "departements": sorted({departement_of(code) for code in store.communes()}),
+        })
+
+
+class Departement(Resource):
+
+    method_decorators = [admission("lookup")]
+
+    def get(self, code_departement):
+        """Retourne les agrégats d'un département et de ses communes
+        ---
+        tags:
+          - restful
+        parameters:
+          - in: path
+            name: code_departement
+            required: true
+            description: le code du département (2 caractères, 3 pour l'outre-mer)
+            type: string
+          - in: query
+            name: classe_age
+            type: string
+            description: la classe d'age, * pour toutes classes confondues (chaque classe si absente)
+          - in: query
+            name: debut
+            type: string
+            description: première semaine d'injection incluse (AAAA-SS)
+          - in: query
+            name: fin
+            type: string
+            description: dernière semaine d'injection incluse (AAAA-SS)
+          - in: query
+            name: semaine_injection
+            type: string
+            description: ajoute le détail par commune pour cette semaine
+        responses:
+          200:
+            description: Les communes du département, ses agrégats par semaine et classe d'age et, pour une semaine donnée, ceux de chaque commune
+          400:
+            description: Semaine invalide
+          404:
+            description: Aucune commune dans ce département
+        """
+        try:
+            debut, fin = bornes()
+            semaine = request.args.get("semaine_injection")
+            semaine = semaine_normalisee(semaine) if semaine else None
+        except ValueError as e:
+            return respond({"message": str(e)}, 400)
+        code_departement = str(code_departement)
+        communes = store.communes(code_departement)
+        if not communes or departement_of(communes[0]) != code_departement:
+            return respond({"message": "departement not found"}, 404)
+        classe_age = request.args.get("classe_age")
+
+        def departement():
+            data = {
+                "departement": code_departement,
+                "region": cube.regions.get(code_departement),
+                "communes": communes,
+                "agregats": cube.slice("departement", code_departement, debut, fin, classe_age),
+            }
+            if semaine:
+                data["par_commune"] = [
+                    dict(cube.cell("commune", code, semaine, classe_age or ALL_AGES) or {}, commune_residence=code)
+                    for code in data["communes"]
+                ]
+            return data
+        key = ("departement", code_departement, classe_age, debut, fin, semaine)
+        return cached_response(key, departement, tags=[departement_tag(code_departement)])
+
+
+class Region(Resource):
+
+    method_decorators = [admission("lookup")]
+
+    def get(self, code_region):
+        """Retourne les agrégats d'une région et de ses départements
+        ---
+        tags:
+          - restful
+        parameters:
+          - in: path
+            name: code_region
+            required: true
+            description: le code INSEE de la région (table REGIONS de la configuration)
+            type: string
+          - in: query
+            name: classe_age
+            type: string
+            description: la classe d'age, * pour toutes classes confondues (chaque classe si absente)
+          - in: query
+            name: debut
+            type: string
+            description: première semaine d'injection incluse (AAAA-SS)
+          - in: query
+            name: fin
+            type: string
+            description: dernière semaine d'injection incluse (AAAA-SS)
+          - in: query
+            name: semaine_injection
+            type: string
+            description: ajoute le détail par département pour cette semaine
+        responses:
+          200:
+            description: Les départements de la région, ses agrégats par semaine et classe d'age et, pour une semaine donnée, ceux de chaque département
+          400:
+            description: Semaine invalide
+          404:
+            description: Région inconnue
+        """
+        try:
+            debut, fin = bornes()
+            semaine = request.args.get("semaine_injection")
+            semaine = semaine_normalisee(semaine) if semaine else None
+        except ValueError as e:
+            return respond({"message": str(e)}, 400)
+        code_region = str(code_region)
+        departements = _region_departements(code_region)
+        if not departements:
+            return respond({"message": "region not found"}, 404)
+        classe_age = request.args.get("classe_age")
+
+        def region():
+            data = {
+                "region": code_region,
+                "departements": departements,
+                "agregats": cube.slice("region", code_region, debut, fin, classe_age),
+            }
+            if semaine:
+                data["par_departement"] = [
+                    dict(cube.cell("departement", code, semaine, classe_age or ALL_AGES) or {}, departement=code)
+                    for code in departements
+                ]
+            return data
+        key = ("region", code_region, classe_age, debut, fin, semaine)
+        return cached_response(key, region, tags=[departement_tag(code) for code in departements])
@@ -0,0 +1,47 @@
+from flask_restful import Resource
+from database.loader import dataset_loader
+from database.store import store
+from resources.serializers import respond
+
+
+class Health(Resource):
+    """ Classe indiquant si le processus est vivant, que le dataset soit chargé ou non """
+
+    def get(self):
+        """Retourne l'état du processus (liveness)
+        ---
+        tags:
+          - restful
+        responses:
+          200:
+            description: Le processus répond, phase du chargement du dataset
+          500:
+            description: Le chargement du dataset a échoué
+        """
+        phase = dataset_loader.phase
+        if phase == "failed":
+            return respond({"status": "failed", "phase": phase, "error": dataset_loader.error}, 500)
+        return respond({"status": "ok", "phase": phase}, 200)
+
+
+class Ready(Resource):
+    """ Classe indiquant si le dataset est chargé et les routes de données disponibles """
+
+    def get(self):
+        """Retourne l'état du chargement du dataset (readiness)
+        ---
+        tags:
+          - restful
+        responses:
+          200:
+            description: Dataset chargé et index construits, nombre d'entrées et durée du chargement
+          503:
+            description: Chargement en cours (avancement, délai conseillé dans Retry-After) ou échoué
+        """
+        stats = dataset_loader.stats()
+        stats["ready"] = stats["phase"] == "ready"
+        stats["indexes_built"] = stats["ready"]
+        stats["store_records"] = len(store)
+        if stats["ready"]:
+            return respond(stats, 200)
+        return respond(stats, 503, headers={"Retry-After": str(dataset_loader.retry_after())})
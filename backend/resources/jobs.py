@@ -0,0 +1,281 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from flask import request, send_file
+from flask_restful import Resource
+from werkzeug.datastructures import MultiDict
+from database.store import store, FIELDS
+from database.planner import parse_predicates, run_query, iter_query
+from database.aggregate import aggregate
+from resources.serializers import respond, dumps
+from resources.admission import admission
+from resources.export import iter_csv, iter_parquet, parquet
+
+
+# Types de fichiers produits par les tâches
+RESULT_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "json": "application/json",
+}
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    """ Tâche de fond: export ou agrégation des entrées filtrées """
+
+    def __init__(self, spec, key):
+        self.id = uuid.uuid4().hex
+        self.spec = spec
+        self.key = key              # empreinte de la tâche et de la version du dataset
+        self.status = "queued"      # queued, running, done ou failed
+        self.error = None
+        self.path = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def to_dict(self):
+        job = {
+            "job_id": self.id,
+            "status": self.status,
+            "spec": self.spec,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        if self.error is not None:
+            job["error"] = self.error
+        if self.status == "done":
+            job["result"] = f"/api/vaccination/jobs/{self.id}/result"
+        return job
+
+
+def _validate(spec):
+    """ Vérifie la description d'une tâche, retourne ses prédicats (ValueError si invalide) """
+    if not isinstance(spec, dict):
+        raise ValueError("the job must be a JSON object")
+    if spec.get("type") == "export":
+        if spec.get("format", "csv") not in ("csv", "parquet"):
+            raise ValueError(f"unknown format '{spec.get('format')}'")
+        if spec.get("format") == "parquet" and parquet is None:
+            raise ValueError("parquet export is not available")
+    elif spec.get("type") == "aggregate":
+        group_by = spec.get("group_by", [])
+        if not isinstance(group_by, list) or any(field not in FIELDS for field in group_by):
+            raise ValueError("group_by must be a list of fields")
+    else:
+        raise ValueError("the job type must be 'export' or 'aggregate'")
+    filters = spec.get("filters", {})
+    if not isinstance(filters, dict):
+        raise ValueError("filters must be an object")
+    return parse_predicates(MultiDict([(key, str(value)) for key, value in filters.items()]))
+
+
+class JobManager:
+    """ Exécute les tâches longues sur un pool de threads dédié
+
+        Les résultats sont écrits sur disque et conservés `ttl` secondes; une
+        tâche identique sur la même version du dataset réutilise le résultat.
+    """
+
+    def __init__(self, directory="jobs", workers=2, max_pending=20, ttl=3600):
+        self.lock = threading.Lock()
+        self.directory = directory
+        self.workers = workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.jobs = {}          # identifiant -> tâche
+        self.by_key = {}        # empreinte -> tâche
+        self.executor = None
+
+    def configure(self, config):
+        self.directory = config.get("JOBS_DIRECTORY", self.directory)
+        self.workers = config.get("JOBS_WORKERS", self.workers)
+        self.max_pending = config.get("JOBS_MAX_PENDING", self.max_pending)
+        self.ttl = config.get("JOBS_RESULT_TTL", self.ttl)
+
+    def submit(self, spec):
+        predicates = _validate(spec)
+        fingerprint = json.dumps(spec, sort_keys=True) + f"@{store.version}"
+        key = hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()
+        with self.lock:
+            job = self.by_key.get(key)
+            if job is not None and job.status != "failed":
+                return job
+            pending = sum(1 for job in self.jobs.values() if job.status in ("queued", "running"))
+            if pending >= self.max_pending:
+                raise JobQueueFull()
+            if self.executor is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+            job = Job(spec, key)
+            self.jobs[job.id] = job
+            self.by_key[key] = job
+        self.executor.submit(self._run, job, predicates)
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def purge(self):
+        """ Supprime les tâches terminées depuis plus de `ttl` secondes et leurs fichiers """
+        limit = time.time() - self.ttl
+        with self.lock:
+            expired = [job for job in self.jobs.values() if job.finished is not None and job.finished < limit]
+            for job in expired:
+                del self.jobs[job.id]
+                if self.by_key.get(job.key) is job:
+                    del self.by_key[job.key]
+        for job in expired:
+            if job.path is not None and os.path.exists(job.path):
+                os.remove(job.path)
+        return len(expired)
+
+    def _run(self, job, predicates):
+        job.status = "running"
+        job.started = time.time()
+        try:
+            if job.spec["type"] == "export":
+                extension = job.spec.get("format", "csv")
+                records = iter_query(store, predicates)
+                chunks = iter_csv(records) if extension == "csv" else iter_parquet(records)
+            else:
+                extension = "json"
+                records, _, _ = run_query(store, predicates)
+                chunks = [dumps(aggregate(records, job.spec.get("group_by", [])))]
+            path = os.path.join(self.directory, f"{job.id}.{extension}")
+            with open(path + ".tmp", "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            os.replace(path + ".tmp", path)
+            job.path = path
+            job.status = "done"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        job.finished = time.time()
+
+
+jobs = JobManager()
+
+
+class JobsApi(Resource):
+    """ Classe permettant de soumettre une tâche de fond """
+
+    method_decorators = [admission("lookup")]
+
+    def post(self):
+        """
+        Soumettre un export ou une agrégation exécuté en tâche de fond
+        ---
+        tags:
+          - restful
+        parameters:
+          - in: body
+            name: body
+            schema:
+              id: Job
+              properties:
+                type:
+                  type: string
+                  enum: [export, aggregate]
+                  default: export
+                format:
+                  type: string
+                  enum: [csv, parquet]
+                  default: csv
+                  description: Format du fichier pour un export
+                group_by:
+                  type: array
+                  items:
+                    type: string
+                  default: [semaine_injection, classe_age]
+                  description: Champs de regroupement pour une agrégation
+                filters:
+                  type: object
+                  description: Filtres de /api/vaccination/query, par exemple {"classe_age": "65-74"}
+        responses:
+          202:
+            description: La tâche a été acceptée (ou une tâche identique existe déjà)
+          400:
+            description: Description de la tâche invalide
+          503:
+            description: Trop de tâches en attente
+        """
+        try:
+            job = jobs.submit(request.get_json(silent=True))
+        except ValueError as e:
+            return respond({"message": str(e)}, 400)
+        except JobQueueFull:
+            return respond({"message": "too many pending jobs"}, 503, headers={"Retry-After": "30"})
+        return respond(job.to_dict(), 202, headers={"Location": f"/api/vaccination/jobs/{job.id}"})
+
+
+class JobApi(Resource):
+    """ Classe permettant de suivre une tâche de fond """
+
+    method_decorators = [admission("lookup")]
+
+    def get(self, job_id):
+        """Retourne l'état d'une tâche de fond
+        ---
+        tags:
+          - restful
+        parameters:
+          - in: path
+            name: job_id
+            required: true
+            description: L'identifiant de la tâche
+            type: string
+        responses:
+          200:
+            description: L'état de la tâche (queued, running, done ou failed) et le lien vers son résultat
+          404:
+            description: La tâche n'existe pas ou a expiré
+        """
+        job = jobs.get(job_id)
+        if job is None:
+            return respond({"message": "job not found"}, 404)
+        return respond(job.to_dict(), 200)
+
+
+class JobResultApi(Resource):
+    """ Classe permettant de télécharger le résultat d'une tâche de fond """
+
+    method_decorators = [admission("lookup")]
+
+    def get(self, job_id):
+        """Télécharge le résultat d'une tâche terminée
+        ---
+        tags:
+          - restful
+        parameters:
+          - in: path
+            name: job_id
+            required: true
+            description: L'identifiant de la tâche
+            type: string
+        responses:
+          200:
+            description: Le fichier produit par la tâche
+          404:
+            description: La tâche n'existe pas ou a expiré
+          409:
+            description: La tâche n'est pas terminée
+        """
+        job = jobs.get(job_id)
+        if job is None or (job.status == "done" and not os.path.exists(job.path)):
+            return respond({"message": "job not found"}, 404)
+        if job.status != "done":
+            return respond({"message": f"job is {job.status}"}, 409)
+        extension = job.path.rsplit(".", 1)[1]
+        return send_file(os.path.abspath(job.path), mimetype=RESULT_TYPES[extension], as_attachment=True,
+                         download_name=f"donnees-de-vaccination-par-commune.{extension}")
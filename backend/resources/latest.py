@@ -0,0 +1,134 @@
+import datetime
+from flask import request
+from flask_restful import Resource
+from database.store import store, week_key, week_label_of
+from database.latest import latest_index
+from resources.serializers import respond
+from resources.cache import cached_response, commune_tag, departement_tag, DATASET
+from resources.admission import admission
+
+
+def _as_of():
+    """ Semaine AAAASS et date_reference maximales des paramètres semaine, date et date_reference
+
+        ValueError si un paramètre est invalide.
+    """
+    as_of = None
+    if request.args.get("semaine"):
+        as_of = week_key(request.args["semaine"])
+        if as_of is None:
+            raise ValueError(f"'{request.args['semaine']}' is not a week (YYYY-WW)")
+    elif request.args.get("date"):
+        try:
+            date = datetime.datetime.strptime(request.args["date"], "%Y-%m-%d")
+        except ValueError:
+            raise ValueError(f"'{request.args['date']}' is not a date (YYYY-MM-DD)")
+        as_of = week_key(week_label_of(date))
+    date_reference = request.args.get("date_reference") or None
+    if date_reference is not None:
+        try:
+            datetime.datetime.strptime(date_reference, "%Y-%m-%d")
+        except ValueError:
+            raise ValueError(f"'{date_reference}' is not a date (YYYY-MM-DD)")
+    return as_of, date_reference
+
+
+class Snapshot(Resource):
+
+    method_decorators = [admission("bulk")]
+
+    def get(self):
+        """Retourne l'entrée la plus récente de chaque commune et classe d'age
+        ---
+        tags:
+          - restful
+        parameters:
+          - in: query
+            name: semaine
+            type: string
+            description: dernière semaine d'injection prise en compte (AAAA-SS)
+          - in: query
+            name: date
+            type: string
+            description: dernière date prise en compte (AAAA-MM-JJ), à la place de semaine
+          - in: query
+            name: date_reference
+            type: string
+            description: ignore les entrées dont la date_reference est postérieure (AAAA-MM-JJ)
+          - in: query
+            name: classe_age
+            type: string
+            description: la classe d'age (toutes si absente)
+          - in: query
+            name: departement
+            type: string
+            description: le code du département (toute la France si absent)
+        responses:
+          200:
+            description: Liste des entrées les plus récentes, triées par commune et classe d'age
+            schema:
+              $ref: '#/definitions/donnees-de-vaccination'
+          400:
+            description: Semaine ou date invalide
+        """
+        try:
+            as_of, date_reference = _as_of()
+        except ValueError as e:
+            return respond({"message": str(e)}, 400)
+        classe_age = request.args.get("classe_age")
+        departement = request.args.get("departement") or ""
+        key = ("snapshot", as_of, date_reference, classe_age, departement)
+        return cached_response(key, lambda: latest_index.snapshot(as_of, date_reference, classe_age, departement),
+                               tags=[departement_tag(departement) if departement else DATASET])
+
+
+class Dernier(Resource):
+
+    method_decorators = [admission("lookup")]
+
+    def get(self, code_commune):
+        """Retourne l'entrée la plus récente de chaque classe d'age d'une commune
+        ---
+        tags:
+          - restful
+        parameters:
+          - in: path
+            name: code_commune
+            required: true
+            description: le code de la commune (commune_residence)
+            type: string
+          - in: query
+            name: semaine
+            type: string
+            description: dernière semaine d'injection prise en compte (AAAA-SS)
+          - in: query
+            name: date
+            type: string
+            description: dernière date prise en compte (AAAA-MM-JJ), à la place de semaine
+          - in: query
+            name: date_reference
+            type: string
+            description: ignore les entrées dont la date_reference est postérieure (AAAA-MM-JJ)
+        responses:
+          200:
+            description: Liste des entrées les plus récentes de la commune, une par classe d'age
+            schema:
+              $ref: '#/definitions/donnees-de-vaccination'
+          400:
+            description: Semaine ou date invalide
+        """
+        try:
+            as_of, date_reference = _as_of()
+        except ValueError as e:
+            return respond({"message": str(e)}, 400)
+        code_commune = str(code_commune)
+
+        def dernier():
+            records = []
+            for classe_age in store.distinct("classe_age"):
+                record = latest_index.latest(code_commune, classe_age, as_of, date_reference)
+                if record is not None:
+                    records.append(record)
+            return records
+        return cached_response(("dernier", code_commune, as_of, date_reference), dernier,
+                               tags=[commune_tag(code_commune)])
@@ -0,0 +1,23 @@
+from flask import request
+from database.store import week_key
+from database.schema import week
+
+
+def bornes():
+    """ Semaines AAAASS de début et de fin des paramètres debut et fin (ValueError si invalide) """
+    semaines = []
+    for borne in ("debut", "fin"):
+        semaine = request.args.get(borne)
+        key = week_key(semaine) if semaine else None
+        if semaine and key is None:
+            raise ValueError(f"'{semaine}' is not a week (YYYY-WW)")
+        semaines.append(key)
+    return semaines
+
+
+def semaine_normalisee(semaine):
+    """ Semaine d'un paramètre, écrite comme dans le dataset ("2021-5" -> "2021-05"), ValueError si invalide """
+    try:
+        return week(semaine)
+    except ValueError:
+        raise ValueError(f"'{semaine}' is not a week (YYYY-WW)")
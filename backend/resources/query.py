@@ -0,0 +1,68 @@
+from flask import request
+from flask_restful import Resource
+from database.store import store
+from database.planner import parse_predicates, run_query, iter_query
+from resources.serializers import respond
+from resources.arrow import wants_arrow, arrow_response
+from resources.cache import cached_response, commune_tag, semaine_tag, DATASET
+from resources.admission import admission
+
+
+class QueryApi(Resource):
+    """ Classe permettant de filtrer les entrées sur n'importe quel champ """
+
+    method_decorators = [admission("bulk")]
+
+    def get(self):
+        """Retourne les entrées du dataset vérifiant tous les filtres
+        ---
+        tags:
+          - restful
+        parameters:
+          - in: query
+            name: champ
+            type: string
+            description: Égalité sur un champ, par exemple classe_age=65-74 (une valeur répétée vaut un IN)
+          - in: query
+            name: champ__in
+            type: string
+            description: Appartenance à une liste de valeurs séparées par des virgules, par exemple commune_residence__in=01001,01002
+          - in: query
+            name: champ__gte
+            type: string
+            description: Borne sur un champ (opérateurs gt, gte, lt, lte), par exemple semaine_injection__gte=2021-30
+          - in: query
+            name: explain
+            type: boolean
+            description: Ajoute à la réponse le plan d'exécution choisi et le nombre d'entrées parcourues
+        responses:
+          200:
+            description: Liste des entrées vérifiant les filtres
+            schema:
+              $ref: '#/definitions/donnees-de-vaccination'
+          400:
+            description: Champ, opérateur ou valeur invalide
+        """
+        try:
+            predicates = parse_predicates(request.args)
+        except ValueError as e:
+            return respond({"message": str(e)}, 400)
+        if wants_arrow():
+            return arrow_response(iter_query(store, predicates))
+        if request.args.get("explain", "").lower() in ("1", "true"):
+            records, plan, scanned = run_query(store, predicates)
+            explain = plan.explain()
+            explain["rows_scanned"] = scanned
+            explain["rows_returned"] = len(records)
+            return respond({"explain": explain, "records": records}, 200)
+        key = ("query",) + tuple(sorted(request.args.items(multi=True)))
+        return cached_response(key, lambda: run_query(store, predicates)[0], tags=[_dependency(predicates)])
+
+
+def _dependency(predicates):
+    """ Commune, semaine ou dataset dont dépend le résultat de la requête """
+    for field, tag in (("commune_residence", commune_tag), ("semaine_injection", semaine_tag)):
+        for predicate in predicates:
+            if predicate.field == field and predicate.op == "eq":
+                return tag(predicate.value)
+    return DATASET
@@ -0,0 +1,112 @@
+from flask import request
+from flask_restful import Resource
+from database.store import store, week_key
+from database.ranking import RankingIndex
+from database.cube import TOUT_AGE
+from resources.serializers import respond
+from resources.cache import cached_response, semaine_tag
+from resources.admission import admission
+from resources.params import semaine_normalisee
+
+
+MAX_LIMIT = 1000
+
+rankings = RankingIndex(store)
+
+
+class RankingApi(Resource):
+    """ Classe permettant de classer les communes suivant un indicateur """
+
+    method_decorators = [admission("lookup")]
+
+    def get(self):
+        """Classe les communes d'une semaine, pour une classe d'age, suivant un indicateur
+        ---
+        tags:
+          - restful
+        parameters:
+          - in: query
+            name: semaine_injection
+            required: true
+            type: string
+            description: la semaine d'injection
+          - in: query
+            name: classe_age
+            type: string
+            default: TOUT_AGE
+            description: la classe d'age, TOUT_AGE (toutes classes confondues) si absente
+          - in: query
+            name: metric
+            type: string
+            default: taux_cumu_termine
+            description: Indicateur numérique servant au classement
+          - in: query
+            name: order
+            type: string
+            enum: [asc, desc]
+            default: asc
+            description: asc pour les valeurs les plus basses, desc pour les plus hautes
+          - in: query
+            name: limit
+            type: integer
+            default: 100
+          - in: query
+            name: offset
+            type: integer
+            default: 0
+          - in: query
+            name: min_population
+            type: number
+            default: 0
+            description: Ignore les entrées dont population_carto est inférieure
+        responses:
+          200:
+            description: Les entrées classées, avec leur rang, et le rang de la page suivante
+          400:
+            description: Paramètre invalide
+        """
+        semaine = request.args.get("semaine_injection")
+        if not semaine:
+            return respond({"message": "semaine_injection is required"}, 400)
+        try:
+            semaine = semaine_normalisee(semaine)
+        except ValueError as e:
+            return respond({"message": str(e)}, 400)
+        classe_age = request.args.get("classe_age", TOUT_AGE)
+        metric = request.args.get("metric", "taux_cumu_termine")
+        order = request.args.get("order", "asc")
+        if order not in ("asc", "desc"):
+            return respond({"message": "order must be 'asc' or 'desc'"}, 400)
+        try:
+            limit = min(max(int(request.args.get("limit", 100)), 1), MAX_LIMIT)
+            offset = max(int(request.args.get("offset", 0)), 0)
+            min_population = float(request.args.get("min_population", 0))
+        except ValueError:
+            return respond({"message": "limit, offset and min_population must be numbers"}, 400)
+        try:
+            ordering = rankings.ordering(semaine, classe_age, metric)
+        except ValueError as e:
+            return respond({"message": str(e)}, 400)
+
+        week = week_key(semaine)
+
+        def ranking():
+            positions, next_offset = ordering.page(order == "desc", offset, limit, min_population)
+            ranked = []
+            for rank, position in enumerate(positions, start=offset + 1):
+                record = store.get(ordering.recordids[position], week=week)
+                if record is None:
+                    continue
+                fields = record["fields"]
+                ranked.append({
+                    "rank": rank,
+                    "recordid": record["recordid"],
+                    "commune_residence": fields.get("commune_residence"),
+                    "libelle_commune": fields.get("libelle_commune"),
+                    "classe_age": fields.get("classe_age"),
+                    "population_carto": fields.get("population_carto"),
+                    metric: ordering.values[position],
+                })
+            return {"ranking": ranked, "next_offset": next_offset}
+        key = ("ranking", semaine, classe_age, metric, order, limit, offset, min_population)
+        return cached_response(key, ranking, tags=[semaine_tag(semaine)])
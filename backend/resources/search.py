@@ -0,0 +1,47 @@
+from flask import request
+from flask_restful import Resource
+from database.search import commune_search
+from resources.serializers import respond
+from resources.admission import admission
+
+
+MAX_LIMIT = 50
+
+
+class RechercheCommune(Resource):
+    """ Classe permettant de trouver le code d'une commune à partir de son libellé """
+
+    method_decorators = [admission("lookup")]
+
+    def get(self):
+        """Suggère les communes dont le libellé correspond à la saisie
+        ---
+        tags:
+          - restful
+        parameters:
+          - in: query
+            name: q
+            required: true
+            type: string
+            description: Début du libellé ou d'un de ses mots, sans tenir compte des accents ni de la casse (fautes de frappe tolérées)
+          - in: query
+            name: limit
+            type: integer
+            default: 10
+        responses:
+          200:
+            description: Les communes suggérées (code et libellé), de la plus à la moins pertinente
+          400:
+            description: Saisie ou limite invalide
+        """
+        query = request.args.get("q", "")
+        if not query.strip():
+            return respond({"message": "q is required"}, 400)
+        try:
+            limit = min(max(int(request.args.get("limit", 10)), 1), MAX_LIMIT)
+        except ValueError:
+            return respond({"message": "limit must be an integer"}, 400)
+        return respond({"communes": [
+            {"commune_residence": code, "libelle_commune": label}
+            for code, label in commune_search.search(query, limit)
+        ]}, 200)
@@ -0,0 +1,75 @@
+import json
+from flask import request, Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+
+def _dumps_json(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# Formats de sortie supportés, le premier est le format par défaut
+SERIALIZERS = {JSON: _dumps_json}
+if msgpack is not None:
+    SERIALIZERS[MSGPACK] = lambda data: msgpack.packb(data, use_bin_type=True)
+
+
+def negotiate_mimetype():
+    """ Choisit le format de la réponse suivant l'en-tête Accept (JSON par défaut) """
+    mimetype = request.accept_mimetypes.best_match(list(SERIALIZERS), default=JSON)
+    return mimetype or JSON
+
+
+def dumps(data, mimetype=JSON):
+    """ Sérialise les données dans le format demandé """
+    return SERIALIZERS[mimetype](data)
+
+
+def respond(data, status=200, headers=None):
+    """ Réponse contenant les données sérialisées dans le format négocié """
+    mimetype = negotiate_mimetype()
+    response = Response(dumps(data, mimetype), status=status, mimetype=mimetype, headers=headers)
+    response.headers["Vary"] = "Accept"
+    return response
+
+
+def json_array_response(items, chunk_size=1000):
+    """ Tableau JSON envoyé par morceaux de `chunk_size` éléments, sans construire la liste """
+    def stream():
+        yield b"["
+        chunk = []
+        separator = b""
+        for item in items:
+            chunk.append(_dumps_json(item))
+            if len(chunk) >= chunk_size:
+                yield separator + b",".join(chunk)
+                separator, chunk = b",", []
+        if chunk:
+            yield separator + b",".join(chunk)
+        yield b"]"
+    response = Response(stream(), mimetype=JSON)
+    response.headers["Vary"] = "Accept"
+    return response
+
+
+def representation(mimetype):
+    """ Fonction de sortie flask_restful pour les ressources retournant (données, code) """
+    def output(data, code, headers=None):
+        response = Response(dumps(data, mimetype), status=code, mimetype=mimetype)
+        response.headers.extend(headers or {})
+        return response
+    return output
@@ -1,22 +1,73 @@
-import json
 import datetime
-from flask import Flask, request, jsonify, make_response, Response
+import threading
+from flask import Flask, request
 from flask_restful import Resource, Api
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager, jwt_required
 from flasgger import Swagger
 from flask_apscheduler import APScheduler
-import requests
 
 from database.db import initialize_db
 from database.models import User
+from database.store import store, week_key, week_label_of
+from database.planner import Predicate, run_query
+from database.changes import change_log
+from database.deltas import DeltaCache
+from database.cube import cube
+from database.geo import REGIONS
+from database.search import commune_search
+from database.latest import latest_index
+from database.retention import compact
+from database.schema import record_schema
+from database.ingest import refresh, save, writer
+from database.loader import dataset_loader
 from resources.auth import SignupApi, LoginApi
+from resources.query import QueryApi
+from resources.export import ExportApi
+from resources.changes import ChangesApi
+from resources.batch import BatchApi
+from resources.ranking import RankingApi
+from resources.cube import CubeApi
+from resources.geo import DepartementListe, Departement, Region
+from resources.search import RechercheCommune
+from resources.latest import Snapshot, Dernier
+from resources.events import broadcaster, EventsApi
+from resources.health import Health, Ready
+from resources.jobs import jobs, JobsApi, JobApi, JobResultApi
+from resources.cache import cached_response, commune_tag, response_cache, CacheApi
+from resources.arrow import wants_arrow, arrow_response
+from resources.params import bornes, semaine_normalisee
+from resources.admission import admission, configure as configure_admission
+from resources.serializers import respond, representation, negotiate_mimetype, json_array_response, JSON, SERIALIZERS
 from resources.errors import errors
 
 
 # set configuration values for the APSheduler
 class Config:
     SCHEDULER_API_ENABLED = True
+    RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024     # taille maximale du cache des réponses
+    ADMISSION_CONCURRENCY = {"lookup": 16, "bulk": 2}   # requêtes simultanées par classe de route
+    ADMISSION_QUEUE = {"lookup": 64, "bulk": 4}         # requêtes en attente avant rejet (503)
+    ADMISSION_QUEUE_TIMEOUT = 5                         # attente maximale d'une place, en secondes
+    RATE_LIMIT_PER_SECOND = 20                          # débit autorisé par token (429 au-delà)
+    RATE_LIMIT_BURST = 40
+    JOBS_DIRECTORY = "jobs"                             # dossier des résultats des tâches de fond
+    JOBS_WORKERS = 2                                    # tâches de fond exécutées simultanément
+    JOBS_MAX_PENDING = 20                               # tâches en attente avant rejet (503)
+    JOBS_RESULT_TTL = 3600                              # durée de conservation des résultats, en secondes
+    EVENTS_DELAY = 0.5                                  # regroupement des écritures avant notification, en secondes
+    EVENTS_KEEPALIVE = 15                               # commentaire envoyé aux clients SSE inactifs, en secondes
+    # chaque client SSE garde un thread du serveur WSGI (gunicorn gthread): la limite doit rester sous
+    # le nombre de threads moins ADMISSION_CONCURRENCY, sinon les flux affament les autres routes
+    EVENTS_MAX_CLIENTS = 32                             # clients SSE simultanés avant rejet (503)
+    REGIONS = REGIONS                                   # régions (code INSEE) -> codes des départements
+    STORE_HOT_WEEKS = 12                                # semaines les plus récentes gardées en mémoire
+    STORE_SEGMENTS_DIRECTORY = "segments"               # dossier des semaines plus anciennes, rangées sur disque
+    STORE_COLD_CACHE_BYTES = 256 * 1024 * 1024          # tables des positions des segments chargés en mémoire, LRU
+    DATASET_FILE = "donnees-de-vaccination-par-commune.json"   # base de donnée json, réécrite par l'ingestion
+    RETENTION_WEEKS = 52                                # semaines gardées en détail, les plus anciennes sont résumées par mois
+    LOAD_PARTIAL = False                                # les entrées déjà chargées sont servies pendant le chargement
+    LOAD_BATCH_SIZE = 10000                             # entrées chargées entre deux relâchements du verrou du stockage
 
 
 # app creation
@@ -24,24 +75,59 @@ app = Flask(__name__)
 app.config.from_envvar('ENV_FILE_LOCATION')
 app.config.from_object(Config())
 api = Api(app, errors=errors)
+for mimetype in SERIALIZERS:
+    api.representations[mimetype] = representation(mimetype)
 
 # utils related to the app
 bcrypt = Bcrypt(app)
 jwt = JWTManager(app)
 swagger = Swagger(app)
 
+# taille du cache des réponses
+response_cache.max_bytes = app.config["RESPONSE_CACHE_MAX_BYTES"]
+
+# limites d'admission et de débit des routes de données
+configure_admission(app.config)
+
+# tâches de fond (exports et agrégations)
+jobs.configure(app.config)
+
 # initialize scheduler
 scheduler = APScheduler()
 
 
-date = datetime.datetime.strptime("2022-09", '%Y-%W')
-with open("donnees-de-vaccination-par-commune.json", "r") as f:
-    data = f.read()
-    records = json.loads(data)
+# journal des modifications, alimenté par toutes les écritures du stockage
+change_log.attach(store)
+# agrégats commune × semaine × classe d'age, construits au chargement puis tenus à jour
+cube.configure(app.config)
+cube.attach(store)
+# recherche des communes par libellé
+commune_search.attach(store)
+# entrée la plus récente de chaque commune et classe d'age
+latest_index.attach(store)
+# variations hebdomadaires par commune, recalculées quand la commune change
+delta_cache = DeltaCache(store)
+# notifications Server-Sent Events des écritures et des ingestions
+broadcaster.configure(app.config)
+broadcaster.attach(store)
+
+# semaines récentes en mémoire, anciennes semaines sur disque
+store.records.configure(app.config)
+
+date = datetime.datetime.strptime("2022-09-1", '%G-%V-%u')
+# la base json est lue en flux, entrée par entrée, en arrière-plan: le serveur démarre
+# aussitôt et les routes de données répondent 503 jusqu'à la fin du chargement (voir /ready),
+# ou servent les entrées déjà chargées avec LOAD_PARTIAL
+threading.Thread(target=dataset_loader.load, daemon=True,
+                 args=(store, app.config["DATASET_FILE"],
+                       app.config["LOAD_BATCH_SIZE"] if app.config["LOAD_PARTIAL"] else None)).start()
 
 
 class DonneesCommune(Resource):
-    
+
+    # la liste complète est un export; l'ajout d'une entrée ne doit pas attendre derrière les exports
+    method_decorators = {"get": [admission("bulk")], "post": [admission("lookup")]}
+
     def get(self):
         """Retourne la liste des entrées du dataset
         ---
@@ -75,10 +161,10 @@ class DonneesCommune(Resource):
                       type: string
                       default: 2022-03-06
                     taux_cumu_1_inj:
-                      type: string
+                      type: number
                       default: 0.963
                     population_carto:
-                      type: string
+                      type: integer
                       default: 380
                     date:
                       type: string
@@ -90,21 +176,25 @@ class DonneesCommune(Resource):
                       type: string
                       default: de 65 à 74 ans
                     effectif_cumu_1_inj:
-                      type: string
+                      type: integer
                       default: 360
                     effectif_cumu_termine:
-                      type: string
+                      type: integer
                       default: 360
                     taux_cumu_termine:
-                      type: string
+                      type: number
                       default: 0.96
                 record_timestamp:
                   type: string
                   description: La date et l'heure de la dernière modification
                   default: 2022-03-11T10:30:35.173Z
         """
-        global records
-        return make_response(jsonify(records), 200)
+        if wants_arrow():
+            return arrow_response(store.iter_values())
+        if negotiate_mimetype() == JSON:
+            # les semaines sur disque sont lues une à une: le dataset n'est jamais entier en mémoire
+            return json_array_response(store.iter_values())
+        return cached_response(("donnees",), store.values)
 
     @jwt_required()
     def post(self):
@@ -137,10 +227,10 @@ class DonneesCommune(Resource):
                     type: string
                     default: 2022-03-06
                 taux_cumu_1_inj:
-                    type: string
+                    type: number
                     default: 0.963
                 population_carto:
-                    type: string
+                    type: integer
                     default: 380
                 date:
                     type: string
@@ -152,13 +242,13 @@ class DonneesCommune(Resource):
                     type: string
                     default: de 65 à 74 ans
                 effectif_cumu_1_inj:
-                    type: string
+                    type: integer
                     default: 360
                 effectif_cumu_termine:
-                    type: string
+                    type: integer
                     default: 360
                 taux_cumu_termine:
-                    type: string
+                    type: number
                     default: 0.96
         responses:
           201:
@@ -166,48 +256,25 @@ class DonneesCommune(Resource):
             schema:
               $ref: '#/definitions/donnees-de-vaccination'
           400:
-            description: Pas de clef 'recordid' ou 'une 'recordid' déjà utilisé dans la nouvelle entrée
+            description: Pas de clef 'recordid', 'recordid' déjà utilisé, champ inconnu ou valeur invalide dans la nouvelle entrée
         """
         new_datas = request.json
         if "recordid" not in new_datas.keys():
-            return make_response(jsonify({"message": "not recordid in the new entry"}), 400)
-        rec = {'datasetid':"donnees-de-vaccination-par-commune", "fields":{}}
-        for data in new_datas.keys():
-            if data == "recordid":
-                rec["recordid"] = new_datas["recordid"]
-            elif data == "classe_age":
-                rec["fields"]["classe_age"] = new_datas["classe_age"]
-            elif data == "commune_residence":
-                rec["fields"]["commune_residence"] = new_datas["commune_residence"]
-            elif data == "date":
-                rec["fields"]["date"] = new_datas["date"]
-            elif data == "date_reference":
-                rec["fields"]["date_reference"] = new_datas["date_reference"]
-            elif data == "effectif_cumu_1_inj":
-                rec["fields"]["effectif_cumu_1_inj"] = new_datas["effectif_cumu_1_inj"]
-            elif data == "libelle_classe_age":
-                rec["fields"]["libelle_classe_age"] = new_datas["libelle_classe_age"]
-            elif data == "libelle_commune":
-                rec["fields"]["libelle_commune"] = new_datas["libelle_commune"]
-            elif data == "population_carto":
-                rec["fields"]["population_carto"] = new_datas["population_carto"]
-            elif data == "semaine_injection":
-                rec["fields"]["semaine_injection"] = new_datas["semaine_injection"]
-            elif data == "taux_cumu_1_inj":
-                rec["fields"]["taux_cumu_1_inj"] = new_datas["taux_cumu_1_inj"]
-            elif data == "taux_cumu_termine":
-                rec["fields"]["taux_cumu_termine"] = new_datas["taux_cumu_termine"]
-            rec["record_timestamp"] = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%F.%f")
-        global records
-        for r in records:
-            if rec["recordid"] == r["recordid"]:
-                return make_response(jsonify({"message": "already used recordid"}), 400)
-        records.append(rec)
-        return make_response(jsonify(rec), 201)
+            return respond({"message": "not recordid in the new entry"}, 400)
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
+        try:
+            rec = record_schema.record(new_datas, timestamp)
+        except ValueError as error:
+            return respond({"message": str(error)}, 400)
+        if not store.add(rec):
+            return respond({"message": "already used recordid"}, 400)
+        return respond(rec, 201)
 
 
 class DonneeCommune(Resource):
 
+    method_decorators = [admission("lookup")]
+
     def get(self, id):
         """
         Lire une entrée
@@ -226,11 +293,10 @@ class DonneeCommune(Resource):
             schema:
               $ref: '#/definitions/donnees-de-vacination'
         """
-        global records
-        for record in records:
-            if record["recordid"] == id:
-                return make_response(jsonify(record), 200 )
-        return make_response(jsonify({"message": "data not found"}), 204)
+        record = store.get(id)
+        if record is not None:
+            return respond(record, 200)
+        return respond({"message": "data not found"}, 204)
 
     @jwt_required()
     def put(self, id):
@@ -256,42 +322,23 @@ class DonneeCommune(Resource):
               $ref: '#/definitions/donnees-de-vaccination'
           204:
             description: 'recordid' n'a pas été trouvé dans les données d'entrées
+          400:
+            description: Un champ est inconnu ou sa valeur invalide
           404:
             description: L'entrée à modifier n'a pas été trouvé
         """
-        global records
         datas = request.json
         if "recordid" not in datas.keys():
-            return make_response(jsonify({"message": "not recordid in the new entry"}), 204)
-        for record in records:
-            if record["recordid"] == datas["recordid"]:
-                for data in datas.keys():
-                    if data == "classe_age":
-                        record["fields"]["classe_age"] = datas["classe_age"]
-                    elif data == "commune_residence":
-                        record["fields"]["commune_residence"] = datas["commune_residence"]
-                    elif data == "date":
-                        record["fields"]["date"] = datas["date"]
-                    elif data == "date_reference":
-                        record["fields"]["date_reference"] = datas["date_reference"]
-                    elif data == "effectif_cumu_1_inj":
-                        record["fields"]["effectif_cumu_1_inj"] = datas["effectif_cumu_1_inj"]
-                    elif data == "libelle_classe_age":
-                        record["fields"]["libelle_classe_age"] = datas["libelle_classe_age"]
-                    elif data == "libelle_commune":
-                        record["fields"]["libelle_commune"] = datas["libelle_commune"]
-                    elif data == "population_carto":
-                        record["fields"]["population_carto"] = datas["population_carto"]
-                    elif data == "semaine_injection":
-                        record["fields"]["semaine_injection"] = datas["semaine_injection"]
-                    elif data == "taux_cumu_1_inj":
-                        record["fields"]["taux_cumu_1_inj"] = datas["taux_cumu_1_inj"]
-                    elif data == "taux_cumu_termine":
-                        record["fields"]["taux_cumu_termine"] = datas["taux_cumu_termine"]
-                record["record_timestamp"] = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%F.%f")
-                record_modifie = record
-                return make_response(jsonify(record_modifie), 201)
-        return make_response(jsonify({"message": "data not found"}), 404)
+            return respond({"message": "not recordid in the new entry"}, 204)
+        try:
+            changes = record_schema.fields(datas)
+        except ValueError as error:
+            return respond({"message": str(error)}, 400)
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
+        record_modifie = store.update(datas["recordid"], changes, timestamp)
+        if record_modifie is None:
+            return respond({"message": "data not found"}, 404)
+        return respond(record_modifie, 201)
 
     @jwt_required()
     def delete(self, id):
@@ -312,23 +359,16 @@ class DonneeCommune(Resource):
           204:
             description: L'entrée voulu n'a pas été trouvé
         """
-        global records
-        find = False
-        new_records = []
-        for record in records:
-            if record["recordid"] == id:
-                find = True
-                continue
-            new_records.append(record)
-        records = new_records
-        if find == True:
-            return make_response(jsonify({"valdation": "data deleted"}), 200)
+        if store.delete(id):
+            return respond({"valdation": "data deleted"}, 200)
         else:
-            return make_response(jsonify({"message": "data not found"}), 204)
+            return respond({"message": "data not found"}, 204)
 
 
 class Commune(Resource):
 
+    method_decorators = [admission("lookup")]
+
     def get(self):
       """Retourne la liste des codes des communes
         ---
@@ -341,16 +381,13 @@ class Commune(Resource):
             schema:
               $ref: '#/definitions/donnees-de-vaccination'
       """
-      global records
-      communes = {"commune_code":[]}
-      for record in records:
-          if record["fields"]["commune_residence"] not in communes["commune_code"]:
-              communes["commune_code"].append(record["fields"]["commune_residence"])
-      return make_response(jsonify(communes), 200)
+      return cached_response(("communes",), lambda: {"commune_code": store.distinct("commune_residence")})
     
 
 class CodeCommune(Resource):
 
+    method_decorators = [admission("lookup")]
+
     def get(self, code_commune):
         """Retourne la liste des entrées du dataset suivant sa commune
         ---
@@ -368,14 +405,12 @@ class CodeCommune(Resource):
             schema:
               $ref: '#/definitions/donnees-de-vaccination'
         """
-        global records
-        sort_records = []
-        for record in records:
-            if str(code_commune) == record["fields"]["commune_residence"]:
-                sort_records.append(record)
-        if sort_records == {}:
-            return make_response(jsonify({"message": "No data"}), 200)
-        return make_response(jsonify(sort_records), 200)
+        code_commune = str(code_commune)
+        if wants_arrow():
+            return arrow_response(store.lookup("commune_residence", code_commune))
+        return cached_response(("commune", code_commune),
+                               lambda: store.lookup("commune_residence", code_commune),
+                               tags=[commune_tag(code_commune)])
 
     @jwt_required()
     def post(self, code_commune):
@@ -403,45 +438,18 @@ class CodeCommune(Resource):
             description: La nouvelle entrée n'a pas pu être crée
         """
         new_datas = request.json
-        rec = {'datasetid':"donnees-de-vaccination-par-commune", "fields":{}}
         if "recordid" not in new_datas.keys():
-            return make_response(jsonify({"message": "not recordid in the new entry"}), 400)
+            return respond({"message": "not recordid in the new entry"}, 400)
         if "commune_residence" in new_datas.keys() and new_datas["commune_residence"] != code_commune:
-            return make_response(jsonify({"message": "your entry's code_commune and the dataset one doesn't match "}), 400)
-        if "commune_residence" not in new_datas.keys():
-            rec["fields"]["commune_residence"] = code_commune
-        for data in new_datas.keys():
-            if data == "recordid":
-                rec["recordid"] = new_datas["recordid"]
-            elif data == "classe_age":
-                rec["fields"]["classe_age"] = new_datas["classe_age"]
-            elif data == "commune_residence":
-                rec["fields"]["commune_residence"] = new_datas["commune_residence"]
-            elif data == "date":
-                rec["fields"]["date"] = new_datas["date"]
-            elif data == "date_reference":
-                rec["fields"]["date_reference"] = new_datas["date_reference"]
-            elif data == "effectif_cumu_1_inj":
-                rec["fields"]["effectif_cumu_1_inj"] = new_datas["effectif_cumu_1_inj"]
-            elif data == "libelle_classe_age":
-                rec["fields"]["libelle_classe_age"] = new_datas["libelle_classe_age"]
-            elif data == "libelle_commune":
-                rec["fields"]["libelle_commune"] = new_datas["libelle_commune"]
-            elif data == "population_carto":
-                rec["fields"]["population_carto"] = new_datas["population_carto"]
-            elif data == "semaine_injection":
-                rec["fields"]["semaine_injection"] = new_datas["semaine_injection"]
-            elif data == "taux_cumu_1_inj":
-                rec["fields"]["taux_cumu_1_inj"] = new_datas["taux_cumu_1_inj"]
-            elif data == "taux_cumu_termine":
-                rec["fields"]["taux_cumu_termine"] = new_datas["taux_cumu_termine"]
-            rec["record_timestamp"] = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%F.%f")
-        global records
-        for r in records:
-            if rec["recordid"] == r["recordid"]:
-                return make_response(jsonify({"message": "already used recordid"}), 400)
-        records.append(rec)
-        return make_response(jsonify(rec), 201)
+            return respond({"message": "your entry's code_commune and the dataset one doesn't match "}, 400)
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
+        try:
+            rec = record_schema.record(new_datas, timestamp, commune_residence=code_commune)
+        except ValueError as error:
+            return respond({"message": str(error)}, 400)
+        if not store.add(rec):
+            return respond({"message": "already used recordid"}, 400)
+        return respond(rec, 201)
 
     @jwt_required()
     def put(self, code_commune):
@@ -467,46 +475,29 @@ class CodeCommune(Resource):
               $ref: '#/definitions/donnees-de-vaccination'
           204:
             description: 'recordid' n'a pas été trouvé dans les données d'entrées
+          400:
+            description: Un champ est inconnu ou sa valeur invalide
           404:
             description: L'entrée à modifier n'a pas été trouvé
         """
-        global records
         datas = request.json
         if "recordid" not in datas.keys():
-            return make_response(jsonify({"message": "not recordid in the new entry"}), 204)
-        for record in records:
-            if record["recordid"] == datas["recordid"]:
-                for data in datas.keys():
-                    if data == "classe_age":
-                        record["fields"]["classe_age"] = datas["classe_age"]
-                    elif data == "commune_residence":
-                        record["fields"]["commune_residence"] = datas["commune_residence"]
-                    elif data == "date":
-                        record["fields"]["date"] = datas["date"]
-                    elif data == "date_reference":
-                        record["fields"]["date_reference"] = datas["date_reference"]
-                    elif data == "effectif_cumu_1_inj":
-                        record["fields"]["effectif_cumu_1_inj"] = datas["effectif_cumu_1_inj"]
-                    elif data == "libelle_classe_age":
-                        record["fields"]["libelle_classe_age"] = datas["libelle_classe_age"]
-                    elif data == "libelle_commune":
-                        record["fields"]["libelle_commune"] = datas["libelle_commune"]
-                    elif data == "population_carto":
-                        record["fields"]["population_carto"] = datas["population_carto"]
-                    elif data == "semaine_injection":
-                        record["fields"]["semaine_injection"] = datas["semaine_injection"]
-                    elif data == "taux_cumu_1_inj":
-                        record["fields"]["taux_cumu_1_inj"] = datas["taux_cumu_1_inj"]
-                    elif data == "taux_cumu_termine":
-                        record["fields"]["taux_cumu_termine"] = datas["taux_cumu_termine"]
-                record["record_timestamp"] = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%F.%f")
-                record_modifie = record
-                return make_response(jsonify(record_modifie), 201)
-        return make_response(jsonify({"message": "data not found"}), 404)
+            return respond({"message": "not recordid in the new entry"}, 204)
+        try:
+            changes = record_schema.fields(datas)
+        except ValueError as error:
+            return respond({"message": str(error)}, 400)
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
+        record_modifie = store.update(datas["recordid"], changes, timestamp)
+        if record_modifie is None:
+            return respond({"message": "data not found"}, 404)
+        return respond(record_modifie, 201)
 
 
 class SemaineListe(Resource):
 
+    method_decorators = [admission("lookup")]
+
     def get(self,code_commune):
         """Retourne la liste des classes d'age
         ---
@@ -519,16 +510,13 @@ class SemaineListe(Resource):
             schema:
               $ref: '#/definitions/donnees-de-vaccination'
         """
-        global records
-        semaine_liste = {"semaine_injection":[]}
-        for record in records:
-          if record["fields"]["semaine_injection"] not in semaine_liste["semaine_injection"]:
-              semaine_liste["semaine_injection"].append(record["fields"]["semaine_injection"])
-        return make_response(jsonify(semaine_liste), 200)
+        return cached_response(("semaines",), lambda: {"semaine_injection": store.distinct("semaine_injection")})
 
 
 class Semaine(Resource):
 
+    method_decorators = [admission("lookup")]
+
     def get(self, code_commune, semaine):
         """Retourne la liste des entrées du dataset suivant sa commune et la semaine d'injection
         ---
@@ -550,15 +538,24 @@ class Semaine(Resource):
             description: Liste des entrées de la base de donnée suivant la  semaine d'injection
             schema:
               $ref: '#/definitions/donnees-de-vaccination'
+          400:
+            description: Semaine invalide
         """
-        global records
-        sort_records = []
-        for record in records:
-            if str(code_commune) == record["fields"]["commune_residence"] and str(semaine) == record["fields"]["semaine_injection"]:
-                sort_records.append(record)
-        if sort_records == {}:
-            return make_response(jsonify({"message": "No data"}), 200)
-        return make_response(jsonify(sort_records), 200)
+        try:
+            semaine = semaine_normalisee(semaine)
+        except ValueError as e:
+            return respond({"message": str(e)}, 400)
+
+        def semaine_records():
+            sort_records, _, _ = run_query(store, [
+                Predicate("commune_residence", "eq", str(code_commune)),
+                Predicate("semaine_injection", "eq", semaine),
+            ])
+            return sort_records
+        if wants_arrow():
+            return arrow_response(semaine_records())
+        return cached_response(("semaine", str(code_commune), semaine), semaine_records,
+                               tags=[commune_tag(str(code_commune))])
 
     @jwt_required()
     def post(self, code_commune, semaine):
@@ -591,49 +588,24 @@ class Semaine(Resource):
             description: La nouvelle entrée n'a pas pu être crée
         """
         new_datas = request.json
-        rec = {'datasetid':"donnees-de-vaccination-par-commune", "fields":{}}
         if "recordid" not in new_datas.keys():
-            return make_response(jsonify({"message": "not recordid in the new entry"}), 400)
+            return respond({"message": "not recordid in the new entry"}, 400)
         if "commune_residence" in new_datas.keys() and new_datas["commune_residence"] != code_commune:
-            return make_response(jsonify({"message": "your entry's code_commune and the dataset one doesn't match "}), 400)
-        if "semaine_injection" in new_datas.keys() and new_datas["semaine_injection"] != semaine:
-            return make_response(jsonify({"message": "your entry's code_commune and the dataset one doesn't match "}), 400)
-        if "commune_residence" not in new_datas.keys():
-            rec["fields"]["commune_residence"] = code_commune
-        if "semaine_injection" not in new_datas.keys():
-            rec["fields"]["semaine_injection"] = semaine
-        for data in new_datas.keys():
-            if data == "recordid":
-                rec["recordid"] = new_datas["recordid"]
-            elif data == "classe_age":
-                rec["fields"]["classe_age"] = new_datas["classe_age"]
-            elif data == "commune_residence":
-                rec["fields"]["commune_residence"] = new_datas["commune_residence"]
-            elif data == "date":
-                rec["fields"]["date"] = new_datas["date"]
-            elif data == "date_reference":
-                rec["fields"]["date_reference"] = new_datas["date_reference"]
-            elif data == "effectif_cumu_1_inj":
-                rec["fields"]["effectif_cumu_1_inj"] = new_datas["effectif_cumu_1_inj"]
-            elif data == "libelle_classe_age":
-                rec["fields"]["libelle_classe_age"] = new_datas["libelle_classe_age"]
-            elif data == "libelle_commune":
-                rec["fields"]["libelle_commune"] = new_datas["libelle_commune"]
-            elif data == "population_carto":
-                rec["fields"]["population_carto"] = new_datas["population_carto"]
-            elif data == "semaine_injection":
-                rec["fields"]["semaine_injection"] = new_datas["semaine_injection"]
-            elif data == "taux_cumu_1_inj":
-                rec["fields"]["taux_cumu_1_inj"] = new_datas["taux_cumu_1_inj"]
-            elif data == "taux_cumu_termine":
-                rec["fields"]["taux_cumu_termine"] = new_datas["taux_cumu_termine"]
-            rec["record_timestamp"] = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%F.%f")
-        global records
-        for r in records:
-            if rec["recordid"] == r["recordid"]:
-                return make_response(jsonify({"message": "already used recordid"}), 400)
-        records.append(rec)
-        return make_response(jsonify(rec), 201)
+            return respond({"message": "your entry's code_commune and the dataset one doesn't match "}, 400)
+        try:
+            semaine = semaine_normalisee(semaine)
+            if "semaine_injection" in new_datas.keys() and semaine_normalisee(new_datas["semaine_injection"]) != semaine:
+                return respond({"message": "your entry's code_commune and the dataset one doesn't match "}, 400)
+        except ValueError as e:
+            return respond({"message": str(e)}, 400)
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
+        try:
+            rec = record_schema.record(new_datas, timestamp, commune_residence=code_commune, semaine_injection=semaine)
+        except ValueError as error:
+            return respond({"message": str(error)}, 400)
+        if not store.add(rec):
+            return respond({"message": "already used recordid"}, 400)
+        return respond(rec, 201)
 
     @jwt_required()
     def put(self, code_commune, semaine):
@@ -664,46 +636,129 @@ class Semaine(Resource):
               $ref: '#/definitions/donnees-de-vaccination'
           204:
             description: 'recordid' n'a pas été trouvé dans les données d'entrées
+          400:
+            description: Un champ est inconnu ou sa valeur invalide
           404:
             description: L'entrée à modifier n'a pas été trouvé
         """
-        global records
         datas = request.json
         if "recordid" not in datas.keys():
-            return make_response(jsonify({"message": "not recordid in the new entry"}), 204)
-        for record in records:
-            if record["recordid"] == datas["recordid"]:
-                for data in datas.keys():
-                    if data == "classe_age":
-                        record["fields"]["classe_age"] = datas["classe_age"]
-                    elif data == "commune_residence":
-                        record["fields"]["commune_residence"] = datas["commune_residence"]
-                    elif data == "date":
-                        record["fields"]["date"] = datas["date"]
-                    elif data == "date_reference":
-                        record["fields"]["date_reference"] = datas["date_reference"]
-                    elif data == "effectif_cumu_1_inj":
-                        record["fields"]["effectif_cumu_1_inj"] = datas["effectif_cumu_1_inj"]
-                    elif data == "libelle_classe_age":
-                        record["fields"]["libelle_classe_age"] = datas["libelle_classe_age"]
-                    elif data == "libelle_commune":
-                        record["fields"]["libelle_commune"] = datas["libelle_commune"]
-                    elif data == "population_carto":
-                        record["fields"]["population_carto"] = datas["population_carto"]
-                    elif data == "semaine_injection":
-                        record["fields"]["semaine_injection"] = datas["semaine_injection"]
-                    elif data == "taux_cumu_1_inj":
-                        record["fields"]["taux_cumu_1_inj"] = datas["taux_cumu_1_inj"]
-                    elif data == "taux_cumu_termine":
-                        record["fields"]["taux_cumu_termine"] = datas["taux_cumu_termine"]
-                record["record_timestamp"] = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%F.%f")
-                record_modifie = record
-                return make_response(jsonify(record_modifie), 201)
-        return make_response(jsonify({"message": "data not found"}), 404)
+            return respond({"message": "not recordid in the new entry"}, 204)
+        try:
+            changes = record_schema.fields(datas)
+        except ValueError as error:
+            return respond({"message": str(error)}, 400)
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
+        record_modifie = store.update(datas["recordid"], changes, timestamp)
+        if record_modifie is None:
+            return respond({"message": "data not found"}, 404)
+        return respond(record_modifie, 201)
+
+
+class SemaineIntervalle(Resource):
+
+    method_decorators = [admission("lookup")]
+
+    def get(self, code_commune):
+        """Retourne les entrées d'une commune dont la semaine d'injection est comprise dans un intervalle
+        ---
+        tags:
+          - restful
+        parameters:
+          - in: path
+            name: code_commune
+            required: true
+            description: le code de la commune (commune_residence)
+            type: string
+          - in: query
+            name: debut
+            required: false
+            description: première semaine d'injection incluse (AAAA-SS)
+            type: string
+          - in: query
+            name: fin
+            required: false
+            description: dernière semaine d'injection incluse (AAAA-SS)
+            type: string
+        responses:
+          200:
+            description: Liste des entrées de la commune triées par semaine d'injection
+            schema:
+              $ref: '#/definitions/donnees-de-vaccination'
+          400:
+            description: Semaine de début ou de fin invalide
+        """
+        try:
+            debut, fin = bornes()
+        except ValueError as e:
+            return respond({"message": str(e)}, 400)
+        code_commune = str(code_commune)
+        if wants_arrow():
+            return arrow_response(store.week_range(code_commune, debut, fin))
+        return cached_response(("semaine_intervalle", code_commune, debut, fin),
+                               lambda: store.week_range(code_commune, debut, fin),
+                               tags=[commune_tag(code_commune)])
+
+
+class Variations(Resource):
+
+    method_decorators = [admission("lookup")]
+
+    def get(self, code_commune):
+        """Retourne les variations hebdomadaires des compteurs cumulés d'une commune, par classe d'age
+        ---
+        tags:
+          - restful
+        parameters:
+          - in: path
+            name: code_commune
+            required: true
+            description: le code de la commune (commune_residence)
+            type: string
+          - in: query
+            name: classe_age
+            required: false
+            description: la classe d'age (toutes si absente)
+            type: string
+          - in: query
+            name: debut
+            required: false
+            description: première semaine d'injection incluse (AAAA-SS)
+            type: string
+          - in: query
+            name: fin
+            required: false
+            description: dernière semaine d'injection incluse (AAAA-SS)
+            type: string
+        responses:
+          200:
+            description: Pour chaque classe d'age, les semaines avec les cumuls, leur augmentation depuis la semaine précédente (delta_) et sa part du cumul précédent (croissance_)
+          400:
+            description: Semaine de début ou de fin invalide
+        """
+        try:
+            debut, fin = bornes()
+        except ValueError as e:
+            return respond({"message": str(e)}, 400)
+        code_commune = str(code_commune)
+        classe_age = request.args.get("classe_age")
+
+        def variations():
+            series = delta_cache.get(code_commune)
+            return {
+                age: [point for point in points
+                      if (debut is None or week_key(point["semaine_injection"]) >= debut)
+                      and (fin is None or week_key(point["semaine_injection"]) <= fin)]
+                for age, points in series.items() if classe_age is None or age == classe_age
+            }
+        return cached_response(("variations", code_commune, classe_age, debut, fin),
+                               variations, tags=[commune_tag(code_commune)])
 
 
 class ClasseAgeList(Resource):
 
+    method_decorators = [admission("lookup")]
+
     def get(self, code_commune, semaine):
         """Retourne la liste des classes d'age
         ---
@@ -716,16 +771,13 @@ class ClasseAgeList(Resource):
             schema:
               $ref: '#/definitions/donnees-de-vaccination'
         """
-        global records
-        classe_liste = {"classe_age":[]}
-        for record in records:
-          if record["fields"]["classe_age"] not in classe_liste["classe_age"]:
-              classe_liste["classe_age"].append(record["fields"]["classe_age"])
-        return make_response(jsonify(classe_liste), 200)
+        return cached_response(("classes_age",), lambda: {"classe_age": store.distinct("classe_age")})
 
 
 class ClasseAge(Resource):
 
+    method_decorators = [admission("lookup")]
+
     def get(self, code_commune, semaine, classe_age):
         """Retourne la liste des entrées du dataset suivant sa commune, la semaine d'injection et sa classe d'age
         ---
@@ -752,15 +804,31 @@ class ClasseAge(Resource):
             description: Liste des entrées de la base de donnée suivant le code de la commune, la semaine d'injection et sa classe d'age
             schema:
               $ref: '#/definitions/donnees-de-vaccination'
+          400:
+            description: Semaine invalide
         """
-        global records
-        sort_records = []
-        for record in records:
-            if str(code_commune) == record["fields"]["commune_residence"] and str(semaine) == record["fields"]["semaine_injection"] and str(classe_age) == record["fields"]["classe_age"]:
-                sort_records.append(record)
-        if sort_records == []:
-            return make_response(jsonify({"message": "No data"}), 200)
-        return make_response(jsonify(sort_records), 200)
+        try:
+            semaine = semaine_normalisee(semaine)
+        except ValueError as e:
+            return respond({"message": str(e)}, 400)
+
+        def classe_age_records():
+            sort_records, _, _ = run_query(store, [
+                Predicate("commune_residence", "eq", str(code_commune)),
+                Predicate("semaine_injection", "eq", semaine),
+                Predicate("classe_age", "eq", str(classe_age)),
+            ])
+            return sort_records
+        if wants_arrow():
+            return arrow_response(classe_age_records())
+
+        def classe_age_response():
+            sort_records = classe_age_records()
+            if sort_records == []:
+                return {"message": "No data"}
+            return sort_records
+        return cached_response(("classe_age", str(code_commune), semaine, str(classe_age)), classe_age_response,
+                               tags=[commune_tag(str(code_commune))])
 
     @jwt_required()
     def post(self, code_commune, semaine, classe_age):
@@ -798,53 +866,26 @@ class ClasseAge(Resource):
             description: La nouvelle entrée n'a pas pu être crée
         """
         new_datas = request.json
-        rec = {'datasetid':"donnees-de-vaccination-par-commune", "fields":{}}
         if "recordid" not in new_datas.keys():
-            return make_response(jsonify({"message": "not recordid in the new entry"}), 400)
+            return respond({"message": "not recordid in the new entry"}, 400)
         if "commune_residence" in new_datas.keys() and new_datas["commune_residence"] != code_commune:
-            return make_response(jsonify({"message": "your entry's code_commune and the dataset one doesn't match "}), 400)
-        if "semaine_injection" in new_datas.keys() and new_datas["semaine_injection"] != semaine:
-            return make_response(jsonify({"message": "your entry's code_commune and the dataset one doesn't match "}), 400)
+            return respond({"message": "your entry's code_commune and the dataset one doesn't match "}, 400)
+        try:
+            semaine = semaine_normalisee(semaine)
+            if "semaine_injection" in new_datas.keys() and semaine_normalisee(new_datas["semaine_injection"]) != semaine:
+                return respond({"message": "your entry's code_commune and the dataset one doesn't match "}, 400)
+        except ValueError as e:
+            return respond({"message": str(e)}, 400)
         if "classe_age" in new_datas.keys() and new_datas["classe_age"] != classe_age:
-            return make_response(jsonify({"message": "your entry's code_commune and the dataset one doesn't match "}), 400)
-        if "commune_residence" not in new_datas.keys():
-            rec["fields"]["commune_residence"] = code_commune
-        if "semaine_injection" not in new_datas.keys():
-            rec["fields"]["semaine_injection"] = semaine
-        if "classe_age" not in new_datas.keys():
-            rec["fields"]["classe_age"] = classe_age
-        for data in new_datas.keys():
-            if data == "recordid":
-                rec["recordid"] = new_datas["recordid"]
-            elif data == "classe_age":
-                rec["fields"]["classe_age"] = new_datas["classe_age"]
-            elif data == "commune_residence":
-                rec["fields"]["commune_residence"] = new_datas["commune_residence"]
-            elif data == "date":
-                rec["fields"]["date"] = new_datas["date"]
-            elif data == "date_reference":
-                rec["fields"]["date_reference"] = new_datas["date_reference"]
-            elif data == "effectif_cumu_1_inj":
-                rec["fields"]["effectif_cumu_1_inj"] = new_datas["effectif_cumu_1_inj"]
-            elif data == "libelle_classe_age":
-                rec["fields"]["libelle_classe_age"] = new_datas["libelle_classe_age"]
-            elif data == "libelle_commune":
-                rec["fields"]["libelle_commune"] = new_datas["libelle_commune"]
-            elif data == "population_carto":
-                rec["fields"]["population_carto"] = new_datas["population_carto"]
-            elif data == "semaine_injection":
-                rec["fields"]["semaine_injection"] = new_datas["semaine_injection"]
-            elif data == "taux_cumu_1_inj":
-                rec["fields"]["taux_cumu_1_inj"] = new_datas["taux_cumu_1_inj"]
-            elif data == "taux_cumu_termine":
-                rec["fields"]["taux_cumu_termine"] = new_datas["taux_cumu_termine"]
-            rec["record_timestamp"] = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%F.%f")
-        global records
-        for r in records:
-            if rec["recordid"] == r["recordid"]:
-                return make_response(jsonify({"message": "already used recordid"}), 400)
-        records.append(rec)
-        return make_response(jsonify(rec), 201)
+            return respond({"message": "your entry's code_commune and the dataset one doesn't match "}, 400)
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
+        try:
+            rec = record_schema.record(new_datas, timestamp, commune_residence=code_commune, semaine_injection=semaine, classe_age=classe_age)
+        except ValueError as error:
+            return respond({"message": str(error)}, 400)
+        if not store.add(rec):
+            return respond({"message": "already used recordid"}, 400)
+        return respond(rec, 201)
 
     @jwt_required()
     def put(self, code_commune, semaine, classe_age):
@@ -880,42 +921,23 @@ class ClasseAge(Resource):
               $ref: '#/definitions/donnees-de-vaccination'
           204:
             description: 'recordid' n'a pas été trouvé dans les données d'entrées
+          400:
+            description: Un champ est inconnu ou sa valeur invalide
           404:
             description: L'entrée à modifier n'a pas été trouvé
         """
-        global records
         datas = request.json
         if "recordid" not in datas.keys():
-            return make_response(jsonify({"message": "not recordid in the new entry"}), 204)
-        for record in records:
-            if record["recordid"] == datas["recordid"]:
-                for data in datas.keys():
-                    if data == "classe_age":
-                        record["fields"]["classe_age"] = datas["classe_age"]
-                    elif data == "commune_residence":
-                        record["fields"]["commune_residence"] = datas["commune_residence"]
-                    elif data == "date":
-                        record["fields"]["date"] = datas["date"]
-                    elif data == "date_reference":
-                        record["fields"]["date_reference"] = datas["date_reference"]
-                    elif data == "effectif_cumu_1_inj":
-                        record["fields"]["effectif_cumu_1_inj"] = datas["effectif_cumu_1_inj"]
-                    elif data == "libelle_classe_age":
-                        record["fields"]["libelle_classe_age"] = datas["libelle_classe_age"]
-                    elif data == "libelle_commune":
-                        record["fields"]["libelle_commune"] = datas["libelle_commune"]
-                    elif data == "population_carto":
-                        record["fields"]["population_carto"] = datas["population_carto"]
-                    elif data == "semaine_injection":
-                        record["fields"]["semaine_injection"] = datas["semaine_injection"]
-                    elif data == "taux_cumu_1_inj":
-                        record["fields"]["taux_cumu_1_inj"] = datas["taux_cumu_1_inj"]
-                    elif data == "taux_cumu_termine":
-                        record["fields"]["taux_cumu_termine"] = datas["taux_cumu_termine"]
-                record["record_timestamp"] = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%F.%f")
-                record_modifie = record
-                return make_response(jsonify(record_modifie), 201)
-        return make_response(jsonify({"message": "data not found"}), 404)
+            return respond({"message": "not recordid in the new entry"}, 204)
+        try:
+            changes = record_schema.fields(datas)
+        except ValueError as error:
+            return respond({"message": str(error)}, 400)
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
+        record_modifie = store.update(datas["recordid"], changes, timestamp)
+        if record_modifie is None:
+            return respond({"message": "data not found"}, 404)
+        return respond(record_modifie, 201)
 
 
 """class Enseignant(Resource):
@@ -934,44 +956,81 @@ class Cours(Resource):
 # Fonction qui se déclanche toute les 24h
 @scheduler.task('interval', id='do_job_1', hours=24, misfire_grace_time=900)
 def job1():
-    global date, records
+    global date
 
     # si la date actuel est supérieur à la date en mémoire
     if date < datetime.datetime.now():
-        ndate=date.strftime('%Y-%W') # numéro de la semaine de l'année
+        ndate=week_label_of(date) # numéro de la semaine de l'année (semaine ISO)
         
         # et si le numéro de semaine est différent
-        if ndate != datetime.datetime.now().strftime('%Y-%W'):
-            # on requête pour chercher le nombre d'entrée pour la semaine
-            r1 = requests.get(f'https://datavaccin-covid.ameli.fr/api/records/1.0/search/?dataset=donnees-de-vaccination-par-commune&q=&rows=10&refine.semaine_injection={ndate}')
-            
-            n = r1.json().get("nhits") # nombre de nouvelles entrées
-            
-            # on cherche l'ensemble des nouvelles entrées
-            r2 = requests.get(f'https://datavaccin-covid.ameli.fr/api/records/1.0/search/?dataset=donnees-de-vaccination-par-commune&q=&rows={n}&refine.semaine_injection={ndate}')
-
-            # on met à jour la base de donnée en mémoire
-            datas = r2.json().get("records")
-            for record in datas:
-                records.append(record)
-        
-        # on met à jour la base de donnée json
-        with open("donnees-de-vaccination-par-commune.json", "w") as f:
-            f.write(json.dumps(records, ensure_ascii=False))
+        if ndate != week_label_of(datetime.datetime.now()):
+            # téléchargement dans un processus séparé, ajout des nouvelles entrées
+            # puis réécriture de la base json
+            ajoutees, rejetees = refresh(app.config["DATASET_FILE"], ndate)
+            if rejetees:
+                print(f'Ingestion: {rejetees} invalid records skipped')
+        else:
+            # on met à jour la base de donnée json
+            sauvegarde()
         print('Data Base updated')
     
     # on sauvegarde en mémoire la date de la dernière mis à jour
     date = datetime.datetime.now()
 
 
+def sauvegarde():
+    """ Réécrit la base de donnée json dans un processus séparé """
+    save(app.config["DATASET_FILE"])
+
+
+# Fonction qui résume par mois les semaines plus anciennes que l'horizon de rétention
+@scheduler.task('interval', id='compaction', hours=24, misfire_grace_time=900)
+def compaction():
+    # pas de compaction pendant une ingestion: sa réécriture de la base json l'effacerait
+    with writer:
+        supprimees, ajoutees = compact(store, app.config["RETENTION_WEEKS"])
+        # semaines réchauffées depuis par une écriture (PUT, DELETE): rangées à nouveau sur disque
+        store.demote()
+        if supprimees:
+            sauvegarde()
+            print(f'Compaction: {supprimees} weekly records rolled into {ajoutees} monthly rows')
+
+
+# Fonction qui supprime les résultats expirés des tâches de fond
+@scheduler.task('interval', id='purge_jobs', minutes=10, misfire_grace_time=900)
+def purge_jobs():
+    jobs.purge()
+
+
 api.add_resource(DonneesCommune, '/api/vaccination/')
 api.add_resource(DonneeCommune, '/api/vaccination/<string:id>')
 api.add_resource(Commune, '/api/vaccination/commune')
 api.add_resource(CodeCommune, '/api/vaccination/commune/<string:code_commune>')
 api.add_resource(SemaineListe, '/api/vaccination/commune/<string:code_commune>/semaine')
+api.add_resource(SemaineIntervalle, '/api/vaccination/commune/<string:code_commune>/semaines')
+api.add_resource(Dernier, '/api/vaccination/commune/<string:code_commune>/dernier')
+api.add_resource(Variations, '/api/vaccination/commune/<string:code_commune>/variations')
 api.add_resource(Semaine, '/api/vaccination/commune/<string:code_commune>/semaine/<string:semaine>')
 api.add_resource(ClasseAgeList, '/api/vaccination/commune/<string:code_commune>/semaine/<string:semaine>/classe_age')
 api.add_resource(ClasseAge, '/api/vaccination/commune/<string:code_commune>/semaine/<string:semaine>/classe_age/<string:classe_age>')
+api.add_resource(QueryApi, '/api/vaccination/query')
+api.add_resource(ExportApi, '/api/vaccination/export')
+api.add_resource(BatchApi, '/api/vaccination/batch')
+api.add_resource(RankingApi, '/api/vaccination/ranking')
+api.add_resource(CubeApi, '/api/vaccination/cube')
+api.add_resource(DepartementListe, '/api/vaccination/departement')
+api.add_resource(Departement, '/api/vaccination/departement/<string:code_departement>')
+api.add_resource(Region, '/api/vaccination/region/<string:code_region>')
+api.add_resource(RechercheCommune, '/api/vaccination/recherche')
+api.add_resource(Snapshot, '/api/vaccination/snapshot')
+api.add_resource(ChangesApi, '/api/vaccination/changes')
+api.add_resource(EventsApi, '/api/vaccination/events')
+api.add_resource(JobsApi, '/api/vaccination/jobs')
+api.add_resource(JobApi, '/api/vaccination/jobs/<string:job_id>')
+api.add_resource(JobResultApi, '/api/vaccination/jobs/<string:job_id>/result')
+api.add_resource(CacheApi, '/api/vaccination/cache')
+api.add_resource(Health, '/health')
+api.add_resource(Ready, '/ready')
 api.add_resource(SignupApi, '/api/auth/signup')
 api.add_resource(LoginApi, '/api/auth/login')
 
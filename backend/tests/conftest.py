@@ -0,0 +1,15 @@
+import os
+import sys
+import pytest
+
+# les modules du backend s'importent depuis la racine du backend (database, resources)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def record():
+    """ Fabrique d'entrées du dataset: record(recordid, semaine, commune, classe_age, **autres champs) """
+    def make(recordid, semaine="2021-40", commune="01001", classe_age="00-19", **fields):
+        return {"recordid": recordid, "record_timestamp": "2022-03-11T10:30:35",
+                "fields": dict(fields, commune_residence=commune, semaine_injection=semaine, classe_age=classe_age)}
+    return make
@@ -0,0 +1,60 @@
+import threading
+import time
+import pytest
+from flask import Flask, Response
+from flask_restful import Api, Resource
+from database.loader import dataset_loader
+from resources.admission import admission, controller
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # dataset considéré comme chargé, une seule place "bulk"
+    monkeypatch.setattr(dataset_loader, "finished", time.time())
+    monkeypatch.setitem(controller.concurrency, "bulk", 1)
+    monkeypatch.setitem(controller.queue, "bulk", 0)
+    release = threading.Event()
+
+    class Flux(Resource):
+        method_decorators = [admission("bulk")]
+
+        def get(self):
+            def stream():
+                yield "a\n"
+                release.wait(5)
+                yield "b\n"
+            return Response(stream(), mimetype="text/csv")
+
+    class Liste(Resource):
+        method_decorators = [admission("bulk")]
+
+        def get(self):
+            return {"ok": True}
+
+    app = Flask(__name__)
+    api = Api(app)
+    api.add_resource(Flux, "/flux")
+    api.add_resource(Liste, "/liste")
+    client = app.test_client()
+    client.release = release
+    yield client
+    release.set()
+
+
+def test_streamed_response_holds_its_slot_until_closed(client):
+    response = client.get("/flux", buffered=False)
+    assert response.status_code == 200
+    assert next(response.response) == b"a\n"
+    # l'export est en cours d'envoi: la place est toujours occupée
+    assert controller.active["bulk"] == 1
+    assert client.get("/liste").status_code == 503
+    client.release.set()
+    assert b"".join(response.response) == b"b\n"
+    response.close()
+    assert controller.active["bulk"] == 0
+    assert client.get("/liste").status_code == 200
+
+
+def test_plain_response_releases_its_slot(client):
+    assert client.get("/liste").status_code == 200
+    assert controller.active["bulk"] == 0
@@ -0,0 +1,39 @@
+import types
+import pytest
+from resources.events import EventBroadcaster
+
+
+@pytest.fixture
+def broadcaster():
+    broadcaster = EventBroadcaster(history=4, keepalive=0.01)
+    broadcaster.store = types.SimpleNamespace(version=7)
+    for n in range(6):
+        broadcaster.publish("version", {"version": n})
+    return broadcaster
+
+
+def drain(client):
+    messages = []
+    while not client.empty():
+        messages.append(client.get_nowait())
+    return messages
+
+
+def test_resume_from_history(broadcaster):
+    messages = drain(broadcaster.connect(last_id=4))
+    assert [m.split(b"\n")[0] for m in messages] == [b"id: 5", b"id: 6"]
+
+
+@pytest.mark.parametrize("last_id", [1, 42])
+def test_lost_or_future_id_reloads(broadcaster, last_id):
+    # id sorti de l'historique, ou postérieur au dernier publié (serveur redémarré)
+    messages = drain(broadcaster.connect(last_id=last_id))
+    assert messages == [b'id: 6\nevent: reload\ndata: {"version":7}\n\n']
+
+
+def test_publish_reaches_every_client(broadcaster):
+    clients = [broadcaster.connect(), broadcaster.connect()]
+    broadcaster.disconnect(clients[1])
+    broadcaster.publish("semaine", {"semaine_injection": "2021-05"})
+    assert len(drain(clients[0])) == 1 and drain(clients[1]) == []
+    assert broadcaster.clients == 1
@@ -0,0 +1,68 @@
+import json
+import threading
+import time
+from database import ingest
+from database.changes import ChangeLog
+from database.cube import Cube
+from database.store import VaccinationStore
+from database.tiered import TieredRecords
+
+
+def test_refresh_adds_only_the_new_week(monkeypatch, tmp_path, record):
+    store = VaccinationStore()
+    change_log = ChangeLog()
+    change_log.attach(store)
+    store.load([record("old", "2022-34")])
+    events = []
+    store.subscribe(lambda event, record, old_fields: events.append(event))
+    monkeypatch.setattr(ingest, "store", store)
+    monkeypatch.setattr(ingest, "fetch_week", lambda semaine: [record("old", "2022-34")]
+                        + [record(f"new{n}", semaine) for n in range(3)])
+    since = time.time()
+    path = tmp_path / "dataset.json"
+
+    assert ingest.refresh(str(path), "2022-35") == (3, 0)
+    # une seule écriture: pas de rechargement, le journal garde les ajouts
+    assert events == ["add_many"]
+    changes, _ = change_log.since(since)
+    assert sorted(recordid for _, _, recordid, _ in changes) == ["new0", "new1", "new2"]
+    assert sorted(item["recordid"] for item in json.loads(path.read_text())) == ["new0", "new1", "new2", "old"]
+
+
+def test_refresh_is_never_seen_half_applied(monkeypatch, tmp_path, record):
+    store = VaccinationStore()
+    cube = Cube()
+    cube.attach(store)
+    store.load([record("old", "2022-34")])
+    monkeypatch.setattr(ingest, "store", store)
+    monkeypatch.setattr(ingest, "fetch_week", lambda semaine: [record(f"new{n}", semaine) for n in range(5000)])
+    seen = set()
+    done = threading.Event()
+
+    def reader():
+        while not done.is_set():
+            seen.add(len(store.week_range(start=202235, end=202235)))
+            cell = cube.cell("commune", "01001", "2022-35", "00-19")
+            seen.add(cell["nombre_entrees"] if cell else 0)
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    try:
+        ingest.refresh(str(tmp_path / "dataset.json"), "2022-35")
+    finally:
+        done.set()
+        thread.join()
+    assert seen <= {0, 5000}
+    assert len(store.week_range(start=202235, end=202235)) == 5000
+
+
+def test_refresh_demotes_weeks(monkeypatch, tmp_path, record):
+    store = VaccinationStore()
+    store.records = TieredRecords(str(tmp_path / "segments"), hot_weeks=1)
+    store.load([record("old", "2022-34")])
+    monkeypatch.setattr(ingest, "store", store)
+    monkeypatch.setattr(ingest, "fetch_week", lambda semaine: [record("new", semaine)])
+
+    assert ingest.refresh(str(tmp_path / "dataset.json"), "2022-35") == (1, 0)
+    assert sorted(store.records.segments) == [202234]
+    assert store.get("old") is not None and "new" in store.records.hot
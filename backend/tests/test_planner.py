@@ -0,0 +1,46 @@
+import pytest
+from werkzeug.datastructures import MultiDict
+from database import planner
+from database.planner import Predicate, parse_predicates, select
+
+RECORDS = [
+    {"recordid": "a", "fields": {"population_carto": 120, "classe_age": "65-74", "semaine_injection": "2021-40",
+                                 "date": "2021-10-04", "taux_cumu_1_inj": 0.5}},
+    {"recordid": "b", "fields": {"population_carto": None, "classe_age": "00-19", "semaine_injection": "2021-52"}},
+    {"recordid": "c", "fields": {"population_carto": "80", "semaine_injection": "2022-01", "date": "2022-01-03"}},
+]
+
+PREDICATES = [
+    Predicate("population_carto", "gt", 100.0),
+    Predicate("population_carto", "lte", 80.0),
+    Predicate("population_carto", "eq", 80.0),
+    Predicate("population_carto", "in", {80.0, 120.0}),
+    Predicate("classe_age", "eq", "65-74"),
+    Predicate("classe_age", "in", {"00-19", "TOUT_AGE"}),
+    Predicate("semaine_injection", "gte", "2021-52"),
+    Predicate("date", "lt", "2022-01-01"),
+    Predicate("recordid", "in", {"a", "c"}),
+    Predicate("taux_cumu_1_inj", "gte", 0.1),
+]
+
+
+@pytest.mark.parametrize("predicate", PREDICATES, ids=str)
+def test_batch_evaluation_matches_record_evaluation(predicate):
+    # valeurs manquantes comprises: une colonne évaluée d'un coup retient les mêmes entrées
+    expected = [record["recordid"] for record in RECORDS if predicate.matcher()(record)]
+    assert [record["recordid"] for record in select(RECORDS, [predicate])] == expected
+
+
+def test_select_without_numpy(monkeypatch):
+    monkeypatch.setattr(planner, "numpy", None)
+    predicates = [Predicate("population_carto", "gte", 80.0), Predicate("classe_age", "eq", "65-74")]
+    assert [record["recordid"] for record in select(RECORDS, predicates)] == ["a"]
+
+
+def test_week_equality_is_normalized():
+    predicates = parse_predicates(MultiDict([("semaine_injection", "2021-5"), ("classe_age", "65-74")]))
+    assert predicates[0].value == "2021-05"
+    predicates = parse_predicates(MultiDict([("semaine_injection__in", "2021-40,2022-1")]))
+    assert predicates[0].value == {"2021-40", "2022-01"}
+    with pytest.raises(ValueError):
+        parse_predicates(MultiDict([("semaine_injection", "2021-99")]))
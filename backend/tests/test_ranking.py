@@ -0,0 +1,12 @@
+from database.store import VaccinationStore
+from database.ranking import RankingIndex
+
+
+def test_ordering_ranks_each_commune_once(record):
+    store = VaccinationStore()
+    store.load([record("a", classe_age="TOUT_AGE", taux_cumu_termine=0.5), record("b", taux_cumu_termine=0.1),
+                record("c", commune="01002", classe_age="TOUT_AGE", taux_cumu_termine=0.7),
+                record("d", commune="01002", taux_cumu_termine=0.2)])
+    rankings = RankingIndex(store)
+    assert rankings.ordering("2021-40").recordids == ["a", "c"]
+    assert rankings.ordering("2021-40", "00-19").recordids == ["b", "d"]
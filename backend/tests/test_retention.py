@@ -0,0 +1,54 @@
+import pytest
+from database.retention import compact, monthly_recordid
+from database.store import VaccinationStore
+from database.tiered import TieredRecords
+
+
+@pytest.fixture
+def weeks(record):
+    """ Une commune, une classe d'age, semaines 2021-01 à 2021-20 aux compteurs cumulés """
+    return [record(f"w{week}", f"2021-{week:02d}", effectif_cumu_1_inj=week) for week in range(1, 21)]
+
+
+def monthly_rows(store):
+    return {record["fields"]["mois"]: record for record in store.week_range("01001")
+            if record["fields"].get("granularite") == "mois"}
+
+
+def test_compact_is_idempotent(weeks):
+    store = VaccinationStore()
+    store.load(weeks)
+    # horizon de 4 semaines: janvier (S01-S04), février (S05-S08) et mars (S09-S12) sont résumés
+    assert compact(store, 4, timestamp="2021-05-24T00:00:00") == (12, 3)
+    rows = monthly_rows(store)
+    assert sorted(rows) == ["2021-01", "2021-02", "2021-03"]
+    assert rows["2021-01"]["fields"]["semaine_injection"] == "2021-04"
+    assert rows["2021-01"]["fields"]["effectif_cumu_1_inj"] == 4
+    assert rows["2021-01"]["fields"]["nombre_semaines"] == 4
+    assert len(store) == 11
+    assert compact(store, 4) == (0, 0)
+    assert monthly_rows(store) == rows and len(store) == 11
+
+
+def test_late_week_merges_into_monthly_row(weeks, record):
+    store = VaccinationStore()
+    store.load(weeks)
+    compact(store, 4)
+    store.add(record("late", "2021-02", effectif_cumu_1_inj=2))
+    # la ligne mensuelle existante et la semaine arrivée en retard sont réécrites en une seule ligne
+    assert compact(store, 4) == (2, 1)
+    row = monthly_rows(store)["2021-01"]
+    assert row["recordid"] == monthly_recordid("01001", "00-19", "2021-01")
+    assert row["fields"]["nombre_semaines"] == 5
+    assert row["fields"]["effectif_cumu_1_inj"] == 4
+    assert [record["recordid"] for record in store.week_range("01001", 202101, 202104)] == [row["recordid"]]
+
+
+def test_compact_refreezes_cold_weeks(weeks, tmp_path):
+    store = VaccinationStore()
+    store.records = TieredRecords(str(tmp_path), hot_weeks=4)
+    store.load(weeks)
+    compact(store, 4)
+    # les semaines réchauffées pour être résumées retournent sur disque
+    assert all(key in store.records.segments for key in store.week_keys[:-4])
+    assert sorted(store.records.hot) == [f"w{week}" for week in range(17, 21)]
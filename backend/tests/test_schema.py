@@ -0,0 +1,16 @@
+import pytest
+from database.schema import record_schema
+
+
+def test_ingest_keeps_unknown_fields():
+    rejected = []
+    source = [{"recordid": "a", "fields": {"population_carto": "12", "taux_1_inj": 0.5}},
+              {"recordid": "b", "fields": {"semaine_injection": "semaine 5"}}]
+    records = list(record_schema.coerce_all(source, rejected))
+    assert records == [{"recordid": "a", "fields": {"population_carto": 12, "taux_1_inj": 0.5}}]
+    assert [record["recordid"] for record, _ in rejected] == ["b"]
+
+
+def test_request_body_rejects_unknown_fields():
+    with pytest.raises(ValueError, match="unknown field 'taux_1_inj'"):
+        record_schema.fields({"taux_1_inj": 0.5})
@@ -0,0 +1,72 @@
+import threading
+from database.cube import Cube
+from database.store import VaccinationStore
+
+
+def test_generations_reset_after_load_listeners(record):
+    store = VaccinationStore()
+    cube = Cube()
+    cube.attach(store)
+    store.load([record("a", effectif_cumu_1_inj=3)])
+    seen = []
+    # une réponse calculée pendant la reconstruction doit rester sous l'ancienne génération
+    store.subscribe(lambda event, record, old_fields: seen.append(store.generation()))
+    before = store.generation()
+    store.load([record("a", effectif_cumu_1_inj=3), record("b", effectif_cumu_1_inj=9)])
+    assert seen == [before]
+    assert store.generation() > before
+    assert cube.cell("commune", "01001", "2021-40", "00-19")["nombre_entrees"] == 2
+
+
+def hammer(store, record, read):
+    """ Appelle `read` pendant qu'un autre thread ajoute et supprime des entrées, retourne les erreurs """
+    stop = threading.Event()
+    errors = []
+
+    def writer():
+        n = 0
+        while not stop.is_set():
+            store.add(record(f"x{n}", f"2021-{40 + n % 5}", effectif_cumu_1_inj=1))
+            store.delete(f"x{n}")
+            n += 1
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for _ in range(2000):
+            try:
+                if any(found is None for found in read()):
+                    errors.append("None")
+            except Exception as error:
+                errors.append(repr(error))
+    finally:
+        stop.set()
+        thread.join()
+    return errors
+
+
+def test_lookup_during_deletes(record):
+    store = VaccinationStore()
+    store.load([record(f"a{n}", effectif_cumu_1_inj=n) for n in range(50)])
+    assert hammer(store, record, lambda: store.lookup("commune_residence", "01001")) == []
+
+
+def test_week_range_during_writes(record):
+    store = VaccinationStore()
+    store.load([record(f"a{n}", f"2021-{40 + n % 10}", effectif_cumu_1_inj=n) for n in range(50)])
+    assert hammer(store, record, lambda: store.week_range("01001", 202140, 202149)) == []
+    assert hammer(store, record, lambda: store.week_range(None, 202140, 202149)) == []
+
+
+def test_add_many_matches_add(record):
+    stores, cubes = [VaccinationStore(), VaccinationStore()], [Cube(), Cube()]
+    for store, cube in zip(stores, cubes):
+        cube.attach(store)
+        store.load([record("a", effectif_cumu_1_inj=3)])
+    records = [record("a", "2021-41", effectif_cumu_1_inj=5)] \
+        + [record(f"b{n}", "2021-41", f"0100{n % 3}", effectif_cumu_1_inj=n) for n in range(9)]
+    for added in records:
+        stores[0].add(added)
+    assert [added["recordid"] for added in stores[1].add_many(records)] == [f"b{n}" for n in range(9)]
+    assert stores[0].weeks == stores[1].weeks and stores[0].indexes == stores[1].indexes
+    assert cubes[0].cells == cubes[1].cells
@@ -0,0 +1,48 @@
+from database.store import VaccinationStore
+from database.tiered import TieredRecords
+
+
+def test_iter_values_survives_thaw(tmp_path, record):
+    records = TieredRecords(str(tmp_path), hot_weeks=1)
+    for n, week in enumerate((202140, 202141, 202142)):
+        records[f"r{n}"] = record(f"r{n}", f"{week // 100}-{week % 100}")
+        records.freeze(week, [f"r{n}"])
+    values = records.iter_values()
+    first = next(values)
+    # le parcours commencé garde les segments relevés, même réchauffés entre-temps
+    records.thaw(202141)
+    records.thaw(202142)
+    assert [first["recordid"]] + [value["recordid"] for value in values] == ["r0", "r1", "r2"]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["202140-1.seg"]
+
+
+def test_load_demotes_while_reading(tmp_path, record):
+    store = VaccinationStore()
+    store.records = TieredRecords(str(tmp_path), hot_weeks=2)
+    hot_sizes = []
+
+    def source():
+        for week in range(40, 46):
+            for n in range(3):
+                hot_sizes.append(len(store.records.hot))
+                yield record(f"{week}-{n}", f"2021-{week}")
+        # entrée d'une semaine déjà rangée sur disque
+        yield record("40-late", "2021-40")
+
+    store.load(source())
+    assert max(hot_sizes) <= 3 * 3
+    assert len(store) == 19 and store.get("40-late") is not None
+    assert sorted(store.records.segments) == [202140, 202141, 202142, 202143]
+    assert store.records.segments[202140].count == 4
+
+
+def test_lookup_reads_only_the_record_week(tmp_path, record):
+    store = VaccinationStore()
+    store.records = TieredRecords(str(tmp_path), hot_weeks=1)
+    store.load([record(f"{week}-{n}", f"2021-{week}") for week in range(40, 45) for n in range(3)])
+    probes = []
+    for week, segment in store.records.segments.items():
+        segment.bloom.might_contain = lambda hashes, week=week: probes.append(week) or True
+    # chaque entrée froide n'interroge que le filtre de Bloom de sa semaine
+    assert len(store.lookup("commune_residence", "01001")) == 15
+    assert sorted(probes) == sorted(week for week in store.records.segments for _ in range(3))
@@ -1,11 +1,36 @@
 from flask import Flask, render_template, request
 import requests, json
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 #URL_backend = "http://dataviewer.api.localhost:8000/apidocs/"
 URL_backend = "http://dataviewer.api.localhost:5000/"
+# format demandé au backend: MessagePack (binaire, plus compact) si disponible, sinon JSON
+FORMAT_backend = "application/msgpack" if msgpack is not None else "application/json"
 
 app = Flask(__name__)
 
+
+def entetes(token):
+    """ En-têtes des requêtes vers le backend: token d'identification et format voulu """
+    return {'Authorization': 'TOK:'+token, 'Accept': FORMAT_backend}
+
+
+def decode(r):
+    """ Décode la réponse du backend suivant son type de contenu """
+    if msgpack is not None and r.headers.get('Content-Type', '').startswith('application/msgpack'):
+        return msgpack.unpackb(r.content, raw=False)
+    return json.loads(r.text)
+
+
+def champs(formulaire):
+    """ Corps envoyé au backend: les champs remplis, sans le token (le backend refuse les champs inconnus) """
+    return {key: value for key, value in formulaire.items() if key != 'token' and value != ""}
+
+
 @app.route('/')
 def index():
    return render_template('index.html')
@@ -33,8 +58,8 @@ def formulaire():
                 "taux_cumu_termine": 0, #float
                 "taux_termine": 0}#float"""
          # on fait la requête sur le backend
-        r = requests.post(URL_backend+'vaccination/',headers={'Authorization': 'TOK:'+token}, json=formulaire)
-        data = json.loads(r.text) # le json renvoyé devient un dictionnaire
+        r = requests.post(URL_backend+'vaccination/',headers=entetes(token), json=champs(formulaire))
+        data = decode(r) # le json renvoyé devient un dictionnaire
         return render_template("result.html",result = data)
     
     elif request.method == 'PUT':
@@ -63,9 +88,9 @@ def formulaire():
             if value != "" or value != 0:
                 modifications[key] = value
         # on fait la requête sur le backend
-        r = requests.put(URL_backend+'vaccination/'+id,headers={'Authorization': 'TOK:'+token}, json=formulaire)
+        r = requests.put(URL_backend+'vaccination/'+id,headers=entetes(token), json=champs(formulaire))
         # récupération des données du backend
-        data = json.loads(r.text)#le json renvoyé devient un dictionnaire
+        data = decode(r)#le json renvoyé devient un dictionnaire
         return render_template("result.html",result = modifications)
     
     elif request.method == 'DELETE':
@@ -75,9 +100,9 @@ def formulaire():
             {   "token": "" 
                 "recordid": "" }"""
         # on fait la requête sur le backend
-        r = requests.post(URL_backend+'vaccination/'+id,headers={'Authorization': 'TOK:'+token})
+        r = requests.post(URL_backend+'vaccination/'+id,headers=entetes(token))
         # récupération des données du backend
-        data = json.loads(r.text) # le json renvoyé devient un dictionnaire
+        data = decode(r) # le json renvoyé devient un dictionnaire
         return render_template("result.html",result = data)
     
     elif request.method == 'GET':
@@ -91,29 +116,34 @@ def formulaire():
                 "classe_age": "", }
             ou de cette forme:    
                 {   "token": "" 
-                    "recordid": ""}"""
+                    "recordid": ""} (plusieurs recordid séparés par des virgules: une seule requête)"""
         
-        if "recordid" in formulaire.keys():
+        if "recordid" in formulaire.keys() and "," in formulaire["recordid"]:
+            lookups = [{"recordid": id.strip()} for id in formulaire["recordid"].split(",") if id.strip()]
+            r = requests.post(URL_backend+'vaccination/batch',headers=entetes(token), json={"lookups": lookups})
+            return render_template("result.html",result = decode(r)["records"])
+
+        elif "recordid" in formulaire.keys():
             id = formulaire["recordid"]
-            r = requests.get(URL_backend+'vaccination/'+id,headers={'Authorization': 'TOK:'+token}, json=formulaire)
+            r = requests.get(URL_backend+'vaccination/'+id,headers=entetes(token), json=formulaire)
         
         elif formulaire["commune_residence"] != "" and formulaire["semaine_injection"] != "" and formulaire["classe_age"] != "":
             code_commune = formulaire["commune_residence"]
             semaine = formulaire["semaine_injection"]
             age = formulaire["classe_age"]
-            r = requests.get(URL_backend+'vaccination/commune/'+code_commune+"/semaine/"+semaine+"/classe_age/"+age,headers={'Authorization': 'TOK:'+token}, json=formulaire)
+            r = requests.get(URL_backend+'vaccination/commune/'+code_commune+"/semaine/"+semaine+"/classe_age/"+age,headers=entetes(token), json=formulaire)
         
         elif formulaire["commune_residence"] != "" and formulaire["semaine_injection"] == "" and formulaire["classe_age"] == "":
             code_commune = formulaire["commune_residence"]
             semaine = formulaire["semaine_injection"]
-            r = requests.get(URL_backend+'vaccination/commune/'+code_commune+"/semaine/"+semaine,headers={'Authorization': 'TOK:'+token}, json=formulaire)
+            r = requests.get(URL_backend+'vaccination/commune/'+code_commune+"/semaine/"+semaine,headers=entetes(token), json=formulaire)
         
         elif formulaire["commune_residence"] == "" and formulaire["semaine_injection"] == "" and formulaire["classe_age"] == "":
             code_commune = formulaire["commune_residence"]
-            r = requests.get(URL_backend+'vaccination/commune/'+code_commune,headers={'Authorization': 'TOK:'+token}, json=formulaire)
+            r = requests.get(URL_backend+'vaccination/commune/'+code_commune,headers=entetes(token), json=formulaire)
         
         # récupération des données du backend
-        data = json.loads(r.text) # le json renvoyé devient un dictionnaire
+        data = decode(r) # le json renvoyé devient un dictionnaire
         return render_template("result.html",result = data)
 
 